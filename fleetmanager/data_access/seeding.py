@@ -2,9 +2,9 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 import random
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import delete, insert, select
+from sqlalchemy import delete, insert, or_, select
 from sqlalchemy.orm import sessionmaker
 
 from fleetmanager.data_access.dbschema import (
@@ -18,6 +18,9 @@ from fleetmanager.data_access.dbschema import (
     vehicle_type_to_fuel,
 )
 
+if TYPE_CHECKING:
+    from fleetmanager.model.trip_generator import SyntheticTrips
+
 # calibrated to real fleet data: median ~7.4 km / 52 min ≈ 0.14 km/min for cars.
 _BASE_SPEED = {1: 0.12, 2: 0.20, 3: 0.30, 4: 0.25}
 
@@ -279,6 +282,49 @@ def seed_dynamic_roundtrips_and_segments(
         s.commit()
 
 
+def cars_by_location(engine) -> dict[int, list[int]]:
+    """The ids of the cars that are not deleted at each location, to generate synthetic trips for"""
+    Session = sessionmaker(bind=engine)
+
+    with Session() as s:
+        cars = s.execute(
+            select(Cars.location, Cars.id)
+            .where(
+                Cars.location.is_not(None),
+                or_(Cars.deleted.is_(None), ~Cars.deleted),
+            )
+            .order_by(Cars.location.asc(), Cars.id.asc())
+        ).all()
+
+    locations = {}
+    for location_id, car_id in cars:
+        locations.setdefault(location_id, []).append(car_id)
+    return locations
+
+
+def seed_synthetic_roundtrips(
+    engine,
+    trips: SyntheticTrips,
+    *,
+    batch_size: int = 10000,
+) -> None:
+    """
+    Bulk loads the roundtrips and segments of generate_synthetic_trips, batch_size roundtrips pr. transaction.
+    The roundtrips are seeded with the aggregation_type "synthetic".
+    """
+    # imported here since the aggregator is not needed to seed the defaults on startup
+    from fleetmanager.model.roundtripaggregator import insert_roundtrips
+
+    Session = sessionmaker(bind=engine)
+
+    for batch_start in range(0, len(trips), batch_size):
+        with Session.begin() as s:
+            insert_roundtrips(
+                s,
+                trips.to_frame(batch_start, batch_start + batch_size).to_dict("records"),
+            )
+
+
 def seed_db(engine):
     seed_allowed_starts(engine)
     seed_cars(engine)
@@ -5,6 +5,7 @@ import pickle
 from datetime import datetime, timedelta
 
 import click
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine, func, or_, select, update
 from sqlalchemy.orm import sessionmaker
@@ -25,13 +26,9 @@ from fleetmanager.extractors.skyhost.updatedb import (
     summer_times,
     winter_times,
 )
+from fleetmanager.extractors.util import aggregate_roundtrips
 from fleetmanager.logging import logging
-from fleetmanager.model.roundtripaggregator import aggregating_score as score
-from fleetmanager.model.roundtripaggregator import (
-    aggregator,
-    calc_distance,
-    process_car_roundtrips,
-)
+from fleetmanager.model.roundtripaggregator import haversine_distance
 
 
 logger = logging.getLogger(__name__)
@@ -210,59 +207,37 @@ def set_roundtrips(ctx):
     all_trips = all_trips[~all_trips.id.isin(all_visited_ids)].copy()
     logger.info(f"len of all trips after patching {len(all_trips)}")
 
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-
-    for car in cars.itertuples():
-        car: CarObject = car
-        car_trips = all_trips[
-            (all_trips.plate == car.plate) & (all_trips.start_time > car.max_date)
-        ]
+    def fetch_car_trips():
+        for car in cars.itertuples():
+            car: CarObject = car
+            car_trips = all_trips[
+                (all_trips.plate == car.plate) & (all_trips.start_time > car.max_date)
+            ]
 
-        if len(car_trips) == 0:
-            continue
+            if len(car_trips) == 0:
+                continue
 
-        car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
-        car_trips["distance"] = car_trips.apply(
-            lambda trip: (
-                trip.distance
-                if trip.distance != 0
-                else calc_distance(
-                    (trip.start_latitude, trip.start_longitude),
-                    (trip.end_latitude, trip.end_longitude),
-                )
-            ),
-            axis=1,
-        )
-        (
-            usage_count,
-            possible_count,
-            usage_distance,
-            possible_distance,
-            used_ids,
-        ) = process_car_roundtrips(
-            car,
-            car_trips,
-            allowed_starts,
-            aggregator,
-            score,
-            session,
-            is_session_maker=False,
-            return_ids=True,
-            save=True,
-        )
-        collected_route_count += usage_count
-        collected_trip_count += possible_count
-        collected_route_length += usage_distance
-        collected_trip_length += possible_distance
-
-        if usage_count > 0:
-            # continue
-            patched_ids = write_tripid_file(
-                patched_ids, trip_id_storage, used_ids, car.id
+            car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
+            # trips without a recorded distance get the bird flight distance
+            car_trips["distance"] = np.where(
+                car_trips.distance != 0,
+                car_trips.distance,
+                haversine_distance(
+                    car_trips.start_latitude,
+                    car_trips.start_longitude,
+                    car_trips.end_latitude,
+                    car_trips.end_longitude,
+                ),
             )
+            yield car, car_trips
+
+    def save_trip_ids(car, used_ids):
+        if used_ids:
+            write_tripid_file(patched_ids, trip_id_storage, used_ids, car.id)
+
+    aggregate_roundtrips(
+        fetch_car_trips(), allowed_starts, ctx.obj["Session"], on_saved=save_trip_ids
+    )
 
 
 @cli.command()
@@ -27,6 +27,7 @@ from fleetmanager.data_access import (
 )
 from fleetmanager.data_access.dbschema import RoundTripSegments
 from fleetmanager.extractors.util import (
+    aggregate_roundtrips,
     apply_dmr_data,
     get_allowed_starts_with_additions,
     get_plate_info_from_api,
@@ -240,10 +241,6 @@ def set_roundtrips(ctx):
         # getting the starts to find out where we can drive from
         allowed_starts = get_allowed_starts_with_additions(session=session)
 
-        collected_trip_length = 0
-        collected_trip_count = 0
-        collected_route_length = 0
-        collected_route_count = 0
         cars = pd.read_sql(
             Query(Cars).filter(Cars.omkostning_aar.isnot(None)).statement, engine
         )
@@ -254,52 +251,27 @@ def set_roundtrips(ctx):
             .all()
         )
 
-        for car in cars.itertuples():
-            if car.id in banned_cars or pd.isna(car.location):
-                continue
-            max_date = session.scalar(
-                select(func.max(RoundTrips.end_time).label("max"))
-                .select_from(RoundTrips)
-                .filter(RoundTrips.car_id == car.id)
-            )
-            current_trips = get_trips(
-                car.id,
-                ctx.obj["url"],
-                from_date=max_date,
-                start_location=car.location,
-                params=ctx.obj["params"],
-            )
-            if len(current_trips) == 0:
-                continue
-            car_trips = pd.DataFrame(current_trips)
-            (
-                usage_count,
-                possible_count,
-                usage_distance,
-                possible_distance,
-            ) = process_car_roundtrips(
-                car,
-                car_trips,
-                allowed_starts,
-                aggregator,
-                score,
-                session_maker,
-                is_session_maker=True,
-            )
-            collected_route_count += usage_count
-            collected_trip_count += possible_count
-            collected_route_length += usage_distance
-            collected_trip_length += possible_distance
-
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count/max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
-    )
+        def fetch_car_trips():
+            for car in cars.itertuples():
+                if car.id in banned_cars or pd.isna(car.location):
+                    continue
+                max_date = session.scalar(
+                    select(func.max(RoundTrips.end_time).label("max"))
+                    .select_from(RoundTrips)
+                    .filter(RoundTrips.car_id == car.id)
+                )
+                current_trips = get_trips(
+                    car.id,
+                    ctx.obj["url"],
+                    from_date=max_date,
+                    start_location=car.location,
+                    params=ctx.obj["params"],
+                )
+                if len(current_trips) == 0:
+                    continue
+                yield car, pd.DataFrame(current_trips)
+
+        aggregate_roundtrips(fetch_car_trips(), allowed_starts, session_maker)
 
 
 @cli.command()
@@ -19,10 +19,11 @@ from fleetmanager.data_access import (
     RoundTripSegments,
     SimulationSettings
 )
-from fleetmanager.extractors.mileagebook.updatedb import CarModel
 from fleetmanager.extractors.skyhost.updatedb import summer_times, winter_times
 
 from fleetmanager.extractors.util import (
+    CarModel,
+    aggregate_roundtrips,
     extract_plate,
     get_allowed_starts_with_additions,
     get_plate_info_from_api,
@@ -278,11 +279,6 @@ def set_roundtrips(ctx):
 
     allowed_starts = get_allowed_starts_with_additions(sess)
 
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-
     now = datetime.now()
 
     load_record_path = os.getenv("LOAD_RECORD_PATH", "load_record.json")
@@ -293,66 +289,43 @@ def set_roundtrips(ctx):
         logger.info("Initiating a new load record")
         load_record = {}
 
-    for car_id, car_location, last_date in query_vehicles:
-        if int(car_id) not in vehicle_ids:
-            continue
-        if pd.isna(car_location):
-            # no associated location
-            continue
+    def fetch_car_trips():
+        for car_id, car_location, last_date in query_vehicles:
+            if int(car_id) not in vehicle_ids:
+                continue
+            if pd.isna(car_location):
+                # no associated location
+                continue
 
-        if last_date == max_date and load_record and str(car_id) in load_record:
-            last_date = datetime.fromisoformat(load_record.get(str(car_id))) if str(car_id) in load_record else now
-            last_date -= relativedelta(
-                weeks=2
-            )
-            # mechanism to avoid loading old data that does not yield roundtrips
-        elif last_date != max_date:
-            last_date = max(last_date, now - relativedelta(weeks=4))
+            if last_date == max_date and load_record and str(car_id) in load_record:
+                last_date = datetime.fromisoformat(load_record.get(str(car_id))) if str(car_id) in load_record else now
+                last_date -= relativedelta(
+                    weeks=2
+                )
+                # mechanism to avoid loading old data that does not yield roundtrips
+            elif last_date != max_date:
+                last_date = max(last_date, now - relativedelta(weeks=4))
 
-        logger.info(f"Updating car: {car_id}, last seen: {last_date}")
+            logger.info(f"Updating car: {car_id}, last seen: {last_date}")
 
-        car_trips = get_logs(vehicle_id=car_id, from_date=last_date, to_date=now, url=url, params=params)
-        if len(car_trips) == 0:
-            continue
+            car_trips = get_logs(vehicle_id=car_id, from_date=last_date, to_date=now, url=url, params=params)
+            if len(car_trips) == 0:
+                continue
 
-        car_trips = format_trip_logs(car_trips, car_id)
+            car_trips = format_trip_logs(car_trips, car_id)
 
-        if len(car_trips) == 0:
-            continue
-
-        # sanitise trips, don't adjust for utc - they're recorded in local time
-        car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
+            if len(car_trips) == 0:
+                continue
 
-        (
-            usage_count,
-            possible_count,
-            usage_distance,
-            possible_distance,
-        ) = process_car_roundtrips(
-            CarModel(car_id, car_location),
-            car_trips,
-            allowed_starts,
-            aggregator,
-            score,
-            sess,
-            is_session_maker=False,
-            save=True,
-        )
-        collected_route_count += usage_count
-        collected_trip_count += possible_count
-        collected_route_length += usage_distance
-        collected_trip_length += possible_distance
+            # sanitise trips, don't adjust for utc - they're recorded in local time
+            car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
+            yield CarModel(car_id, car_location), car_trips
 
-        load_record[str(car_id)] = now.strftime("%Y-%m-%d")
+    def record_loaded(car, used_ids):
+        load_record[str(car.id)] = now.strftime("%Y-%m-%d")
 
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count/max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
+    aggregate_roundtrips(
+        fetch_car_trips(), allowed_starts, ctx.obj["Session"], on_saved=record_loaded
     )
 
     json.dump(load_record, open(load_record_path, "w"))
@@ -26,7 +26,13 @@ from fleetmanager.extractors.skyhost.updatedb import (
     summer_times,
     winter_times,
 )
-from fleetmanager.extractors.util import get_allowed_starts_with_additions, get_latlon_address, save_vehicle
+from fleetmanager.extractors.util import (
+    CarModel,
+    aggregate_roundtrips,
+    get_allowed_starts_with_additions,
+    get_latlon_address,
+    save_vehicle,
+)
 from fleetmanager.logging import logging
 from fleetmanager.model.roundtripaggregator import aggregating_score as score
 from fleetmanager.model.roundtripaggregator import (
@@ -70,12 +76,6 @@ class MileageBookMappings:
     }
 
 
-@dataclass
-class CarModel:
-    id: str
-    location: int
-
-
 @click.group()
 @click.option("-db", "--db-name", envvar="DB_NAME", required=True)
 @click.option("-pw", "--password", envvar="DB_PASSWORD", required=True)
@@ -330,53 +330,23 @@ def set_roundtrips(ctx):
 
     allowed_starts = get_allowed_starts_with_additions(session=sess)
 
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-
-    for car_id, car_location, last_date in query_vehicles:
-        if pd.isna(car_location):
-            # no associated location
-            continue
-        logger.info(f"{car_id}, {last_date}")
-        trips_since_last_roundtrip = get_logs(car_id, last_date, url, headers)
-        car_trips = format_trip_logs(
-            trips_since_last_roundtrip, start_location_id=car_location
-        )
-        if len(car_trips) == 0:
-            continue
+    def fetch_car_trips():
+        for car_id, car_location, last_date in query_vehicles:
+            if pd.isna(car_location):
+                # no associated location
+                continue
+            logger.info(f"{car_id}, {last_date}")
+            trips_since_last_roundtrip = get_logs(car_id, last_date, url, headers)
+            car_trips = format_trip_logs(
+                trips_since_last_roundtrip, start_location_id=car_location
+            )
+            if len(car_trips) == 0:
+                continue
 
-        car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
+            car_trips = sanitise_for_overlaps(car_trips, summer_times, winter_times)
+            yield CarModel(car_id, car_location), car_trips
 
-        (
-            usage_count,
-            possible_count,
-            usage_distance,
-            possible_distance,
-        ) = process_car_roundtrips(
-            CarModel(car_id, car_location),
-            car_trips,
-            allowed_starts,
-            aggregator,
-            score,
-            sess,
-            is_session_maker=False,
-            save=True,
-        )
-        collected_route_count += usage_count
-        collected_trip_count += possible_count
-        collected_route_length += usage_distance
-        collected_trip_length += possible_distance
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count/max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
-    )
+    aggregate_roundtrips(fetch_car_trips(), allowed_starts, ctx.obj["Session"])
 
 
 @cli.command()
@@ -27,6 +27,7 @@ from fleetmanager.extractors.skyhost.updatedb import (
     winter_times,
 )
 from fleetmanager.extractors.util import (
+    aggregate_roundtrips,
     extract_plate,
     get_allowed_starts_with_additions,
     get_latlon_address,
@@ -238,11 +239,6 @@ def set_roundtrips(ctx):
 
     now = datetime.now()
 
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-
     only_natural = json.loads(os.getenv("ONLY_NATURAL", "false"))
     load_record_path = os.getenv("LOAD_RECORD_PATH", "load_record.json")
     if os.path.exists(load_record_path):
@@ -252,113 +248,94 @@ def set_roundtrips(ctx):
         logger.info("Initiating a new load record")
         load_record = {}
 
-    for car in cars.itertuples():
-        car: Cars = car
-        s = time.time()
-        logger.info(f"Start vehicle: {car.id}")
+    # cars without trips are recorded as loaded after the run, aggregated cars once they are saved
+    without_trips = []
 
-        max_date = session.scalar(
-            select(func.max(RoundTrips.end_time).label("max"))
-            .select_from(RoundTrips)
-            .filter(RoundTrips.car_id == car.id)
-        )
+    def fetch_car_trips():
+        for car in cars.itertuples():
+            car: Cars = car
+            s = time.time()
+            logger.info(f"Start vehicle: {car.id}")
 
-        if max_date is None and load_record and str(car.id) in load_record:
-            max_date = datetime.fromisoformat(load_record.get((str(car.id)))) if car.id in load_record else datetime.now()
-            max_date -= relativedelta(
-                weeks=2
+            max_date = session.scalar(
+                select(func.max(RoundTrips.end_time).label("max"))
+                .select_from(RoundTrips)
+                .filter(RoundTrips.car_id == car.id)
             )
-        elif max_date is not None:
-            max_date = max(max_date, now - relativedelta(weeks=4))
-        elif max_date is None:
-            max_date = datetime.fromisoformat(os.getenv("MAX_DATE", "2023-01-01"))
-
-        # we need to take the plate to find the materielid
-        materiel = (
-            puma_session.query(Materiels)
-            .where(Materiels.registreringsnummer == car.plate)
-            .first()
-        )
-        if not materiel:
-            logger.info(f"could not find vehicle: {car.id}, {car.plate}")
-            continue
-
-        logs = []
-        for start, end in date_iter(max_date, now, week_period=1):
-            logger.info(f"{start} - {end}: {len(logs)}")
-            query_results = puma_session.query(
-                Data.materielid,
-                Data.timestamp,
-                Data.ignition,
-                Data.coords
-            ).filter(Data.materielid == materiel.id, Data.timestamp > start, Data.timestamp < end)
-            for result in query_results:
-                materielid, timestamp, ignition, coords = result
-                if coords:
-                    shape = to_shape(coords)
-                    latitude, longitude = shape.y, shape.x
-                else:
-                    latitude, longitude = None, None
-
-                logs.append({
-                    "id": materielid,
-                    "timestamp": timestamp,
-                    "ignition": ignition,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                })
-
-        if len(logs) == 0:
-            load_record[str(car.id)] = now.strftime("%Y-%m-%d")
-            continue
-
-        a_to_b_trips = logs_to_trips(pd.DataFrame(logs))
 
-        if len(a_to_b_trips) == 0:
-            load_record[str(car.id)] = now.strftime("%Y-%m-%d")
-            continue
+            if max_date is None and load_record and str(car.id) in load_record:
+                max_date = datetime.fromisoformat(load_record.get((str(car.id)))) if car.id in load_record else datetime.now()
+                max_date -= relativedelta(
+                    weeks=2
+                )
+            elif max_date is not None:
+                max_date = max(max_date, now - relativedelta(weeks=4))
+            elif max_date is None:
+                max_date = datetime.fromisoformat(os.getenv("MAX_DATE", "2023-01-01"))
+
+            # we need to take the plate to find the materielid
+            materiel = (
+                puma_session.query(Materiels)
+                .where(Materiels.registreringsnummer == car.plate)
+                .first()
+            )
+            if not materiel:
+                logger.info(f"could not find vehicle: {car.id}, {car.plate}")
+                continue
 
-        trips = sanitise_for_overlaps(a_to_b_trips, summer_times, winter_times)
+            logs = []
+            for start, end in date_iter(max_date, now, week_period=1):
+                logger.info(f"{start} - {end}: {len(logs)}")
+                query_results = puma_session.query(
+                    Data.materielid,
+                    Data.timestamp,
+                    Data.ignition,
+                    Data.coords
+                ).filter(Data.materielid == materiel.id, Data.timestamp > start, Data.timestamp < end)
+                for result in query_results:
+                    materielid, timestamp, ignition, coords = result
+                    if coords:
+                        shape = to_shape(coords)
+                        latitude, longitude = shape.y, shape.x
+                    else:
+                        latitude, longitude = None, None
+
+                    logs.append({
+                        "id": materielid,
+                        "timestamp": timestamp,
+                        "ignition": ignition,
+                        "latitude": latitude,
+                        "longitude": longitude,
+                    })
+
+            if len(logs) == 0:
+                without_trips.append(car.id)
+                continue
 
-        if len(trips) <= 1:
-            load_record[str(car.id)] = now.strftime("%Y-%m-%d")
-            continue
+            a_to_b_trips = logs_to_trips(pd.DataFrame(logs))
 
-        trips["start_time"] = trips.start_time.apply(fix_time)
-        trips["end_time"] = trips.end_time.apply(fix_time)
+            if len(a_to_b_trips) == 0:
+                without_trips.append(car.id)
+                continue
 
+            trips = sanitise_for_overlaps(a_to_b_trips, summer_times, winter_times)
 
-        (
-            usage_count,
-            possible_count,
-            usage_distance,
-            possible_distance
-        ) = process_car_roundtrips(
-            car,
-            trips,
-            allowed_starts,
-            aggregator,
-            score,
-            session,
-            is_session_maker=False
-        )
+            if len(trips) <= 1:
+                without_trips.append(car.id)
+                continue
 
-        collected_route_length += usage_distance
-        collected_trip_length += possible_distance
-        collected_trip_count += possible_count
-        collected_route_count += usage_count
+            trips["start_time"] = trips.start_time.apply(fix_time)
+            trips["end_time"] = trips.end_time.apply(fix_time)
+            yield car, trips
 
+    def record_loaded(car, used_ids):
         load_record[str(car.id)] = now.strftime("%Y-%m-%d")
 
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count/max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
+    aggregate_roundtrips(
+        fetch_car_trips(), allowed_starts, ctx.obj["Session"], on_saved=record_loaded
     )
+    for car_id in without_trips:
+        load_record[str(car_id)] = now.strftime("%Y-%m-%d")
 
     json.dump(load_record, open(load_record_path, "w"))
 
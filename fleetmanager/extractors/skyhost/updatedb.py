@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import json
 import os
 import re
 
@@ -19,6 +18,7 @@ from fleetmanager.data_access import (
 )
 from fleetmanager.data_access.dbschema import RoundTripSegments
 from fleetmanager.extractors.util import (
+    aggregate_roundtrips,
     apply_dmr_data,
     get_allowed_starts_with_additions,
     get_plate_info_from_api,
@@ -223,58 +223,30 @@ def set_roundtrips_v2(ctx):
     allowed_starts = get_allowed_starts_with_additions(session)
     vehicles_imeis = {str(veh.imei): veh for veh in query_vehicles}  #  we got to identify by imei / externalid since Skyhost removed their legacy id
     known_imeis = list(vehicles_imeis.keys())
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-    for api_key, account_id in zip(api_keys, account_ids):
-        complete_vehicle_list = get_complete_tracker_list(account_id=account_id, api_key=api_key)
-        headers = {"Authorization": f"Bearer {api_key}"}
 
-        for skyhost_vehicle in complete_vehicle_list:
-            if str(skyhost_vehicle.get("externalId")) not in known_imeis:
-                continue
-            skyhost_device_id = skyhost_vehicle.get("id")
-            saved_vehicle = vehicles_imeis[str(skyhost_vehicle.get("externalId"))]
-            trips = get_trips_v2(
-                from_date=saved_vehicle.max_date,
-                to_date=now,
-                url=f"https://api.skyhost.dk/accounts/{account_id}/resources/vehicles/{skyhost_device_id}/reports/milagetrip",
-                headers=headers,
-                car_id=saved_vehicle.id
-            )
-            if len(trips) == 0:
-                continue
+    def fetch_car_trips():
+        for api_key, account_id in zip(api_keys, account_ids):
+            complete_vehicle_list = get_complete_tracker_list(account_id=account_id, api_key=api_key)
+            headers = {"Authorization": f"Bearer {api_key}"}
 
-            car_trips = sanitise_for_overlaps(trips, summer_times, winter_times)
-            (
-                usage_count,
-                possible_count,
-                usage_distance,
-                possible_distance,
-            ) = process_car_roundtrips(
-                saved_vehicle,
-                car_trips,
-                allowed_starts,
-                aggregator,
-                score,
-                session,
-                is_session_maker=False,
-            )
-            collected_route_count += usage_count
-            collected_trip_count += possible_count
-            collected_route_length += usage_distance
-            collected_trip_length += possible_distance
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count / max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
-    )
+            for skyhost_vehicle in complete_vehicle_list:
+                if str(skyhost_vehicle.get("externalId")) not in known_imeis:
+                    continue
+                skyhost_device_id = skyhost_vehicle.get("id")
+                saved_vehicle = vehicles_imeis[str(skyhost_vehicle.get("externalId"))]
+                trips = get_trips_v2(
+                    from_date=saved_vehicle.max_date,
+                    to_date=now,
+                    url=f"https://api.skyhost.dk/accounts/{account_id}/resources/vehicles/{skyhost_device_id}/reports/milagetrip",
+                    headers=headers,
+                    car_id=saved_vehicle.id
+                )
+                if len(trips) == 0:
+                    continue
 
+                yield saved_vehicle, sanitise_for_overlaps(trips, summer_times, winter_times)
+
+    aggregate_roundtrips(fetch_car_trips(), allowed_starts, ctx.obj["Session"])
 
 
 @cli.command()
@@ -310,61 +282,30 @@ def set_roundtrips(ctx):
     with session_maker() as session:
         allowed_starts = get_allowed_starts_with_additions(session)
 
-    collected_trip_length = 0
-    collected_trip_count = 0
-    collected_route_length = 0
-    collected_route_count = 0
-
-    only_natural = json.loads(os.getenv("ONLY_NATURAL", "false"))
+    def fetch_car_trips():
+        for car in cars.itertuples():
+            if (
+                str(car.id) not in carid2key
+                or pd.isna(car.omkostning_aar)
+                or pd.isna(car.location)
+            ):
+                continue
+            with engine.connect() as conn:
+                max_date = conn.execute(
+                    text(
+                        f"select max(roundtrips.end_time) from roundtrips where car_id = {car.id}"
+                    )
+                ).fetchone()[0]
+            current_trips = get_trips(
+                car.id, key=carid2key[str(car.id)], from_date=max_date
+            )
+            # test which aggregates the most
+            if len(current_trips) == 0:
+                continue
 
-    for car in cars.itertuples():
-        if (
-            str(car.id) not in carid2key
-            or pd.isna(car.omkostning_aar)
-            or pd.isna(car.location)
-        ):
-            continue
-        with engine.connect() as conn:
-            max_date = conn.execute(
-                text(
-                    f"select max(roundtrips.end_time) from roundtrips where car_id = {car.id}"
-                )
-            ).fetchone()[0]
-        current_trips = get_trips(
-            car.id, key=carid2key[str(car.id)], from_date=max_date
-        )
-        # test which aggregates the most
-        if len(current_trips) == 0:
-            continue
+            yield car, sanitise_for_overlaps(current_trips, summer_times, winter_times)
 
-        car_trips = sanitise_for_overlaps(current_trips, summer_times, winter_times)
-        (
-            usage_count,
-            possible_count,
-            usage_distance,
-            possible_distance,
-        ) = process_car_roundtrips(
-            car,
-            car_trips,
-            allowed_starts,
-            aggregator,
-            score,
-            session_maker,
-            is_session_maker=True,
-        )
-        collected_route_count += usage_count
-        collected_trip_count += possible_count
-        collected_route_length += usage_distance
-        collected_trip_length += possible_distance
-    logger.info("*****************" * 3)
-    logger.info(
-        f"Collected route count {collected_route_count},    Collected trip count {collected_trip_count}      "
-        f"ratio {collected_route_count/max(collected_trip_count, 1)}"
-    )
-    logger.info(
-        f"Collected route length {collected_route_length},    Collected trip length {collected_trip_length}      "
-        f"ratio {collected_route_length / max(collected_trip_length, 1)}"
-    )
+    aggregate_roundtrips(fetch_car_trips(), allowed_starts, session_maker)
 
 
 @cli.command()
@@ -1,21 +1,42 @@
 import ast
+import multiprocessing
+import os
+import queue
+import threading
 import urllib.parse
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from typing import Callable, Iterable
 
 from datetime import datetime
 import pandas as pd
 import regex as re
 import requests
 from pydantic import ValidationError
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm import Session, selectinload, sessionmaker
 
 from fleetmanager.api.configuration.schemas import Vehicle
 from fleetmanager.data_access import AllowedStarts, Cars, FuelTypes, LeasingTypes, VehicleTypes
 from fleetmanager.logging import logging
-from fleetmanager.model.roundtripaggregator import calc_distance
+from fleetmanager.model.roundtripaggregator import aggregating_score as score
+from fleetmanager.model.roundtripaggregator import (
+    aggregator,
+    haversine_distance,
+    insert_roundtrips,
+    process_car_roundtrips,
+)
 
 
 logger = logging.getLogger(__name__)
 
+AGGREGATION_WORKERS = int(os.getenv("AGGREGATION_WORKERS", os.cpu_count() or 1))
+ROUNDTRIP_WRITE_BATCH = int(os.getenv("ROUNDTRIP_WRITE_BATCH", 25))
+
 
 BACK_REF_TYPES: dict = {
     "leasing_type": LeasingTypes,
@@ -25,6 +46,12 @@ BACK_REF_TYPES: dict = {
 }
 
 
+@dataclass
+class CarModel:
+    id: str
+    location: int
+
+
 def get_values(original_source: str) -> dict:
     car_data = {}
     if original_source is None:
@@ -185,11 +212,8 @@ def logs_to_trips(puma_frame: pd.DataFrame, allowed_speed: int = 200) -> list[di
         lambda row: 1 / 3600 if row.next_timestamp == row.timestamp else (row.next_timestamp - row.timestamp).total_seconds() / 3600,
         axis=1
     )
-    frame["distance"] = frame.apply(
-        lambda row: calc_distance(
-            (row.latitude, row.longitude), (row.next_latitude, row.next_longitude)
-        ),
-        axis=1
+    frame["distance"] = haversine_distance(
+        frame.latitude, frame.longitude, frame.next_latitude, frame.next_longitude
     )
 
     frame["km/h"] = frame.apply(
@@ -238,7 +262,7 @@ def logs_to_trips(puma_frame: pd.DataFrame, allowed_speed: int = 200) -> list[di
 
 def generate_trips(original_df):
     """
-    Take a Dataframe and the calc_distance function to create trips
+    Take a Dataframe and the haversine_distance function to create trips
     returns a new Dataframe with the following values:
     imei, start_time, end_time, distance, start_latitude, start_longitude, end_latitude, end_longitude
     """
@@ -255,11 +279,8 @@ def generate_trips(original_df):
     df.sort_values("timestamp", inplace=True, ascending=True)
     df[["prev_latitude", "prev_longitude"]] = df[["latitude", "longitude"]].shift()
 
-    df["distance"] = df.apply(
-        lambda row: calc_distance(
-            (row.latitude, row.longitude), (row.prev_latitude, row.prev_longitude)
-        ),
-        axis=1,
+    df["distance"] = haversine_distance(
+        df.latitude, df.longitude, df.prev_latitude, df.prev_longitude
     )
 
     # Grouping logic
@@ -587,3 +608,153 @@ def get_plate_info_from_api(plate: str) -> dict:
     car_data["make"] = basic.get("maerkeTypeNavn")
     car_data["model"] = " ".join(filter(None, [basic.get("modelTypeNavn"), basic.get("variantTypeNavn")])).strip()
     return car_data
+
+
+_worker_allowed_starts = None
+
+
+def _init_aggregation_worker(allowed_starts: list[dict]):
+    """Hands the allowed starts to the worker once instead of pickling them with every car"""
+    global _worker_allowed_starts
+    _worker_allowed_starts = allowed_starts
+
+
+def _aggregate_car(car: CarModel, car_trips: pd.DataFrame):
+    return process_car_roundtrips(
+        car,
+        car_trips,
+        _worker_allowed_starts,
+        aggregator,
+        score,
+        None,
+        is_session_maker=False,
+        return_ids=True,
+        save=False,
+        return_routes=True,
+    )
+
+
+def aggregate_roundtrips(
+    car_trips: Iterable[tuple],
+    allowed_starts: list[dict],
+    session_maker: sessionmaker,
+    workers: int = None,
+    queue_size: int = None,
+    write_batch_size: int = None,
+    on_saved: Callable[[CarModel, list[dict]], None] = None,
+) -> tuple[int, int, float, float]:
+    """
+    Aggregates the trips of many cars to roundtrips and saves them. The pipeline has three stages:
+    a fetch thread that consumes car_trips into a bounded queue, a pool of workers that runs
+    process_car_roundtrips on each car and a single writer that bulk inserts the roundtrips
+    of write_batch_size cars per transaction. A car that fails to aggregate is logged and skipped.
+
+    Parameters
+    ----------
+    car_trips   :   iterable of (car, trips frame) tuples, the car needs an id and a location. Usually a generator
+                    that downloads the trips of one car at a time
+    allowed_starts  :   list of allowed starts, like get_allowed_starts_with_additions
+    session_maker   :   sessionmaker used by the writer
+    workers :   number of aggregation processes, defaults to AGGREGATION_WORKERS. With a single worker the
+                aggregation runs in a thread next to the fetch stage
+    queue_size  :   number of fetched cars waiting for a worker, defaults to twice the workers
+    write_batch_size    :   number of cars saved per transaction, defaults to ROUNDTRIP_WRITE_BATCH
+    on_saved    :   called with the car and the ids of its roundtrips once the roundtrips are committed. It is
+                    called for every car that was aggregated, also when it had no roundtrips, and never for
+                    cars that failed
+
+    Returns
+    -------
+    usage_count, possible_count, usage_distance, possible_distance summed over all cars
+    """
+    workers = workers or AGGREGATION_WORKERS
+    queue_size = queue_size or 2 * workers
+    write_batch_size = write_batch_size or ROUNDTRIP_WRITE_BATCH
+
+    fetched = queue.Queue(maxsize=queue_size)
+    fetch_done = object()
+    fetch_errors = []
+
+    def fetch():
+        try:
+            for car, trips in car_trips:
+                fetched.put((CarModel(car.id, car.location), trips))
+        except Exception as e:
+            fetch_errors.append(e)
+        finally:
+            fetched.put(fetch_done)
+
+    totals = [0, 0, 0, 0]
+    pending = []
+
+    def write():
+        with session_maker.begin() as session:
+            insert_roundtrips(
+                session,
+                [
+                    route
+                    for _, _, routes in pending
+                    if routes is not None
+                    for route in routes.to_dict("records")
+                ],
+            )
+        if on_saved is not None:
+            for car, ids, _ in pending:
+                on_saved(car, ids)
+        pending.clear()
+
+    def collect(futures):
+        for future in futures:
+            car = in_flight.pop(future)
+            try:
+                *counts, ids, routes = future.result()
+            except Exception:
+                logger.exception(f"Could not aggregate the roundtrips of car {car.id}")
+                continue
+            totals[:] = [total + count for total, count in zip(totals, counts)]
+            pending.append((car, ids, routes))
+        if len(pending) >= write_batch_size:
+            write()
+
+    if workers > 1:
+        # spawn, since forking while the fetch thread runs can copy its held locks into the workers
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_aggregation_worker,
+            initargs=(allowed_starts,),
+        )
+    else:
+        executor = ThreadPoolExecutor(
+            max_workers=1,
+            initializer=_init_aggregation_worker,
+            initargs=(allowed_starts,),
+        )
+
+    fetcher = threading.Thread(target=fetch, daemon=True)
+    fetcher.start()
+    in_flight = {}
+    with executor:
+        while (item := fetched.get()) is not fetch_done:
+            car, trips = item
+            in_flight[executor.submit(_aggregate_car, car, trips)] = car
+            if len(in_flight) >= workers:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(wait(in_flight).done)
+    if pending:
+        write()
+    fetcher.join()
+    if fetch_errors:
+        raise fetch_errors[0]
+
+    logger.info("*****************" * 3)
+    logger.info(
+        f"Collected route count {totals[0]},    Collected trip count {totals[1]}      "
+        f"ratio {totals[0] / max(totals[1], 1)}"
+    )
+    logger.info(
+        f"Collected route length {totals[2]},    Collected trip length {totals[3]}      "
+        f"ratio {totals[2] / max(totals[3], 1)}"
+    )
+    return tuple(totals)
@@ -1,8 +1,12 @@
+import json
 import math
 import random
+from concurrent.futures import Executor
 from deap import base, creator, tools
 import numpy as np
+import pandas as pd
 from datetime import date, datetime, time
+from functools import partial
 from typing import TypedDict, Tuple
 
 from sqlalchemy import and_, or_, func, text
@@ -13,6 +17,7 @@ from fleetmanager.data_access import engine_creator, Cars
 from fleetmanager.fleet_simulation import get_unallocated, allocation_distribution, vehicle_usage
 from fleetmanager.model.tco_calculator import TCOCalculator
 from fleetmanager.model.model import Trips, Simulation, ConsequenceCalculator, Model
+from fleetmanager.model.parallel import create_executor, get_worker_count
 from fleetmanager.model.vehicle import Bike, ElectricBike, FleetInventory, VehicleFactory
 from fleetmanager.configuration.util import load_shift_settings, load_bike_configuration_from_db
 from fleetmanager.model.trip_generator import extract_peak_day
@@ -520,80 +525,194 @@ class FleetHandler:
 
     def fitness(self, solution: list[int], min_vehicle_counts: int = None, bike_estimate: int = None):
         """
-        Scoring function for evaluating a solution.
-
-        Rewards:
-            meeting minimum required vehicles
-            meeting bike estimate
-            low co2e weight
-            low cost weight
-            low amount of unique vehicle types
-
-        Penalises:
-            unmet minimum vehicle count
-            unmet bike estimat
-            more unique vehicle types
-            high co2e weight
-            high cost weight
+        Scoring function for evaluating a solution. See fleet_fitness for the rewards and penalties.
         """
 
         if min_vehicle_counts is None:
             min_vehicle_counts = self.min_vehicle_counts
         if bike_estimate is None:
             bike_estimate = self.bike_estimate
-        total_cost = 0
-        total_co2e = 0
-        total_vehicles = sum(solution)
-        total_bikes = 0
+        return fleet_fitness(
+            solution,
+            attributed_fleet=self.attributed_fleet,
+            cost_weight=self.cost_weight,
+            co2e_weight=self.co2e_weight,
+            min_vehicle_counts=min_vehicle_counts,
+            bike_estimate=bike_estimate,
+        )
 
-        penalty = 0
+    def get_batch_evaluator(self):
+        """
+        Fitness function that scores a whole population, given as a 2D array of vehicle counts, in one call.
+        The weight vectors are taken from the attributed_fleet of the current scenario.
+        """
+        return partial(
+            fleet_fitness_batch,
+            normalized_cost=np.array([v['normalized_cost'] for v in self.attributed_fleet], dtype=float),
+            normalized_co2e=np.array([v['normalized_co2e'] for v in self.attributed_fleet], dtype=float),
+            is_bike=np.array([v['type'] in [1, 2] for v in self.attributed_fleet], dtype=bool),
+            cost_weight=self.cost_weight,
+            co2e_weight=self.co2e_weight,
+            min_vehicle_counts=self.min_vehicle_counts,
+            bike_estimate=self.bike_estimate,
+        )
 
-        if total_vehicles == 0:
-            penalty += 1e6
-        else:
-            for idx, (n_i, vehicle) in enumerate(zip(solution, self.attributed_fleet)):
-                if n_i < 0:
-                    penalty += 1e6
-                    continue
+    def __get_aggregate_id(self):
+        if "mysql" in self.engine.dialect.name:
+            return func.group_concat(Cars.id).label('ids')
+        elif "sqlite" in self.engine.dialect.name:
+            return func.group_concat(Cars.id, ',').label('ids')
+        return text("STRING_AGG(CONVERT(VARCHAR(20), cars.id), ',')")
 
-                total_cost += n_i * vehicle['normalized_cost']
-                total_co2e += n_i * vehicle['normalized_co2e']
 
-                if vehicle['type'] in [1, 2]:
-                    total_bikes += n_i
+def fleet_fitness(
+        solution: list[int],
+        attributed_fleet: list[dict],
+        cost_weight: float,
+        co2e_weight: float,
+        min_vehicle_counts: int,
+        bike_estimate: int
+):
+    """
+    Scoring function for evaluating a solution.
+
+    Rewards:
+        meeting minimum required vehicles
+        meeting bike estimate
+        low co2e weight
+        low cost weight
+        low amount of unique vehicle types
+
+    Penalises:
+        unmet minimum vehicle count
+        unmet bike estimat
+        more unique vehicle types
+        high co2e weight
+        high cost weight
+    """
+    total_cost = 0
+    total_co2e = 0
+    total_vehicles = sum(solution)
+    total_bikes = 0
+
+    penalty = 0
+
+    if total_vehicles == 0:
+        penalty += 1e6
+    else:
+        for idx, (n_i, vehicle) in enumerate(zip(solution, attributed_fleet)):
+            if n_i < 0:
+                penalty += 1e6
+                continue
 
-        # encourage vehicle count
-        car_count = total_vehicles - total_bikes
-        if car_count < min_vehicle_counts:
-            cars_to_go = abs(min_vehicle_counts - car_count)
-            penalty += 1000 * cars_to_go  # penalise if required vehicles not met, less penalty the closer
-        if car_count > min_vehicle_counts:
-            penalty += 10
+            total_cost += n_i * vehicle['normalized_cost']
+            total_co2e += n_i * vehicle['normalized_co2e']
 
-        # encourage bike usage
-        penalty += abs(total_bikes - bike_estimate) * 1  # don't punish too much, estimates are not too accurate
+            if vehicle['type'] in [1, 2]:
+                total_bikes += n_i
 
-        # encourage less unique types
-        vehicle_types_used = sum(1 for n_i in solution if n_i > 0)
+    # encourage vehicle count
+    car_count = total_vehicles - total_bikes
+    if car_count < min_vehicle_counts:
+        cars_to_go = abs(min_vehicle_counts - car_count)
+        penalty += 1000 * cars_to_go  # penalise if required vehicles not met, less penalty the closer
+    if car_count > min_vehicle_counts:
+        penalty += 10
 
-        diversity_penalty_weight = 1
-        penalty += vehicle_types_used * diversity_penalty_weight
+    # encourage bike usage
+    penalty += abs(total_bikes - bike_estimate) * 1  # don't punish too much, estimates are not too accurate
 
-        penalty_weight = 1
+    # encourage less unique types
+    vehicle_types_used = sum(1 for n_i in solution if n_i > 0)
 
-        fitness_value = (
-                self.cost_weight * total_cost +
-                self.co2e_weight * total_co2e +
-                penalty_weight * penalty
-        )
-        return (fitness_value,)
+    diversity_penalty_weight = 1
+    penalty += vehicle_types_used * diversity_penalty_weight
 
-    def __get_aggregate_id(self):
-        if "mysql" in self.engine.dialect.name:
-            return func.group_concat(Cars.id).label('ids')
-        elif "sqlite" in self.engine.dialect.name:
-            return func.group_concat(Cars.id, ',').label('ids')
-        return text("STRING_AGG(CONVERT(VARCHAR(20), cars.id), ',')")
+    penalty_weight = 1
+
+    fitness_value = (
+            cost_weight * total_cost +
+            co2e_weight * total_co2e +
+            penalty_weight * penalty
+    )
+    return (fitness_value,)
+
+
+def fleet_fitness_batch(
+        solutions: np.ndarray,
+        normalized_cost: np.ndarray,
+        normalized_co2e: np.ndarray,
+        is_bike: np.ndarray,
+        cost_weight: float,
+        co2e_weight: float,
+        min_vehicle_counts: int,
+        bike_estimate: int
+):
+    """
+    Vectorised version of fleet_fitness scoring all solutions at once.
+
+    Parameters
+    ----------
+    solutions   :   np.ndarray, (n_solutions, n_vehicles) array of vehicle counts
+    normalized_cost :   np.ndarray, normalized cost of each vehicle
+    normalized_co2e :   np.ndarray, normalized co2e of each vehicle
+    is_bike :   np.ndarray, boolean mask of the vehicles that are bikes
+    cost_weight :   float, weight of the cost
+    co2e_weight :   float, weight of the co2e
+    min_vehicle_counts  :   int, required number of cars
+    bike_estimate   :   int, estimated number of bikes
+
+    Returns
+    -------
+    fitness_values  :   np.ndarray, fitness value of each solution
+    """
+    solutions = np.asarray(solutions, dtype=np.int64).reshape(len(solutions), -1)
+    total_vehicles = solutions.sum(axis=1)
+    valid = total_vehicles != 0
+    # negative genes are penalised and left out of the totals like in fleet_fitness
+    counts = np.where(valid[:, None], np.clip(solutions, 0, None), 0)
+
+    penalty = np.where(valid, 1e6 * (solutions < 0).sum(axis=1), 1e6)
+    total_cost = counts @ normalized_cost
+    total_co2e = counts @ normalized_co2e
+    total_bikes = counts[:, is_bike].sum(axis=1)
+
+    # encourage vehicle count
+    car_count = total_vehicles - total_bikes
+    penalty += 1000 * np.clip(min_vehicle_counts - car_count, 0, None)
+    penalty += 10 * (car_count > min_vehicle_counts)
+
+    # encourage bike usage
+    penalty += np.abs(total_bikes - bike_estimate)
+
+    # encourage less unique types
+    penalty += (solutions > 0).sum(axis=1)
+
+    return cost_weight * total_cost + co2e_weight * total_co2e + penalty
+
+
+def clone_individual(individual):
+    """Shallow replacement for toolbox.clone, the genes are integers so a deepcopy is not needed"""
+    clone = type(individual)(individual)
+    clone.fitness.wvalues = individual.fitness.wvalues
+    return clone
+
+
+def evaluate_individuals(individuals: list, toolbox: base.Toolbox, fitness_cache: dict = None):
+    """
+    Sets the fitness of the individuals. Only the distinct gene tuples that are not already in the fitness_cache are
+    scored, in one call of toolbox.evaluate_population.
+    """
+    if fitness_cache is None:
+        fitness_cache = {}
+    keys = [tuple(individual) for individual in individuals]
+    missing = list(dict.fromkeys(key for key in keys if key not in fitness_cache))
+    if missing:
+        fitness_values = toolbox.evaluate_population(np.array(missing))
+        fitness_cache.update((key, (float(value),)) for key, value in zip(missing, fitness_values))
+    for individual, key in zip(individuals, keys):
+        individual.fitness.values = fitness_cache[key]
+    return len(missing)
 
 
 def run_solution_search(
@@ -605,18 +724,22 @@ def run_solution_search(
         elite_size: int = 1,
         stats: tools.Statistics = None,
         best_solutions: tools.HallOfFame = None,
-        stagnation_limit=20
+        stagnation_limit=20,
+        fitness_cache: dict = None
 ):
     """
     Handle the genetic search with elitism by keeping best solutions in generations.
+
+    The individuals are scored by toolbox.evaluate_population. Individuals with a gene tuple found in fitness_cache
+    are not re-scored.
     """
+    if fitness_cache is None:
+        fitness_cache = {}
     logbook = tools.Logbook()
     logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
     best_fitness = None
     generations_without_improvement = 0
-    fitnesses = list(map(toolbox.evaluate, population))
-    for ind, fit in zip(population, fitnesses):
-        ind.fitness.values = fit
+    evaluate_individuals(population, toolbox, fitness_cache)
 
     if best_solutions is not None:
         best_solutions.update(population)
@@ -641,9 +764,7 @@ def run_solution_search(
                 del mutant.fitness.values
 
         invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = list(map(toolbox.evaluate, invalid_ind))
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+        evaluate_individuals(invalid_ind, toolbox, fitness_cache)
 
         if best_solutions is not None:
             best_solutions.update(population)
@@ -679,6 +800,8 @@ def genetic_handler(fleet_handler):
 
     Requires the fleet_handler that has defined either a trim or cook scenario in order to keep record
     of the fitness of the generated solutions.
+
+    The population is scored in one vectorised call.
     """
 
     random.seed(42)
@@ -721,12 +844,10 @@ def genetic_handler(fleet_handler):
                 ind2[i] = min(max(ind2[i], lows[i]), ups[i])
         return ind1, ind2
 
-    def evaluate(individual):
-        return fleet_handler.fitness(individual)
-
     toolbox.register("individual", initiation_individual, creator.Individual, lows=lows_fleet, ups=ups_fleet)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register("evaluate", evaluate)
+    toolbox.register("clone", clone_individual)
+    toolbox.register("evaluate_population", fleet_handler.get_batch_evaluator())
     toolbox.register("select", tools.selTournament, tournsize=3)
     toolbox.register("mate", crossover_genes, indpb=crossover_prob, lows=lows_fleet, ups=ups_fleet)
     toolbox.register("mutate", mutation_per_gene, lows=lows_fleet, ups=ups_fleet, indpb=mutation_prob)
@@ -750,7 +871,8 @@ def genetic_handler(fleet_handler):
         elite_size=elite_size,
         stats=stats,
         best_solutions=best_solutions,
-        stagnation_limit=50 if fleet_handler.trim_scenario else 20
+        stagnation_limit=50 if fleet_handler.trim_scenario else 20,
+        fitness_cache={}
     )
     solutions = []
     for idx, best_individual in enumerate(best_solutions):
@@ -769,6 +891,9 @@ class DrivingTest:
     fleet_handler : the initiated fleet_handler that has the defined scenario initiated
     trip_handler : the initiated trip_handler that holds the relevant roundtrips
     settings : the input settings which is used for building fleets with the appriopriate settings
+
+    The outcome of every drivability check is kept in drivability_cache, so the searches for the different bike
+    counts re-use each other's simulations.
     """
     def __init__(self, fleet_handler: FleetHandler, trip_handler: TripHandler, settings: prepared_settings_type = None):
         if settings is None:
@@ -780,6 +905,7 @@ class DrivingTest:
         self.default_fleet = None
         self.type_translation = None
         self.fuel_translation = None
+        self.drivability_cache = {}
 
     def estimate_required_vehicles(self, trips: Trips = None, number_of_bikes: int = None):
         if trips is None:
@@ -838,12 +964,14 @@ class DrivingTest:
                         modify_key = key
             if modify_key:
                 vehicle_factory.vmapper[modify_key].km_aar = max_dist * 365
+                vehicles[int(modify_key)]["km_aar"] = max_dist * 365
 
         breakpoint_found, count = self.__search(
             start_solution,
             vehicle_factory=vehicle_factory,
             trips=trips,
-            car_idx=car_idx  # search with the specified index
+            car_idx=car_idx,  # search with the specified index
+            fleet_key=json.dumps(vehicles, sort_keys=True, default=str)
         )
         return breakpoint_found, count
 
@@ -912,12 +1040,14 @@ class DrivingTest:
         iteration: int = 0,
         max_iter: int = 100,
         car_idx: int = 0,
-        trips: Trips = None
+        trips: Trips = None,
+        fleet_key: str = None
     ):
         iteration += 1
         if numbers_checked is None:
-            fleet = self.build_fleet(solution, vehicle_factory)
-            numbers_checked = {solution[car_idx]: self.__is_drivable(trips, fleet)}
+            numbers_checked = {
+                solution[car_idx]: self.__check_drivable(trips, solution, vehicle_factory, fleet_key)
+            }
         if old is None:
             old = solution[car_idx]
         if down:
@@ -937,8 +1067,7 @@ class DrivingTest:
             middle += 1
         new_solution = self.default_fleet
         new_solution[car_idx] = middle
-        fleet = self.build_fleet(new_solution, vehicle_factory)
-        drivable = self.__is_drivable(trips, fleet)
+        drivable = self.__check_drivable(trips, new_solution, vehicle_factory, fleet_key)
         numbers_checked[middle] = drivable
 
         # found breaking point?
@@ -964,8 +1093,9 @@ class DrivingTest:
             while True:
                 new_solution = self.default_fleet
                 new_solution[car_idx] = count
-                fleet = self.build_fleet(new_solution, vehicle_factory, days=days)
-                drivable = self.__is_drivable(self.trip_handler.trips, fleet)
+                drivable = self.__check_drivable(
+                    self.trip_handler.trips, new_solution, vehicle_factory, fleet_key, days=days
+                )
                 if drivable:
                     break
                 count += 1
@@ -983,6 +1113,7 @@ class DrivingTest:
                 numbers_checked=numbers_checked,
                 iteration=iteration,
                 max_iter=max_iter,
+                fleet_key=fleet_key,
             )
         else:
             old = middle
@@ -996,10 +1127,57 @@ class DrivingTest:
                 numbers_checked=numbers_checked,
                 iteration=iteration,
                 max_iter=max_iter,
+                fleet_key=fleet_key,
             )
 
         return new_solution
 
+    def __check_drivable(
+        self,
+        trips: Trips,
+        solution: list[int],
+        vehicle_factory: VehicleFactory,
+        fleet_key: str,
+        days: int = 1
+    ):
+        """
+        Memoised drivability check of the solution. The checks are grouped on the vehicles, the trips and the settings.
+        Within a group drivability is monotone in the vehicle counts, so a solution with at least as many of every
+        vehicle as a drivable solution is drivable, and a solution with at most as many of every vehicle as an
+        undrivable solution is not. Those are answered without running the simulation.
+        """
+        group = (
+            fleet_key,
+            days,
+            self.__trips_key(trips),
+            json.dumps(self.settings, sort_keys=True, default=str),
+        )
+        checked = self.drivability_cache.setdefault(group, {})
+        key = tuple(solution)
+        if key in checked:
+            return checked[key]
+        for other, drivable in checked.items():
+            if drivable and all(a >= b for a, b in zip(key, other)):
+                return True
+            if not drivable and all(a <= b for a, b in zip(key, other)):
+                return False
+
+        fleet = self.build_fleet(solution, vehicle_factory, days=days)
+        checked[key] = self.__is_drivable(trips, fleet)
+        return checked[key]
+
+    @staticmethod
+    def __trips_key(trips: Trips):
+        """Content hash of the trips, the simulation adds columns to the frame so only the input columns are used"""
+        return (
+            len(trips.trips),
+            int(
+                pd.util.hash_pandas_object(
+                    trips.trips[["start_time", "end_time", "distance"]], index=False
+                ).sum()
+            ),
+        )
+
     def __is_drivable(self, trips: Trips, fleet: FleetInventory):
         simulation = Simulation(
             trips,
@@ -1026,44 +1204,67 @@ class DrivingTest:
     def run_simulation(self, trips: Trips, fleet: FleetInventory, fleet_name: str = None):
         if fleet_name is None:
             fleet_name = self.fleet_name
-        simulation = Simulation(
-            trips,
-            fleet,
-            progress_callback=None,
-            tabu=True,
-            intelligent_simulation=self.settings.get("intelligent_allocation", False),
-            timestamps_set=True,
-            timeslots=False
-        )
-        simulation.run()
-        setattr(
-            simulation.fleet_manager,
-            f"{fleet_name}_fleet",
-            simulation.fleet_manager.vehicles
-        )
-        cq = ConsequenceCalculator(states=[fleet_name], settings=self.settings)
-        cq.compute(simulation, None, [0, 1])
-        savings_key = cq.consequence_table["keys"].index(
-            "Samlet omkostning [kr/år]"
-        )
-        co2e_key = cq.consequence_table["keys"].index(
-            "POGI CO2-ækvivalent udledning [CO2e]"
-        )
-        uallokeret_key = cq.consequence_table["keys"].index(
-            "Antal ture uden køretøj",
-        )
+        return simulate_fleet(trips, fleet, settings=self.settings, fleet_name=fleet_name)
 
-        omkostning = cq.consequence_table[f"{fleet_name[:3]}_values"][savings_key]
-        udledning = cq.consequence_table[f"{fleet_name[:3]}_values"][co2e_key]
-        uallokeret = cq.consequence_table[f"{fleet_name[:3]}_values"][uallokeret_key]
-        driving_book = simulation.trips.trips
-        return {
-            "omkostning": omkostning,
-            "udledning": udledning,
-            "uallokeret": uallokeret,
-            "driving_book": driving_book.copy(),
-            "consequence_calculator": cq
-        }
+
+# the trips, settings and fleet name shared by the solutions a verification worker simulates
+_verification_state = None
+
+
+def _init_verification_worker(trips: Trips, settings: prepared_settings_type, fleet_name: str):
+    global _verification_state
+    _verification_state = (trips, settings, fleet_name)
+
+
+def _simulate_verification_fleet(fleet: FleetInventory):
+    """Simulates the fleet on the trips the verification worker was initialised with"""
+    trips, settings, fleet_name = _verification_state
+    return simulate_fleet(trips, fleet, settings=settings, fleet_name=fleet_name)
+
+
+def simulate_fleet(trips: Trips, fleet: FleetInventory, settings: prepared_settings_type, fleet_name: str):
+    """
+    Runs the simulation of the fleet on the trips and computes the consequences. Module level to allow running it in
+    worker processes, see DrivingTest.run_simulation and AutomaticSimulation.run_solutions.
+    """
+    simulation = Simulation(
+        trips,
+        fleet,
+        progress_callback=None,
+        tabu=True,
+        intelligent_simulation=settings.get("intelligent_allocation", False),
+        timestamps_set=True,
+        timeslots=False
+    )
+    simulation.run()
+    setattr(
+        simulation.fleet_manager,
+        f"{fleet_name}_fleet",
+        simulation.fleet_manager.vehicles
+    )
+    cq = ConsequenceCalculator(states=[fleet_name], settings=settings)
+    cq.compute(simulation, None, [0, 1])
+    savings_key = cq.consequence_table["keys"].index(
+        "Samlet omkostning [kr/år]"
+    )
+    co2e_key = cq.consequence_table["keys"].index(
+        "POGI CO2-ækvivalent udledning [CO2e]"
+    )
+    uallokeret_key = cq.consequence_table["keys"].index(
+        "Antal ture uden køretøj",
+    )
+
+    omkostning = cq.consequence_table[f"{fleet_name[:3]}_values"][savings_key]
+    udledning = cq.consequence_table[f"{fleet_name[:3]}_values"][co2e_key]
+    uallokeret = cq.consequence_table[f"{fleet_name[:3]}_values"][uallokeret_key]
+    driving_book = simulation.trips.trips
+    return {
+        "omkostning": omkostning,
+        "udledning": udledning,
+        "uallokeret": uallokeret,
+        "driving_book": driving_book.copy(),
+        "consequence_calculator": cq
+    }
 
 
 class AutomaticSimulation:
@@ -1167,31 +1368,71 @@ class AutomaticSimulation:
             continue
 
     def run_solutions(self):
+        """
+        Verifies the solutions on the full trip set in order of fitness. The simulations are run ahead on a pool of
+        worker processes, when they can be started, while the results are handled in order to keep the skipping of
+        solutions with type compositions that previously failed.
+        """
+        # the trips are handed to every worker once, so only the fleets are sent with the solutions
+        executor = create_executor(
+            allow_threads=False,
+            initializer=_init_verification_worker,
+            initargs=(self.th.trips, self.settings, self.dt.fleet_name),
+        )
+        try:
+            yield from self.__verify_solutions(executor)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def __skip_solution(self, type_count: tuple):
+        return type_count in self.vehicle_assumption and type_count not in self.vehicle_approved
+
+    def __verify_solutions(self, executor: Executor = None):
         self.all_solutions.sort(key=lambda x: x["fitness"])
         num_solutions = len(self.all_solutions)
-        for idx, sol in enumerate(self.all_solutions):
+        type_counts = []
+        for sol in self.all_solutions:
             type_count = [0, 0, 0, 0]
             for vehicle in sol["fleet"]:
                 type_count[self.typtrans[vehicle.type]] += 1
+            type_counts.append(tuple(type_count))
 
+        workers = get_worker_count() if executor is not None else 0
+        pending = {}
+        next_submit = 0
+        for idx, sol in enumerate(self.all_solutions):
+            # keep the workers busy with the next solutions that are not known to be skipped
+            while next_submit < num_solutions and len(pending) < workers:
+                if not self.__skip_solution(type_counts[next_submit]):
+                    pending[next_submit] = executor.submit(
+                        _simulate_verification_fleet,
+                        self.all_solutions[next_submit]["fleet"],
+                    )
+                next_submit += 1
+
+            type_count = type_counts[idx]
+            future = pending.pop(idx, None)
             # if len(self.qualified) == 5:
             #     break
-            if (
-                tuple(type_count) in self.vehicle_assumption
-                and tuple(type_count) not in self.vehicle_approved
-            ):
+            if self.__skip_solution(type_count):
+                if future is not None:
+                    future.cancel()
                 yield idx, num_solutions
                 continue
 
-            results = self.dt.run_simulation(self.th.trips, sol['fleet'])
+            if future is not None:
+                results = future.result()
+            else:
+                results = self.dt.run_simulation(self.th.trips, sol['fleet'])
             if results["uallokeret"] > self.settings.get("slack", 0):
                 db = results["driving_book"]
                 twv = db[db[f"{self.dt.fleet_name}_type"] == -1]
                 if len(twv[twv.distance > self.settings.get("max_undriven", 20)]) > 0:
-                    self.vehicle_assumption.append(tuple(type_count))
+                    self.vehicle_assumption.append(type_count)
                     yield idx, num_solutions
                     continue
-            self.vehicle_approved.append(tuple(type_count))
+            self.vehicle_approved.append(type_count)
             self.qualified.append(sol)
             report = results
             prepared_results = {
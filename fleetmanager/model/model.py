@@ -1,10 +1,12 @@
 import datetime
 import operator
+import os
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
 from itertools import groupby
 
 import numpy as np
 import pandas as pd
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
 from sqlalchemy.orm.query import Query
 
 from fleetmanager.data_access import (
@@ -16,10 +18,16 @@ from fleetmanager.data_access import (
 from fleetmanager.logging import logging
 from fleetmanager.model import vehicle
 from fleetmanager.model.dashfree_utils import get_emission
+from fleetmanager.model.parallel import create_executor
 from fleetmanager.model.qampo import qampo_simulation
 from fleetmanager.model.qampo.classes import AlgorithmType
 from fleetmanager.model.qampo.classes import Fleet as qampo_fleet
 from fleetmanager.model.qampo.classes import Trip as qampo_trip
+from fleetmanager.model.route_plan_cache import (
+    get_cached_route_plan,
+    route_plan_cache_key,
+    set_cached_route_plan,
+)
 from fleetmanager.model.tco_calculator import TCOCalculator
 from fleetmanager.model.trip_generator import shiftify, get_kilometer_per_hour
 from fleetmanager.model.vehicle import Bike, ElectricBike
@@ -27,6 +35,97 @@ from fleetmanager.model.vehicle import Bike, ElectricBike
 
 logger = logging.getLogger(__name__)
 
+# the roundtrip columns the simulation uses
+TRIP_COLUMNS = (
+    "id",
+    "start_time",
+    "end_time",
+    "start_latitude",
+    "start_longitude",
+    "end_latitude",
+    "end_longitude",
+    "distance",
+    "car_id",
+    "start_location_id",
+    "aggregation_type",
+)
+LOAD_TRIPS_BATCH = int(os.getenv("LOAD_TRIPS_BATCH", 10000))
+
+
+class _TripReducer:
+    """
+    Reduces the joined roundtrip and segment rows partition by partition. Each roundtrip keeps only its first row, the
+    segment columns are appended to growing arrays together with the code of their roundtrip. The roundtrips are coded
+    in the order they are first seen.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.trips = []
+        self.segment_codes = []
+        self.segment_start_times = []
+        self.segment_end_times = []
+        self.segment_distances = []
+
+    def add(self, rows: pd.DataFrame):
+        first_code = len(self.codes)
+        local_codes, roundtrip_ids = pd.factorize(rows.id)
+        codes = np.fromiter(
+            (self.codes.setdefault(id_, len(self.codes)) for id_ in roundtrip_ids),
+            dtype=np.int64,
+            count=len(roundtrip_ids),
+        )
+        _, first_rows = np.unique(local_codes, return_index=True)
+        self.trips.append(
+            rows.iloc[first_rows[codes >= first_code]][list(TRIP_COLUMNS) + ["address"]]
+        )
+        has_segment = rows.segment_id.notna().to_numpy()
+        segments = rows[has_segment]
+        self.segment_codes.append(codes[local_codes[has_segment]])
+        self.segment_start_times.append(
+            segments.segment_start_time.to_numpy("datetime64[us]")
+        )
+        self.segment_end_times.append(segments.segment_end_time.to_numpy("datetime64[us]"))
+        self.segment_distances.append(segments.segment_distance.to_numpy(float))
+
+    def result(self) -> pd.DataFrame:
+        """The roundtrips with their segments, the partial results are released as they are combined"""
+        if not self.codes:
+            return pd.DataFrame()
+        trips = pd.concat(self.trips, ignore_index=True)
+        self.trips = []
+        trips["trip_segments"] = self._group_segments()
+        self.codes = {}
+        return trips
+
+    def _group_segments(self) -> list[list[dict]]:
+        """Groups the segments by roundtrip through offsets into the segment arrays sorted by roundtrip"""
+        roundtrip_count = len(self.codes)
+        segment_codes = np.concatenate(self.segment_codes)
+        order = np.argsort(segment_codes, kind="stable")
+        offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(segment_codes, minlength=roundtrip_count)))
+        )
+        start_times = np.concatenate(self.segment_start_times)[order].tolist()
+        end_times = np.concatenate(self.segment_end_times)[order].tolist()
+        distances = np.concatenate(self.segment_distances)[order].tolist()
+        self.segment_codes = []
+        self.segment_start_times = []
+        self.segment_end_times = []
+        self.segment_distances = []
+        return [
+            [
+                {
+                    "start_time": start_times[segment],
+                    "end_time": end_times[segment],
+                    "distance": distances[segment],
+                }
+                for segment in range(offsets[roundtrip], offsets[roundtrip + 1])
+            ]
+            for roundtrip in range(roundtrip_count)
+        ]
+
+
 class Trips:
     """Trips class for containing and manipulating trips of the simulation.
 
@@ -85,10 +184,8 @@ class Trips:
         if kilometer_pr_hour:
             self.trips = get_kilometer_per_hour(self.trips, self.engine)
         else:
-            self.trips["km/h"] = self.trips.apply(
-                lambda row: row.distance
-                / ((row.end_time - row.start_time).total_seconds() / 3600),
-                axis=1,
+            self.trips["km/h"] = self.trips.distance / (
+                (self.trips.end_time - self.trips.start_time).dt.total_seconds() / 3600
             )
         logger.info(f"cars in simulation trips {self.trips.car_id.unique()}")
         self.distance_range = (
@@ -96,6 +193,12 @@ class Trips:
             self.trips.distance.max(),
         )
 
+    def __getstate__(self):
+        # the engine is only used for loading, trips sent to worker processes are passed without it
+        state = self.__dict__.copy()
+        state["engine"] = None
+        return state
+
     def load_trips(
         self,
         dates: list[datetime, datetime] = None,
@@ -105,8 +208,14 @@ class Trips:
         if type(location) == int:
             location = [location]
 
-        session = sessionmaker(bind=self.engine)()
-        query = session.query(RoundTrips, RoundTripSegments, AllowedStarts.address)
+        query = select(
+            *(RoundTrips.__table__.c[column] for column in TRIP_COLUMNS),
+            AllowedStarts.address,
+            RoundTripSegments.id.label("segment_id"),
+            RoundTripSegments.start_time.label("segment_start_time"),
+            RoundTripSegments.end_time.label("segment_end_time"),
+            RoundTripSegments.distance.label("segment_distance"),
+        )
         if vehicles:
             query = query.filter(RoundTrips.car_id.in_(vehicles))
         if location:
@@ -124,34 +233,19 @@ class Trips:
             AllowedStarts, AllowedStarts.id == RoundTrips.start_location_id
         )
 
-        result_dict = {}
-        for roundtrip, segment, address in query.all():
-            id_ = roundtrip.id
-            if id_ not in result_dict:
-                record = {
-                    key: value
-                    for key, value in roundtrip.__dict__.items()
-                    if key[0] != "_"
-                }
-                record["address"] = address
-                record["trip_segments"] = []
-                result_dict[id_] = record
-            if segment:
-                result_dict[id_]["trip_segments"].append(
-                    {
-                        "start_time": segment.start_time,
-                        "end_time": segment.end_time,
-                        "distance": segment.distance,
-                    }
-                )
-        if not result_dict:
-            return pd.DataFrame()
-        return (
-            pd.DataFrame(list(result_dict.values()))
-            .sort_values(["start_time"])
-            .reset_index()
-            .iloc[:, 1:]
-        )
+        with self.engine.connect() as connection:
+            result = connection.execute(
+                query.execution_options(yield_per=LOAD_TRIPS_BATCH)
+            )
+            columns = list(result.keys())
+            # reduce each partition as it arrives, so only one partition of the joined rows is held at a time
+            reducer = _TripReducer()
+            for partition in result.partitions():
+                reducer.add(pd.DataFrame(partition, columns=columns))
+        trips = reducer.result()
+        if len(trips) == 0:
+            return trips
+        return trips.sort_values(["start_time"]).reset_index().iloc[:, 1:]
 
     def set_assignment(self):
         """
@@ -173,26 +267,33 @@ class Trips:
         for i, r in self.trips.iterrows():
             yield r
 
-    def _timestamp_to_timeslot(self, timestamp):
+    def _timestamps_to_timeslots(self, timestamps):
         """
-        TODO: checkout this for a speed up: https://stackoverflow.com/questions/56796775/is-there-an-equivalent-to-numpy-digitize-that-works-on-an-pandas-intervalindex
+        Maps all the timestamps to their timeslot in one searchsorted pass over the int64 epoch representation of the
+        timeslot start times.
 
         Parameters
         ----------
-        timestamp : timestamp to be mapped to a timeslot
+        timestamps : pandas Series of timestamps to be mapped to a timeslot
 
         Returns
         -------
-        i : timeslot index as int. If None is returned the timestamp is outside the timeslots.
+        slots : numpy array of timeslot indexes. If any timestamp is outside the timeslots its slot is NaN.
         """
-
-        time_indexes = np.nonzero(
-            np.logical_and(
-                self.timestamps.start_time <= timestamp,
-                self.timestamps.end_time > timestamp,
-            )
+        slot_starts = self.timestamps.start_time.values.astype("datetime64[ns]").view(
+            np.int64
+        )
+        slot_ends = self.timestamps.end_time.values.astype("datetime64[ns]").view(
+            np.int64
+        )
+        epochs = (
+            pd.to_datetime(timestamps).values.astype("datetime64[ns]").view(np.int64)
         )
-        return time_indexes[0] if len(time_indexes) > 0 else None
+        slots = np.searchsorted(slot_starts, epochs, side="right") - 1
+        inside = (slots >= 0) & (epochs < slot_ends[np.clip(slots, 0, None)])
+        if inside.all():
+            return slots
+        return np.where(inside, slots, np.nan)
 
     def set_timestamps(self, timestamps):
         """
@@ -203,16 +304,8 @@ class Trips:
         timestamps : pandas PeriodIndex
         """
         self.timestamps = timestamps
-        start_slot = []
-        end_slot = []
-        x = 0
-        for i, roundtrip in enumerate(self.__iter__()):
-            x += 1
-            start_slot.append(self._timestamp_to_timeslot(roundtrip.start_time))
-            end_slot.append(self._timestamp_to_timeslot(roundtrip.end_time))
-
-        self.trips["start_slot"] = start_slot
-        self.trips["end_slot"] = end_slot
+        self.trips["start_slot"] = self._timestamps_to_timeslots(self.trips.start_time)
+        self.trips["end_slot"] = self._timestamps_to_timeslots(self.trips.end_time)
 
     def set_filtered_trips(self):
         """
@@ -225,6 +318,153 @@ class Trips:
             self.trips.distance.max(),
         )
 
+    def trip_store(self):
+        """Columnar representation of the trips to be used in the simulation loop"""
+        return TripStore(self.trips)
+
+
+class TripStore:
+    """
+    Columnar, array backed store of the trips for the hot loop of the simulation.
+
+    The properties the vehicles use for booking are extracted once as NumPy arrays and lists. Iterating the store
+    yields a light TripView pr. trip instead of the pandas Series that DataFrame.iterrows builds for every trip.
+
+    Parameters
+    ----------
+    trips : pandas DataFrame with the trips of the simulation, i.e. Trips.trips
+
+    Attributes
+    ----------
+    start_time, end_time : arrays of datetime objects with start and end time of the trips
+    distance, kmh : float arrays with the distance and the km/h of the trips
+    trip_segments : list with the segments of each trip, if the trips have segments
+    """
+
+    def __init__(self, trips: pd.DataFrame):
+        n = len(trips)
+        # datetime objects since the vehicles do datetime arithmetic on them
+        self.start_time = pd.DatetimeIndex(trips.start_time).to_pydatetime()
+        self.end_time = pd.DatetimeIndex(trips.end_time).to_pydatetime()
+        # distances are kept in float64 so that the milage book-keeping of the vehicles is unchanged
+        self.distance = trips.distance.to_numpy(dtype=np.float64)
+        self.kmh = (
+            trips["km/h"].to_numpy(dtype=np.float64)
+            if "km/h" in trips.columns
+            else np.full((n,), np.nan)
+        )
+        self.tripid = trips.tripid.tolist() if "tripid" in trips.columns else n * [None]
+        self.car_id = (
+            trips.car_id.tolist() if "car_id" in trips.columns else n * [None]
+        )
+        self.start_slot = (
+            trips.start_slot.tolist() if "start_slot" in trips.columns else n * [None]
+        )
+        self.end_slot = (
+            trips.end_slot.tolist() if "end_slot" in trips.columns else n * [None]
+        )
+
+        # the segments are handed to the vehicles by reference since they are only needed for the few trips that
+        # exceed the milage or sleep rules of an electric car
+        self.has_segments = "trip_segments" in trips.columns
+        self.trip_segments = trips.trip_segments.tolist() if self.has_segments else []
+
+        self.views = [
+            TripView(
+                self,
+                k,
+                start_time,
+                end_time,
+                distance,
+                kmh,
+                tripid,
+                car_id,
+                start_slot,
+                end_slot,
+            )
+            for k, (
+                start_time,
+                end_time,
+                distance,
+                kmh,
+                tripid,
+                car_id,
+                start_slot,
+                end_slot,
+            ) in enumerate(
+                zip(
+                    self.start_time,
+                    self.end_time,
+                    self.distance.tolist(),
+                    self.kmh.tolist(),
+                    self.tripid,
+                    self.car_id,
+                    self.start_slot,
+                    self.end_slot,
+                )
+            )
+        ]
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        yield from self.views
+
+
+class TripView:
+    """
+    Light view of a single trip in a TripStore. Exposes the attributes the vehicles use when booking.
+    """
+
+    __slots__ = (
+        "store",
+        "index",
+        "start_time",
+        "end_time",
+        "distance",
+        "kmh",
+        "tripid",
+        "car_id",
+        "start_slot",
+        "end_slot",
+    )
+
+    def __init__(
+        self,
+        store,
+        index,
+        start_time,
+        end_time,
+        distance,
+        kmh,
+        tripid,
+        car_id,
+        start_slot,
+        end_slot,
+    ):
+        self.store = store
+        self.index = index
+        self.start_time = start_time
+        self.end_time = end_time
+        self.distance = distance
+        self.kmh = kmh
+        self.tripid = tripid
+        self.car_id = car_id
+        self.start_slot = start_slot
+        self.end_slot = end_slot
+
+    @property
+    def trip_segments(self):
+        if not self.store.has_segments:
+            raise AttributeError("trip_segments")
+        return self.store.trip_segments[self.index]
+
+    def __getitem__(self, key):
+        if key == "km/h":
+            return self.kmh
+        return getattr(self, key)
+
 
 class ConsequenceCalculator:
     """
@@ -588,10 +828,10 @@ class FleetManager:
             self.vehicle_factory, name="current", settings=settings
         )
 
-    def set_timestamps(self, ts):
+    def set_timestamps(self, ts, intervals=False):
         """Set timestamps of fleets"""
-        self.simulation_fleet.set_timestamps(ts)
-        self.current_fleet.set_timestamps(ts)
+        self.simulation_fleet.set_timestamps(ts, intervals=intervals)
+        self.current_fleet.set_timestamps(ts, intervals=intervals)
 
 
 class Simulation:
@@ -607,6 +847,13 @@ class Simulation:
                 simulated, and not the current.
     intelligent_simulation  :   bool - should intelligent simulation be used, i.e. Qampo algorithm to allocate trips.
     timestamp_set   :   bool -  whether the simulation trips already have generated timeslots
+    timeslots   :   bool or str - how the vehicles book-keep their bookings. True books on an array with a slot pr.
+                    minute of the simulated period, "intervals" books on sorted, disjoint intervals of the same slots
+                    (vehicle.BookedIntervals), which gives the same result at a fraction of the memory on long periods.
+                    False only compares with the end time of the latest booking of the vehicle.
+    executor    :   Executor - solves the days of the intelligent simulation concurrently, e.g. from
+                    parallel.create_executor. The caller owns it, so one pool serves many simulations. None solves
+                    the days serially.
 
     """
 
@@ -619,12 +866,15 @@ class Simulation:
         intelligent_simulation=False,
         timestamps_set=False,
         timeslots=True,
+        executor: Executor = None,
     ):
         self.trips = trips
         self.fleet_manager = fleet_manager
+        self.executor = executor
         self.progress_callback = progress_callback
         self.tabu = tabu
         self.timeslots = timeslots
+        self.interval_booking = timeslots == "intervals"
         self.timestamps_set = timestamps_set
 
         self.useQampo = intelligent_simulation
@@ -645,7 +895,9 @@ class Simulation:
         """Runs simulation of current and simulation fleet"""
         # push timetable to vehicle fleet
         if self.timeslots:
-            self.fleet_manager.set_timestamps(self.timestamps)
+            self.fleet_manager.set_timestamps(
+                self.timestamps, intervals=self.interval_booking
+            )
 
         if self.useQampo:
             if self.tabu:
@@ -685,7 +937,7 @@ class Simulation:
 
         bike_fleet = fleet_inventory.copy_bike_fleet("bike_fleet")
         if self.timestamps_set is False and self.timeslots:
-            bike_fleet.set_timestamps(self.timestamps)
+            bike_fleet.set_timestamps(self.timestamps, intervals=self.interval_booking)
         self.run_single(bike_fleet)
 
         def set_start_times(trip):
@@ -726,34 +978,86 @@ class Simulation:
         # we're bookkeeping outside the qampo algorithm the long duration trips since it's not capable of handling
         # multiday trips. We check if a vehicle has been book for the long "original" trip, if so, we leave it out
         # of the fleet until then end of the day of the original end date.
-        ongoing_multiday_trips = []
-        response = []
-        for trips_single_day in trips_pr_day:
-            ongoing_multiday_trips = [
-                trip
-                for trip in ongoing_multiday_trips
-                if (trip["trip"]["original_end_time"] + a_day_delta).normalize()
-                > trips_single_day[0]["start_time"]
-            ]  # find the trips that are still "going on" to get the vehicle id of the ones that should be skipped
+        response = self.optimise_days(fleet_inventory, trips_pr_day)
+
+        # Booking vehicles in accordance to the result from qampo api
+        vehicles = {}
+        for v in fleet_inventory:
+            vehicles.setdefault(int(v.vehicle_id), v)
+        trips = {t.tripid: t for t in self.trips.trip_store()}
+        # the trips not allocated by qampo keep the booking of the bike fleet
+        trip_vehicle = self.trips.trips.bike_fleet.tolist()
+        trip_vehicle_type = self.trips.trips.bike_fleet_type.tolist()
+        for content in response:
+            for assignment in content.assignments:
+                v = vehicles[assignment.vehicle.id]
+                for t in assignment.route.trips:
+                    trip = trips[t.id]
+                    v.book_trip(trip, self.timeslots)
+                    trip_vehicle[trip.index] = v
+                    trip_vehicle_type[trip.index] = v.vehicle_type_number
+
+        self.trips.trips[fleet_inventory.name] = trip_vehicle
+        self.trips.trips[fleet_inventory.name + "_type"] = trip_vehicle_type
+
+    def optimise_days(self, fleet_inventory, trips_pr_day):
+        """Runs the qampo optimisation of every day. A day only depends on the earlier days with multiday trips that
+        are still going on, since the vehicles booked for those are left out of its fleet. The days that are not
+        waiting for such a day are solved concurrently on the executor of the simulation, if it has one. Days solved
+        by an earlier simulation are read from the route plan cache.
+
+        parameters
+        ----------
+        fleet_inventory : fleet inventory to run simualtion on. Type model.FleetInventory.
+        trips_pr_day : list of the trips of each day, sorted on the day.
+
+        returns
+        -------
+        list of the qampo route plan of each day
+        """
+        a_day_delta = datetime.timedelta(days=1)
+        multiday_pr_day = [
+            list(filter(lambda trip: trip["multiday"], trips_single_day))
+            for trips_single_day in trips_pr_day
+        ]
+
+        def is_ongoing(trip, trips_single_day):
+            return (
+                trip["original_end_time"] + a_day_delta
+            ).normalize() > trips_single_day[0]["start_time"]
+
+        waits_for = [
+            [
+                j
+                for j in range(k)
+                if any(is_ongoing(trip, trips_single_day) for trip in multiday_pr_day[j])
+            ]
+            for k, trips_single_day in enumerate(trips_pr_day)
+        ]
+        booked_multiday_trips = [[] for _ in trips_pr_day]
+        response = [None] * len(trips_pr_day)
+
+        def prepare(k):
+            # find the trips that are still "going on" to get the vehicle id of the ones that should be skipped
             vehicles_on_long_duration_trips = [
-                int(trip["vehicle"]) for trip in ongoing_multiday_trips
+                int(trip["vehicle"])
+                for j in waits_for[k]
+                for trip in booked_multiday_trips[j]
+                if is_ongoing(trip["trip"], trips_pr_day[k])
             ]
             data = self.generate_qampo_data(
                 fleet_inventory,
-                trips_single_day,
+                trips_pr_day[k],
                 skip_vehicles=vehicles_on_long_duration_trips,
             )
             fleet = qampo_fleet(**data["fleet"])
             trips = list(map(lambda T: qampo_trip(**T), data["trips"]))
+            return fleet, trips, AlgorithmType.EXACT_MIP
 
-            simulation = qampo_simulation.optimize_single_day(
-                fleet, trips, AlgorithmType.EXACT_MIP
-            )
-
-            # is any of today's trips spanning multiple days?
-            multiday_trips = list(
-                filter(lambda trip: trip["multiday"], trips_single_day)
-            )
+        def record(k, simulation):
+            response[k] = simulation
+            # is any of the day's trips spanning multiple days?
+            multiday_trips = multiday_pr_day[k]
             if any(multiday_trips):
                 # find the ids of the relevant trips
                 multiday_trips_ids = list(
@@ -762,7 +1066,7 @@ class Simulation:
 
                 # check if any multiday trip was booked
                 # get the information if the trips have been booked in the simulation
-                booked_multiday_trips = [
+                booked_multiday_trips[k] = [
                     {
                         "vehicle": assignment.vehicle.id,
                         "trip": next(
@@ -776,30 +1080,53 @@ class Simulation:
                     for trip in assignment.route.trips
                     if trip.id in multiday_trips_ids
                 ]
-                ongoing_multiday_trips += booked_multiday_trips
 
-            response.append(simulation)
-
-        # Booking vehicles in accordance to the result from qampo api
-        trip_vehicle = [[]] * len(self.trips.trips)
-        trip_vehicle_type = [[]] * len(self.trips.trips)
-        for content in response:
-            for assignment in content.assignments:
-                id = assignment.vehicle.id
-                v = next(filter(lambda v: v.vehicle_id == id, fleet_inventory))
-                for t in assignment.route.trips:
-                    trip = next(filter(lambda tt: tt["tripid"] == t.id, self.trips))
-                    v.book_trip(trip, self.timeslots)
-                    trip_vehicle[trip.name] = v
-                    trip_vehicle_type[trip.name] = v.vehicle_type_number
-
-        for k in range(len(trip_vehicle)):
-            if type(trip_vehicle[k]) is list:
-                trip_vehicle[k] = self.trips.trips.bike_fleet[k]
-                trip_vehicle_type[k] = self.trips.trips.bike_fleet_type[k]
-
-        self.trips.trips[fleet_inventory.name] = trip_vehicle
-        self.trips.trips[fleet_inventory.name + "_type"] = trip_vehicle_type
+        def lookup(k):
+            # identical days of repeated simulations are read from the route plan cache instead of solved
+            problem = prepare(k)
+            key = route_plan_cache_key(*problem)
+            return problem, key, get_cached_route_plan(key)
+
+        executor = self.executor
+        if executor is None or len(trips_pr_day) <= 1:
+            for k in range(len(trips_pr_day)):
+                problem, key, simulation = lookup(k)
+                if simulation is None:
+                    simulation = qampo_simulation.optimize_single_day(*problem)
+                    set_cached_route_plan(key, simulation)
+                record(k, simulation)
+            return response
+
+        try:
+            waiting = list(range(len(trips_pr_day)))
+            solved = set()
+            pending = {}
+            while waiting or pending:
+                ready = [k for k in waiting if solved.issuperset(waits_for[k])]
+                for k in ready:
+                    waiting.remove(k)
+                    problem, key, simulation = lookup(k)
+                    if simulation is not None:
+                        # solved by an earlier simulation, the days waiting for it are ready next round
+                        record(k, simulation)
+                        solved.add(k)
+                        continue
+                    pending[
+                        executor.submit(qampo_simulation.optimize_single_day, *problem)
+                    ] = (k, key)
+                if not pending:
+                    continue
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    k, key = pending.pop(future)
+                    simulation = future.result()
+                    set_cached_route_plan(key, simulation)
+                    record(k, simulation)
+                    solved.add(k)
+        finally:
+            for future in pending:
+                future.cancel()
+        return response
 
     def generate_qampo_data(self, fleet_inventory, trips, skip_vehicles=None):
         """Convenience function for converting fleet inventory and trips data to json format
@@ -872,22 +1199,20 @@ class Simulation:
         trip_vehicle = []
         trip_vehicle_type = []
         flagged = []
-        for t in self.trips:
+        for t in self.trips.trip_store():
             booked_real = False
             if fleet_inventory.name == "current":
                 # overwrites the simulated booking to reflect "reality"
-                if any([str(a.id) == str(t.car_id) for a in fleet_inventory]):
-                    for v in fleet_inventory:
-                        if str(v.id) == str(t.car_id):
-                            booked, acc, avail = v.bypass_book(
-                                t, self.timeslots
-                            )  # v.book_trip(t)
-
-                            if booked:
-                                trip_vehicle.append(v)
-                                trip_vehicle_type.append(v.vehicle_type_number)
-                                booked_real = True
-                                break
+                v = fleet_inventory.vehicle_index.get(str(t.car_id))
+                if v is not None:
+                    booked, acc, avail = v.bypass_book(
+                        t, self.timeslots
+                    )  # v.book_trip(t)
+
+                    if booked:
+                        trip_vehicle.append(v)
+                        trip_vehicle_type.append(v.vehicle_type_number)
+                        booked_real = True
                 else:
                     # the car that drove the trip in real life is not part of the selected "current" fleet.
                     if t.car_id not in flagged:
@@ -1066,16 +1391,20 @@ class Model:
         bike_percentage :   how many percentage of the trips that qualifies for bike trip should be accepted
         km_aar  :   bool - should the vehicles associated km_aar constrain the vehicle from accepting trips when the
                         yearly capacity is reached. Only available on intelligent_simulation = False
+        use_timeslots   :   bool or str - passed as timeslots to the simulation object, use "intervals" for interval
+                        based booking on long periods
 
         """
         if bike_time_slots is None:
             bike_time_slots = []
+        executor = create_executor() if intelligent_simulation else None
         self.simulation = Simulation(
             self.trips,
             self.fleet_manager,
             self._update_progress,
             intelligent_simulation=intelligent_simulation,
             timeslots=use_timeslots,
+            executor=executor,
         )
 
         Bike.max_distance_pr_trip = bike_max_distance
@@ -1102,7 +1431,12 @@ class Model:
             km_aar, sub_time=self.sub_time, settings=self.settings, days=days
         )
 
-        self.simulation.run()
+        try:
+            self.simulation.run()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self.simulation.executor = None
 
         # update data sources for frontend
         self.compute_histogram()
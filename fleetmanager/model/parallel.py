@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+# set in the workers of the executors from create_executor, which run their work serially
+_worker = threading.local()
+
+
+def get_worker_count(workers: int = None) -> int:
+    """
+    Number of workers to use for parallel simulation work. Defaults to the SIMULATION_WORKERS environment variable
+    and falls back to the number of cores.
+    """
+    if workers is None:
+        workers = int(os.getenv("SIMULATION_WORKERS", os.cpu_count() or 1))
+    return max(1, workers)
+
+
+def in_worker() -> bool:
+    """Whether the caller runs in a worker of an executor from create_executor"""
+    return getattr(_worker, "active", False)
+
+
+def _init_worker(initializer: Callable = None, initargs: tuple = ()):
+    _worker.active = True
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def create_executor(
+    workers: int = None,
+    kind: str = "process",
+    allow_threads: bool = True,
+    initializer: Callable = None,
+    initargs: tuple = (),
+) -> Executor | None:
+    """
+    Creates the executor used to fan out independent simulation work. No executor is created in the workers of
+    another executor, so nested simulation work runs serially instead of multiplying the processes.
+
+    Parameters
+    ----------
+    workers :   int, number of workers. Defaults to get_worker_count()
+    kind    :   str, "process" or "thread"
+    allow_threads   :   bool, whether a process pool may fall back to threads. Pass False for pure python work that
+                        does not gain from threads, None is then returned where processes can not be started
+    initializer :   callable run once in every worker with initargs, e.g. to hand the workers data they all share
+    initargs    :   tuple, arguments of the initializer
+
+    Returns
+    -------
+    executor    :   concurrent.futures.Executor or None if only one worker is available or the caller is a worker
+                    itself, in which case the caller should run serially. The processes are spawned, so the work and
+                    the initializer have to be importable
+    """
+    workers = get_worker_count(workers)
+    if workers == 1 or in_worker():
+        return None
+    if kind == "process" and multiprocessing.current_process().daemon:
+        # daemonic processes, e.g. the prefork workers of celery, are not allowed to have children
+        if not allow_threads:
+            return None
+        kind = "thread"
+    if kind == "process":
+        # spawn, since the threaded celery workers would fork with the locks held by their other threads
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(initializer, initargs),
+        )
+    return ThreadPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(initializer, initargs)
+    )
@@ -160,6 +160,9 @@ class AlgorithmParameters(BaseModel):
     time_limit_in_seconds: Optional[int]
     """Defines for how long, an algorithm is allowed to be run."""
 
+    warm_start: Optional[bool] = False
+    """Whether the exact algorithms start from the solution of the greedy algorithm."""
+
 
 class RoutingAlgorithm(ABC):
     """An ABC for doing a single day routing assignment."""
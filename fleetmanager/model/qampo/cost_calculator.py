@@ -1,5 +1,5 @@
 """ This file defines functions for calculating the CO2 emission and costs for a route plan."""
-from .classes import BaseVehicle, Trip
+from .classes import BaseVehicle, RoutePlan, Trip
 
 
 def calculate_total_length_of_trips(trips: list[Trip]) -> float:
@@ -33,3 +33,13 @@ def calculate_co2_emission_cost_per_kilometer_for_vehicle(
 ) -> float:
     """Calculates the CO2 emission cost per kilometer for a given vehicle."""
     return vehicle.co2_emission_gram_per_kilometer * emission_cost_per_ton_co2 / 1000000
+
+
+def calculate_weighted_cost_of_route_plan(
+    route_plan: RoutePlan, emission_cost_per_ton_co2: float
+) -> float:
+    """Calculates the variable cost plus the CO2 emission cost of a route plan, i.e. the objective of the algorithms."""
+    return (
+        route_plan.total_cost
+        + route_plan.total_co2_emission_in_tons * emission_cost_per_ton_co2
+    )
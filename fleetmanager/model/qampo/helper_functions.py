@@ -1,8 +1,9 @@
 """ This file defines various helper functions used throughout the code."""
 
 import copy
+from typing import Optional
 
-from .classes import BaseVehicle
+from .classes import BaseVehicle, RoutePlan, Trip, Vehicle
 from .cost_calculator import calculate_co2_emission_cost_per_kilometer_for_vehicle
 
 
@@ -29,3 +30,55 @@ def prioritize_vehicles_according_to_weighted_variable_costs(
     )
 
     return vehicles_sorted
+
+
+def find_overlapping_trip_groups(trips: list[Trip]) -> list[list[Trip]]:
+    """
+    Finds the maximal groups of trips that overlap in time with a sweep line over the trips sorted by start time.
+    Two trips overlap if max(start_time) < min(end_time), so a trip may start at the time another ends. Every pair of
+    overlapping trips is part of at least one group, and all trips in a group overlap each other, hence a vehicle can
+    serve at most one trip from each group.
+    :param trips: Trips to group.
+    :return: List of groups with more than one trip.
+    """
+    groups = []
+    active = []
+    # Whether a trip has joined the active trips since the last group was recorded.
+    grown = False
+
+    # Trips without a duration do not overlap any trip.
+    for trip in sorted(
+        (trip for trip in trips if trip.start_time < trip.end_time),
+        key=lambda trip: trip.start_time,
+    ):
+        still_active = [other for other in active if trip.start_time < other.end_time]
+        if len(still_active) < len(active):
+            # Trips leave the sweep, so the active trips before this point form a maximal group.
+            if grown and len(active) > 1:
+                groups.append(active)
+            grown = False
+        active = still_active + [trip]
+        grown = True
+
+    if grown and len(active) > 1:
+        groups.append(active)
+
+    return groups
+
+
+def vehicle_ids_from_route_plan(route_plan: RoutePlan) -> dict[Trip, Optional[int]]:
+    """
+    Maps each trip of a route plan to the id of the vehicle serving it. Used to hint the exact algorithms with a solution.
+    :param route_plan: Route plan, e.g. from the greedy algorithm.
+    :return: Dictionary with the trips as keys and the vehicle id as value. The value is None for the employee car.
+    """
+    vehicle_ids = {}
+    for assignment in route_plan.assignments:
+        for trip in assignment.route.trips:
+            vehicle_ids[trip] = (
+                assignment.vehicle.id if isinstance(assignment.vehicle, Vehicle) else None
+            )
+    if route_plan.employee_car is not None:
+        for trip in route_plan.employee_car.route.trips:
+            vehicle_ids[trip] = None
+    return vehicle_ids
@@ -10,10 +10,8 @@ import uvicorn
 import yaml
 from fastapi import FastAPI, HTTPException
 
+from . import qampo_simulation
 from .classes import AlgorithmParameters, AlgorithmType, Fleet, Trip
-from .routing_cp import RoutingCp
-from .routing_greedy import RoutingGreedy
-from .routing_mip import RoutingMip
 
 description = """
 This service holds a number of endpoints used for optimization in the IFFK project. The idea is that the service can be applied to any project, and not to a specific one.
@@ -35,36 +33,13 @@ async def optimize_single_day(
         time_limit_in_seconds=60
     ),
 ):
-    if algorithm_type is AlgorithmType.GREEDY:
-        return RoutingGreedy().optimize_single_day(
-            trips, fleet.vehicles, fleet.employee_car, fleet.emission_cost_per_ton_co2
-        )
-    elif algorithm_type is AlgorithmType.EXACT_MIP:
-        return RoutingMip().optimize_single_day(
-            trips,
-            fleet.vehicles,
-            fleet.employee_car,
-            fleet.emission_cost_per_ton_co2,
-            algorithm_parameters.time_limit_in_seconds,
-        )
-    elif algorithm_type is AlgorithmType.EXACT_CP:
-        return RoutingCp().optimize_single_day(
-            trips,
-            fleet.vehicles,
-            fleet.employee_car,
-            fleet.emission_cost_per_ton_co2,
-            algorithm_parameters.time_limit_in_seconds,
+    try:
+        return qampo_simulation.optimize_single_day(
+            fleet, trips, algorithm_type, algorithm_parameters
         )
     # Unsupported algorithm type.
-    else:
-        supported_algorithms = str.join(
-            ", ", [algorithm.value for algorithm in AlgorithmType]
-        )
-        details = (
-            f"Algorithm type is not supported. Supported types: {supported_algorithms}"
-        )
-
-        raise HTTPException(status_code=400, detail=details)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 if __name__ == "__main__":
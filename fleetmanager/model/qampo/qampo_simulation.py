@@ -1,10 +1,16 @@
+import logging
 from typing import Optional
 
-from .classes import AlgorithmParameters, AlgorithmType, Fleet, Trip
+from .classes import AlgorithmParameters, AlgorithmType, Fleet, RoutePlan, Trip
+from .cost_calculator import calculate_weighted_cost_of_route_plan
+from .exceptions import NoSolutionFoundException
 from .routing_cp import RoutingCp
 from .routing_greedy import RoutingGreedy
 from .routing_mip import RoutingMip
 
+# Initialize logger.
+log = logging.getLogger(__name__)
+
 
 def optimize_single_day(
     fleet: Fleet,
@@ -18,22 +24,26 @@ def optimize_single_day(
         return RoutingGreedy().optimize_single_day(
             trips, fleet.vehicles, fleet.employee_car, fleet.emission_cost_per_ton_co2
         )
-    elif algorithm_type is AlgorithmType.EXACT_MIP:
-        return RoutingMip().optimize_single_day(
-            trips,
-            fleet.vehicles,
-            fleet.employee_car,
-            fleet.emission_cost_per_ton_co2,
-            algorithm_parameters.time_limit_in_seconds,
+    elif algorithm_type in (AlgorithmType.EXACT_MIP, AlgorithmType.EXACT_CP):
+        greedy_plan = None
+        if algorithm_parameters.warm_start:
+            greedy_plan = greedy_solution_hint(fleet, trips)
+
+        algorithm = (
+            RoutingMip() if algorithm_type is AlgorithmType.EXACT_MIP else RoutingCp()
         )
-    elif algorithm_type is AlgorithmType.EXACT_CP:
-        return RoutingCp().optimize_single_day(
+        route_plan = algorithm.optimize_single_day(
             trips,
             fleet.vehicles,
             fleet.employee_car,
             fleet.emission_cost_per_ton_co2,
             algorithm_parameters.time_limit_in_seconds,
+            solution_hint=greedy_plan,
         )
+
+        if greedy_plan is not None:
+            log_greedy_gap(greedy_plan, route_plan, fleet.emission_cost_per_ton_co2)
+        return route_plan
     # Unsupported algorithm type.
     else:
         supported_algorithms = str.join(
@@ -44,3 +54,35 @@ def optimize_single_day(
         )
 
         raise ValueError(details)
+
+
+def greedy_solution_hint(fleet: Fleet, trips: list[Trip]) -> Optional[RoutePlan]:
+    """
+    Runs the greedy algorithm to get a route plan the exact algorithms can start from.
+    :param fleet: Fleet to assign the trips to.
+    :param trips: Trips of the day.
+    :return: Greedy route plan, or None if the greedy algorithm did not find a solution.
+    """
+    try:
+        return RoutingGreedy().optimize_single_day(
+            trips, fleet.vehicles, fleet.employee_car, fleet.emission_cost_per_ton_co2
+        )
+    except NoSolutionFoundException:
+        log.info("The greedy algorithm found no solution to warm start from.")
+        return None
+
+
+def log_greedy_gap(
+    greedy_plan: RoutePlan, route_plan: RoutePlan, emission_cost_per_ton_co2: float
+):
+    """Logs how much the exact algorithm improved on the greedy route plan it was started from."""
+    greedy_cost = calculate_weighted_cost_of_route_plan(
+        greedy_plan, emission_cost_per_ton_co2
+    )
+    exact_cost = calculate_weighted_cost_of_route_plan(
+        route_plan, emission_cost_per_ton_co2
+    )
+    gap = (greedy_cost - exact_cost) / greedy_cost if greedy_cost else 0.0
+    log.info(
+        f"Greedy objective was {greedy_cost}, exact objective was {exact_cost}. Gap: {gap:.2%}."
+    )
@@ -1,12 +1,17 @@
 """ This file contains code, that optimizes a single day routing given a fixed fleet in an optimal manner using the Constraint programming solver from ortools."""
 
 import logging
+from typing import Optional
 
 from ortools.sat.python import cp_model
 
 from .classes import BaseVehicle, RoutePlan, RoutingAlgorithm, Trip, Vehicle
 from .cost_calculator import calculate_co2_emission_cost_per_kilometer_for_vehicle
 from .exceptions import NoSolutionFoundException
+from .helper_functions import (
+    find_overlapping_trip_groups,
+    vehicle_ids_from_route_plan,
+)
 from .routeplan_factory import route_plan_from_vehicle_trip_map
 from .validation import check_trips_only_has_single_date
 
@@ -25,6 +30,7 @@ class RoutingCp(RoutingAlgorithm):
         employee_car: BaseVehicle,
         emission_cost_per_ton_co2: float = 1500,
         time_limit_in_seconds: int = 60,
+        solution_hint: Optional[RoutePlan] = None,
     ) -> RoutePlan:
         """
         This is an exact SAT algorithm that assigns trips to vehicles based on a weight of the variable cost per kilometer and the CO2 emission. time_limit_in_seconds specifies for how long, the algorithm is allowed to be run.
@@ -33,6 +39,7 @@ class RoutingCp(RoutingAlgorithm):
         :param employee_car: Employee car a trip can be assigned to.
         :param emission_cost_per_ton_co2: CO2 emission cost per ton for the entire route plan.
         :param time_limit_in_seconds: Time limit for the running time of the algorithm.
+        :param solution_hint: Route plan, e.g. from the greedy algorithm, the solver starts searching from.
         :return Routing plan created after optimization has been performed.
         """
 
@@ -68,24 +75,10 @@ class RoutingCp(RoutingAlgorithm):
         log.debug("Created variables for employee car.")
 
         # Create constraints to ensure that a vehicle cannot serve overlapping trips.
-        for first_trip in trips:
-            for second_trip in trips:
-                # Do nothing if the trips are the same.
-                if first_trip == second_trip:
-                    continue
-
-                # Check if the two trips overlap in time.
-                # See https://stackoverflow.com/questions/325933/determine-whether-two-date-ranges-overlap
-                if max(first_trip.start_time, second_trip.start_time) < min(
-                    first_trip.end_time, second_trip.end_time
-                ):
-                    # Overlap and add a constraint for each normal vehicle.
-                    for vehicle in vehicles:
-                        model.Add(
-                            vehicles_var.get((vehicle, first_trip))
-                            + vehicles_var.get((vehicle, second_trip))
-                            <= 1
-                        )
+        # Each group of mutually overlapping trips gives a single constraint pr. vehicle instead of one pr. pair of trips.
+        for group in find_overlapping_trip_groups(trips):
+            for vehicle in vehicles:
+                model.AddAtMostOne(vehicles_var.get((vehicle, trip)) for trip in group)
 
         log.debug(
             "Created constraints to ensure that overlapping trips are not assigned to the same vehicle."
@@ -159,6 +152,19 @@ class RoutingCp(RoutingAlgorithm):
 
         log.debug("Created objective function.")
 
+        if solution_hint is not None:
+            # Hint every variable with its value in the hinted route plan.
+            vehicle_ids = vehicle_ids_from_route_plan(solution_hint)
+            for trip in trips:
+                model.AddHint(employee_car_var.get(trip), vehicle_ids.get(trip) is None)
+                for vehicle in vehicles:
+                    model.AddHint(
+                        vehicles_var.get((vehicle, trip)),
+                        vehicle_ids.get(trip) == vehicle.id,
+                    )
+
+            log.debug("Added solution hint.")
+
         log.info("About to solve the optimization problem using the SAT solver.")
 
         solver = cp_model.CpSolver()
@@ -2,12 +2,17 @@
 (utilizing SCIP)."""
 
 import logging
+from typing import Optional
 
 from ortools.linear_solver import pywraplp
 
 from .classes import BaseVehicle, RoutePlan, RoutingAlgorithm, Trip, Vehicle
 from .cost_calculator import calculate_co2_emission_cost_per_kilometer_for_vehicle
 from .exceptions import NoSolutionFoundException
+from .helper_functions import (
+    find_overlapping_trip_groups,
+    vehicle_ids_from_route_plan,
+)
 from .routeplan_factory import route_plan_from_vehicle_trip_map
 from .validation import check_trips_only_has_single_date
 
@@ -23,6 +28,7 @@ class RoutingMip(RoutingAlgorithm):
         employee_car: BaseVehicle,
         emission_cost_per_ton_co2: float = 1500,
         time_limit_in_seconds: int = 60,
+        solution_hint: Optional[RoutePlan] = None,
     ) -> RoutePlan:
         """
         An exact MIP algorithm that will assign trips to vehicles based on a weight of the variable cost per kilometer and the CO2 emission.
@@ -32,6 +38,7 @@ class RoutingMip(RoutingAlgorithm):
         :param employee_car: Employee car a trip can be assigned to.
         :param emission_cost_per_ton_co2: CO2 emission cost per ton for the entire route plan.
         :param time_limit_in_seconds: Time limit for the running time of the algorithm.
+        :param solution_hint: Route plan, e.g. from the greedy algorithm, the solver starts searching from.
         :return Routing plan created after optimization has been performed.
         """
 
@@ -67,24 +74,12 @@ class RoutingMip(RoutingAlgorithm):
         log.debug("Created variables for employee car.")
 
         # Create constraints to ensure, a vehicle cannot serve overlapping trips.
-        for first_trip in trips:
-            for second_trip in trips:
-                # Do nothing if the trips are the same.
-                if first_trip == second_trip:
-                    continue
-
-                # Check if the two trips overlap in time.
-                # See https://stackoverflow.com/questions/325933/determine-whether-two-date-ranges-overlap
-                if max(first_trip.start_time, second_trip.start_time) < min(
-                    first_trip.end_time, second_trip.end_time
-                ):
-                    # An overlap is found. Add a constraint for each normal vehicle.
-                    for vehicle in vehicles:
-                        solver.Add(
-                            vehicles_var.get((vehicle, first_trip))
-                            + vehicles_var.get((vehicle, second_trip))
-                            <= 1
-                        )
+        # Each group of mutually overlapping trips gives a single constraint pr. vehicle instead of one pr. pair of trips.
+        for group in find_overlapping_trip_groups(trips):
+            for vehicle in vehicles:
+                solver.Add(
+                    sum(vehicles_var.get((vehicle, trip)) for trip in group) <= 1
+                )
 
         log.debug(
             "Created constraints to ensure, overlapping trips are not assigned to the same vehicle."
@@ -157,6 +152,20 @@ class RoutingMip(RoutingAlgorithm):
 
         log.debug("Created objective function.")
 
+        if solution_hint is not None:
+            # Hint every variable with its value in the hinted route plan.
+            vehicle_ids = vehicle_ids_from_route_plan(solution_hint)
+            hint_variables, hint_values = [], []
+            for trip in trips:
+                hint_variables.append(employee_car_var.get(trip))
+                hint_values.append(float(vehicle_ids.get(trip) is None))
+                for vehicle in vehicles:
+                    hint_variables.append(vehicles_var.get((vehicle, trip)))
+                    hint_values.append(float(vehicle_ids.get(trip) == vehicle.id))
+            solver.SetHint(hint_variables, hint_values)
+
+            log.debug("Added solution hint.")
+
         log.info("About to solve the optimization problem using the MIP solver.")
 
         # This check is performed because 0 is treated as infinity in the C++ wrapper.
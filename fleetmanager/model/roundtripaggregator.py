@@ -1,15 +1,16 @@
 import json
-import math
 import operator
 import os
 from datetime import date, datetime, timedelta
 from typing import List, TypedDict, Callable, Union
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session, sessionmaker
 
 import numpy as np
 import pandas as pd
+from sklearn.neighbors import BallTree
 
-from fleetmanager.data_access import RoundTripSegments, RoundTrips, Cars
+from fleetmanager.data_access import RoundTripSegments, RoundTrips
 from fleetmanager.logging import logging
 
 logger = logging.getLogger(__name__)
@@ -50,10 +51,203 @@ start_location = TypedDict(
 
 start_locations = List[start_location]
 
+EARTH_RADIUS = 6371
+ROUNDTRIP_INSERT_BATCH = int(os.getenv("ROUNDTRIP_INSERT_BATCH", 1000))
+
+
+class StartLocationIndex:
+    """
+    Spatial index over the allowed starts, including their additions, for looking up the closest start of many
+    coordinates at once. A BallTree with the haversine metric is used, so the distances are the great-circle
+    distances of calc_distance.
+
+    Parameters
+    ----------
+    allowed_starts : list of start locations with 'id', 'latitude' and 'longitude'. Starts without coordinates are
+        left out.
+    """
+
+    def __init__(self, allowed_starts: start_locations):
+        starts = [
+            start
+            for start in allowed_starts
+            if not (pd.isna(start["latitude"]) or pd.isna(start["longitude"]))
+        ]
+        self.ids = np.array([start["id"] for start in starts])
+        self.tree = BallTree(
+            np.radians(
+                np.array(
+                    [[start["latitude"], start["longitude"]] for start in starts],
+                    dtype=float,
+                ).reshape(-1, 2)
+            ),
+            metric="haversine",
+        )
+
+    def closest(self, latitudes, longitudes) -> tuple[list, list[float]]:
+        """
+        Returns the id of and the distance in km to the closest start for each coordinate. Coordinates with a missing
+        latitude or longitude get id 0 and distance nan.
+        """
+        latitudes = np.asarray(latitudes, dtype=float).reshape(-1)
+        longitudes = np.asarray(longitudes, dtype=float).reshape(-1)
+        ids = np.zeros(len(latitudes), dtype=self.ids.dtype)
+        distances = np.full(len(latitudes), np.nan)
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        if valid.any():
+            distance, index = self.tree.query(
+                np.radians(np.column_stack((latitudes[valid], longitudes[valid]))), k=1
+            )
+            ids[valid] = self.ids[index[:, 0]]
+            distances[valid] = distance[:, 0] * EARTH_RADIUS
+        return ids.tolist(), distances.tolist()
+
+    def closest_within(self, latitudes, longitudes, radius: float | int) -> list:
+        """Returns the id of the closest start within the radius (km) of each coordinate, 0 if there is none"""
+        ids, distances = self.closest(latitudes, longitudes)
+        return [
+            start_id if distance < radius else 0
+            for start_id, distance in zip(ids, distances)
+        ]
+
+
+def as_start_index(
+    allowed_starts: start_locations | StartLocationIndex,
+) -> StartLocationIndex:
+    """Builds the index of the allowed starts, unless it is already built"""
+    if isinstance(allowed_starts, StartLocationIndex):
+        return allowed_starts
+    return StartLocationIndex(allowed_starts)
+
+
+class CarTripArrays:
+    """
+    Array representation of the trips of a car that the aggregation looks up for every log. The closest starts of the
+    start and end points of the logs do not depend on the home criteria, so process_car_roundtrips computes them once
+    and shares them between the aggregations of the different home criteria.
+
+    Parameters
+    ----------
+    car_trips : DataFrame with the trips of the car, in the order the aggregator iterates them
+    allowed_starts : list of start locations or the index of them
+    """
+
+    def __init__(
+        self,
+        car_trips: pd.DataFrame,
+        allowed_starts: start_locations | StartLocationIndex,
+    ):
+        self.start_index = as_start_index(allowed_starts)
+        self.positions = dict(zip(car_trips.index, range(len(car_trips))))
+        self.ids = car_trips.id.to_numpy()
+        self.start_times = _to_epoch_nanoseconds(car_trips.start_time)
+        self.end_times = _to_epoch_nanoseconds(car_trips.end_time)
+        self.start_latitudes = car_trips.start_latitude.to_numpy(dtype=float)
+        self.start_longitudes = car_trips.start_longitude.to_numpy(dtype=float)
+        self.distances = car_trips.distance.to_numpy(dtype=float)
+        self.closest_start_homes, self.closest_start_distances = self.start_index.closest(
+            self.start_latitudes, self.start_longitudes
+        )
+        self.closest_end_homes, self.closest_end_distances = self.start_index.closest(
+            car_trips.end_latitude, car_trips.end_longitude
+        )
+
+    def subset(self, mask: np.ndarray) -> "CarTripArrays":
+        """The arrays of the trips in the mask, i.e. of car_trips[mask]"""
+        subset = CarTripArrays.__new__(CarTripArrays)
+        subset.start_index = self.start_index
+        positions = np.flatnonzero(mask)
+        labels = list(self.positions)
+        subset.positions = {labels[k]: n for n, k in enumerate(positions)}
+        for name in [
+            "ids",
+            "start_times",
+            "end_times",
+            "start_latitudes",
+            "start_longitudes",
+            "distances",
+        ]:
+            setattr(subset, name, getattr(self, name)[mask])
+        for name in [
+            "closest_start_homes",
+            "closest_start_distances",
+            "closest_end_homes",
+            "closest_end_distances",
+        ]:
+            values = getattr(self, name)
+            setattr(subset, name, [values[k] for k in positions])
+        return subset
+
+    def trips_with_ids(self, ids: list[int]) -> np.ndarray:
+        """Mask of the trips with the ids"""
+        return np.isin(self.ids, ids)
+
+    def window(self, start_time: datetime, duration: timedelta) -> np.ndarray:
+        """Mask of the trips that start after start_time and end within the duration"""
+        start = pd.Timestamp(start_time).value
+        return (self.start_times >= start) & (
+            self.end_times <= start + pd.Timedelta(duration).value
+        )
+
+    def locations_frequency(
+        self, mask: np.ndarray, home_criteria: float | int
+    ) -> dict[int, int]:
+        """locations_frequency of the trips in the mask"""
+        closest_location_list = [
+            start_home if distance < home_criteria else 0
+            for start_home, distance, in_window in zip(
+                self.closest_start_homes, self.closest_start_distances, mask
+            )
+            if in_window
+        ]
+        return _count_locations(closest_location_list)
+
+    def stays_within_vicinity(
+        self,
+        home_coordinates: tuple[float, float],
+        start_time: datetime,
+        delta_time: timedelta,
+        radius: int = 5,
+    ):
+        """stays_within_vicinity of the trips"""
+        mask = self.window(start_time, delta_time)
+        distances = self.distances[mask]
+        if len(distances) == 0 or np.nansum(distances) == 0:
+            return 0, 0
+
+        within_vicinity_mask = (
+            haversine_distance(
+                home_coordinates[0],
+                home_coordinates[1],
+                self.start_latitudes[mask],
+                self.start_longitudes[mask],
+            )
+            < radius
+        )
+        ratio = within_vicinity_mask.sum() / len(distances)
+        distance_ratio = np.nansum(distances[within_vicinity_mask]) / np.nansum(
+            distances
+        )
+        return ratio, distance_ratio
+
+
+def _to_epoch_nanoseconds(timestamps: pd.Series) -> np.ndarray:
+    return pd.to_datetime(timestamps).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _count_locations(closest_location_list: list) -> dict[int, int]:
+    frequency_to_location = {
+        location_id: closest_location_list.count(location_id)
+        for location_id in set(closest_location_list)
+    }
+    if 0 in frequency_to_location:
+        del frequency_to_location[0]
+    return frequency_to_location
+
 
 def end_is_same_home(
     end_point: tuple,
-    allowed_starts: start_locations,
+    allowed_starts: start_locations | StartLocationIndex,
     home_criteria: float | int,
     closest_home: int,
 ) -> bool:
@@ -62,15 +256,8 @@ def end_is_same_home(
     Useful for discard bad logs, that has long duration but no travelling. Will return True if endpoint is
     home_criteria distance within closest home
     """
-    end_location_distance_to_starts = map(
-        lambda start: (
-            start["id"],
-            calc_distance((start["latitude"], start["longitude"]), end_point),
-        ),
-        allowed_starts,
-    )
-    closest_end_home, closest_end_distance = min(
-        end_location_distance_to_starts, key=lambda x: x[1]
+    closest_end_home, closest_end_distance = get_closest_home_distance(
+        allowed_starts, end_point
     )
     if closest_end_distance < home_criteria and closest_home == closest_end_home:
         return True
@@ -182,43 +369,76 @@ def returns_to_home(
             f"{trips.end_time.max()}"
         )
         return True
-    for _, trip in future_trips.iterrows():
-        current_position_start = (trip.start_latitude, trip.start_longitude)
-        current_position_end = (trip.end_latitude, trip.end_longitude)
-
-        # Calculate distances to home
-        distance_to_home_start = min(
-            map(
-                lambda start: (
-                    calc_distance(
-                        (start["latitude"], start["longitude"]), current_position_start
-                    )
-                ),
-                locations_to_look_for,
-            )
-        )
-        distance_to_home_end = min(
-            map(
-                lambda start: (
-                    calc_distance(
-                        (start["latitude"], start["longitude"]), current_position_end
-                    )
-                ),
-                locations_to_look_for,
-            )
-        )
+    # distances from the start and end of every future trip (rows) to the home locations (columns), missing
+    # coordinates of a home are ignored
+    home_latitudes = [start["latitude"] for start in locations_to_look_for]
+    home_longitudes = [start["longitude"] for start in locations_to_look_for]
+    distance_to_home_start = np.fmin.reduce(
+        haversine_distance(
+            home_latitudes,
+            home_longitudes,
+            future_trips.start_latitude.values[:, None],
+            future_trips.start_longitude.values[:, None],
+        ),
+        axis=1,
+        initial=np.inf,
+    )
+    distance_to_home_end = np.fmin.reduce(
+        haversine_distance(
+            home_latitudes,
+            home_longitudes,
+            future_trips.end_latitude.values[:, None],
+            future_trips.end_longitude.values[:, None],
+        ),
+        axis=1,
+        initial=np.inf,
+    )
 
-        if (
-            distance_to_home_start < home_criteria
-            or distance_to_home_end < home_criteria
-        ):
-            # the car returns to original roundtrip home
-            return True
+    if (
+        (distance_to_home_start < home_criteria)
+        | (distance_to_home_end < home_criteria)
+    ).any():
+        # the car returns to original roundtrip home
+        return True
 
     # the car does not return to it original roundtrip home
     return False
 
 
+def haversine_distance(
+    latitudes1, longitudes1, latitudes2, longitudes2
+) -> np.ndarray:
+    """
+    Distance in km between coordinates given as arrays (or scalars) of latitudes and longitudes. The arrays are
+    broadcast against each other, so a single coordinate can be compared to many.
+    Parameters
+    ----------
+    latitudes1 : latitudes of the first coordinates
+    longitudes1 : longitudes of the first coordinates
+    latitudes2 : latitudes of the second coordinates
+    longitudes2 : longitudes of the second coordinates
+
+    Returns
+    -------
+    numpy array of distances in km, nan where a coordinate is missing
+    """
+    lat1 = np.asarray(latitudes1, dtype=float)
+    lon1 = np.asarray(longitudes1, dtype=float)
+    lat2 = np.asarray(latitudes2, dtype=float)
+    lon2 = np.asarray(longitudes2, dtype=float)
+    phi1 = lat1 * np.pi / 180
+    phi2 = lat2 * np.pi / 180
+    delta_phi = (lat2 - lat1) * np.pi / 180
+    delta_lambda = (lon2 - lon1) * np.pi / 180
+
+    a = np.sin(delta_phi / 2) * np.sin(delta_phi / 2) + np.cos(phi1) * np.cos(
+        phi2
+    ) * np.sin(delta_lambda / 2) * np.sin(delta_lambda / 2)
+
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
 def calc_distance(coord1: tuple, coord2: tuple) -> float:
     """
     Simple distance function to measure the distance in km from two coordinates (lat, long) (lat, long)
@@ -233,18 +453,7 @@ def calc_distance(coord1: tuple, coord2: tuple) -> float:
     """
     lat1, lon1 = coord1
     lat2, lon2 = coord2
-    R = 6371
-    phi1 = lat1 * math.pi / 180
-    phi2 = lat2 * math.pi / 180
-    delta_phi = (lat2 - lat1) * math.pi / 180
-    delta_lambda = (lon2 - lon1) * math.pi / 180
-
-    a = math.sin(delta_phi / 2) * math.sin(delta_phi / 2) + math.cos(phi1) * math.cos(
-        phi2
-    ) * math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2)
-
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    return float(haversine_distance(lat1, lon1, lat2, lon2))
 
 
 def aggregator(
@@ -259,6 +468,7 @@ def aggregator(
     only_natural_aggregation: bool = False,
     use_most_frequent_location: bool = False,
     pre_process: bool = True,
+    trip_arrays: CarTripArrays | None = None,
 ) -> list[route]:
     """
     Aggregates car trip data into a list of routes based on various criteria.
@@ -285,6 +495,8 @@ def aggregator(
         use_most_frequent_location (bool, optional): If True, use the most frequent location in the aggregation process.
             Defaults to False.
         pre_process (bool, optional): If True, time processing will happen within the function
+        trip_arrays (CarTripArrays, optional): The array representation of car_trips, as they are after the pre
+            processing. Pass it to share the closest start lookups between aggregations of the same trips.
 
     Returns:
         list[route]: A list of aggregated routes.
@@ -357,30 +569,22 @@ def aggregator(
         anonymise_location["latitude"],
         anonymise_location["longitude"],
     )
+    # the closest starts of all the logs are looked up at once
+    if trip_arrays is None:
+        trip_arrays = CarTripArrays(car_trips, allowed_starts)
+    closest_start_homes = trip_arrays.closest_start_homes
+    closest_start_distances = trip_arrays.closest_start_distances
+    closest_end_homes = trip_arrays.closest_end_homes
+    closest_end_distances = trip_arrays.closest_end_distances
     frequency_to_locations = (
-        car_trips.apply(
-            lambda row: (
-                lambda filtered: int(min(filtered, key=lambda x: x[1])[0])
-                if filtered
-                else 0
-            )(
-                list(
-                    filter(
-                        lambda it: it[-1] < home_criteria and pd.isna(it[-1]) is False,
-                        map(
-                            lambda start: (
-                                start["id"],
-                                calc_distance(
-                                    (start["latitude"], start["longitude"]),
-                                    (row["start_latitude"], row["start_longitude"]),
-                                ),
-                            ),
-                            allowed_starts,
-                        ),
-                    )
+        pd.Series(
+            [
+                start_home if distance < home_criteria else 0
+                for start_home, distance in zip(
+                    closest_start_homes, closest_start_distances
                 )
-            ),
-            axis=1,
+            ],
+            dtype=int,
         )
         .value_counts()
         .to_dict()
@@ -411,8 +615,17 @@ def aggregator(
         ):
             continue
 
-        closest_home, closest_distance = get_closest_home_distance(
-            allowed_starts, current_start
+        closest_home, closest_distance = (
+            closest_start_homes[k],
+            closest_start_distances[k],
+        )
+        closest_end_home, closest_end_distance = (
+            closest_end_homes[k],
+            closest_end_distances[k],
+        )
+        # the end is at the same home as the start, i.e. end_is_same_home
+        end_is_home = (
+            closest_end_distance < home_criteria and closest_end_home == closest_home
         )
 
         # if the roundtrip has not yet started
@@ -447,12 +660,8 @@ def aggregator(
                 )
 
                 # get the location frequency of all the points which is within the defined trip duration
-                eligible_trips_location_frequency = locations_frequency(
-                    car_trips[
-                        (car_trips.start_time >= rt_starter)
-                        & (car_trips.end_time <= rt_starter + allowed_trip_duration)
-                    ].to_dict("records"),
-                    allowed_starts,
+                eligible_trips_location_frequency = trip_arrays.locations_frequency(
+                    trip_arrays.window(rt_starter, allowed_trip_duration),
                     home_criteria,
                 )
                 location_frequency_sorted = sorted(
@@ -479,13 +688,11 @@ def aggregator(
 
                 # discard if the end is also home, then we can assume that next start is also home
                 # exception: trips with start and end = home and real distance are valid roundtrips
-                if end_is_same_home(
-                    current_end, allowed_starts, home_criteria, closest_home
-                ) and trip.distance <= distance_criteria:
+                if end_is_home and trip.distance <= distance_criteria:
                     continue
 
-                log_ratio, distance_ratio = stays_within_vicinity(
-                    current_start, car_trips, trip.start_time, allowed_trip_duration
+                log_ratio, distance_ratio = trip_arrays.stays_within_vicinity(
+                    current_start, trip.start_time, allowed_trip_duration
                 )
                 if (
                     log_ratio > vicinity_log_ratio
@@ -524,8 +731,8 @@ def aggregator(
                         car_roundtrips += new_roundtrips
                     current_roundtrip = [trip]
                     roundtrip_distance += trip.distance
-                    log_ratio, distance_ratio = stays_within_vicinity(
-                        current_start, car_trips, trip.start_time, allowed_trip_duration
+                    log_ratio, distance_ratio = trip_arrays.stays_within_vicinity(
+                        current_start, trip.start_time, allowed_trip_duration
                     )
                     if (
                         log_ratio > vicinity_log_ratio
@@ -569,9 +776,7 @@ def aggregator(
                 car_roundtrips.append(current_roundtrip)
 
                 # check if the next is also the home if so we skip the current
-                if end_is_same_home(
-                    current_end, allowed_starts, home_criteria, closest_home
-                ):
+                if end_is_home:
                     if trip.distance > distance_criteria:
                         # this is a valid roundtrip that has the same start and end without stopping
                         # allow to save these types as roundtrip
@@ -581,8 +786,8 @@ def aggregator(
                     roundtrip_distance = 0
                     current_home = None
                 else:
-                    log_ratio, distance_ratio = stays_within_vicinity(
-                        current_start, car_trips, trip.start_time, allowed_trip_duration
+                    log_ratio, distance_ratio = trip_arrays.stays_within_vicinity(
+                        current_start, trip.start_time, allowed_trip_duration
                     )
                     if (
                         log_ratio > vicinity_log_ratio
@@ -621,8 +826,8 @@ def aggregator(
 
                 current_roundtrip = [trip]
                 roundtrip_distance = trip.distance
-                log_ratio, distance_ratio = stays_within_vicinity(
-                    current_start, car_trips, trip.start_time, allowed_trip_duration
+                log_ratio, distance_ratio = trip_arrays.stays_within_vicinity(
+                    current_start, trip.start_time, allowed_trip_duration
                 )
                 if (
                     log_ratio > vicinity_log_ratio
@@ -634,9 +839,6 @@ def aggregator(
                 current_home = closest_home
             else:
                 # force end of next if the end is close... SKYHOST GPS SHIFT ISSUE
-                closest_end_home, closest_end_distance = get_closest_home_distance(
-                    allowed_starts, current_end
-                )
                 force_end = (
                     closest_end_distance < home_criteria
                     and closest_end_home == current_home
@@ -648,10 +850,7 @@ def aggregator(
         route_format(
             finished_route,
             car["id"],
-            get_closest_home_distance(
-                allowed_starts,
-                (finished_route[0].start_latitude, finished_route[0].start_longitude),
-            )[0],
+            closest_start_homes[trip_arrays.positions[finished_route[0].Index]],
             aggregation_type=aggregating_types[index],
             enforced_point=None if anonymise_gps is False else anonymise_coordinates,
         )
@@ -674,12 +873,9 @@ def aggregator(
                 map(
                     lambda roundtrip, index: (
                         index,
-                        locations_frequency(
-                            car_trips[car_trips.id.isin(roundtrip["ids"])].to_dict(
-                                "records"
-                            ),
-                            allowed_starts,
-                            home_criteria=home_criteria,
+                        trip_arrays.locations_frequency(
+                            trip_arrays.trips_with_ids(roundtrip["ids"]),
+                            home_criteria,
                         ),
                     ),
                     roundtrip_longer_than_alternative_hours,
@@ -712,11 +908,12 @@ def aggregator(
                         roundtrip_id
                     ]
                     # try to create a roundtrips for the suspicious roundtrip with the most frequently visited location
+                    suspicious_trips = trip_arrays.trips_with_ids(
+                        suspicious_roundtrip["ids"]
+                    )
                     new_roundtrips = aggregator(
                         car=car,
-                        car_trips=car_trips[
-                            car_trips.id.isin(suspicious_roundtrip["ids"])
-                        ].copy(),
+                        car_trips=car_trips[suspicious_trips].copy(),
                         allowed_starts=allowed_starts,
                         allowed_trip_duration=allowed_trip_duration,
                         allowed_stop_duration=allowed_stop_duration,
@@ -725,7 +922,8 @@ def aggregator(
                         anonymise_gps=anonymise_gps,
                         only_natural_aggregation=only_natural_aggregation,
                         use_most_frequent_location=True,
-                        pre_process=False
+                        pre_process=False,
+                        trip_arrays=trip_arrays.subset(suspicious_trips),
                     )
                     if new_roundtrips:
                         roundtrips = [
@@ -896,18 +1094,20 @@ def stays_within_vicinity(
     relevant_trips = trips[
         (trips.start_time >= start_time) & (trips.end_time <= start_time + delta_time)
     ].copy()
-    within_vicinity_mask = relevant_trips.apply(
-        lambda trip: calc_distance(
-            home_coordinates, (trip.start_latitude, trip.start_longitude)
+    within_vicinity_mask = (
+        haversine_distance(
+            home_coordinates[0],
+            home_coordinates[1],
+            relevant_trips.start_latitude,
+            relevant_trips.start_longitude,
         )
-        < radius,
-        axis=1,
+        < radius
     )
 
     if len(relevant_trips) == 0 or relevant_trips.distance.sum() == 0:
         return 0, 0
 
-    ratio = sum(within_vicinity_mask) / len(relevant_trips)
+    ratio = within_vicinity_mask.sum() / len(relevant_trips)
     distance_ratio = (
         relevant_trips[within_vicinity_mask].distance.sum()
         / relevant_trips.distance.sum()
@@ -917,32 +1117,30 @@ def stays_within_vicinity(
 
 
 def get_closest_home_distance(
-    allowed_starts_locations: start_locations, coordinate: tuple[float, float]
+    allowed_starts_locations: start_locations | StartLocationIndex,
+    coordinate: tuple[float, float],
 ):
     """
     Returns the ID and distance of the closest start location to the given coordinate.
 
     Parameters:
-        allowed_starts (list[dict]): List of start locations with 'id', 'latitude', and 'longitude'.
+        allowed_starts (list[dict] | StartLocationIndex): List of start locations with 'id', 'latitude', and
+            'longitude', or the index of them.
         coordinate (tuple[float, float]): Target latitude and longitude.
 
     Returns:
         tuple[int, float]: ID of the closest start location and the distance to it.
     """
-    # get the current distance to allowed starts
-    distances_to_starts = map(
-        lambda start: (
-            start["id"],
-            calc_distance((start["latitude"], start["longitude"]), coordinate),
-        ),
-        allowed_starts_locations,
+    ids, distances = as_start_index(allowed_starts_locations).closest(
+        [coordinate[0]], [coordinate[1]]
     )
-    closest_home, closest_distance = min(distances_to_starts, key=lambda x: x[1])
-    return closest_home, closest_distance
+    return ids[0], distances[0]
 
 
 def locations_frequency(
-    trips: list[dict], starts: start_locations, home_criteria: float | int = 0.2
+    trips: list[dict],
+    starts: start_locations | StartLocationIndex,
+    home_criteria: float | int = 0.2,
 ):
     """
     Calculate the frequency of trips starting near each given location.
@@ -956,8 +1154,9 @@ def locations_frequency(
     Parameters:
         trips (list[dict]): A list of dictionaries, each representing a trip. Each dictionary
                             must contain the keys 'start_latitude' and 'start_longitude'.
-        starts (list[dict]): A list of dictionaries, each representing a start location. Each
-                             dictionary must contain the keys 'id', 'latitude', and 'longitude'.
+        starts (list[dict] | StartLocationIndex): A list of dictionaries, each representing a start location.
+                             Each dictionary must contain the keys 'id', 'latitude', and 'longitude'. The index of
+                             the starts can be passed instead.
         home_criteria (float | int, optional): The maximum distance a trip's start point can
                                                be from a location for the trip to be considered
                                                as starting near that location. Defaults to 0.2.
@@ -967,40 +1166,12 @@ def locations_frequency(
               values are the number of trips that started near each location (int). Locations
               with no nearby trips are not included in the dictionary.
     """
-    closest_location_list = list(
-        map(
-            lambda trip: (
-                lambda filtered: int(min(filtered, key=lambda x: x[1])[0])
-                if filtered
-                else 0
-            )(
-                list(
-                    filter(
-                        lambda low_distance: low_distance[-1] < home_criteria and pd.isna(low_distance[-1]) is False,
-                        map(
-                            lambda start: (
-                                start["id"],
-                                calc_distance(
-                                    (start["latitude"], start["longitude"]),
-                                    (trip["start_latitude"], trip["start_longitude"]),
-                                ),
-                            ),
-                            starts,
-                        ),
-                    )
-                )
-            ),
-            trips,
-        )
+    closest_location_list = as_start_index(starts).closest_within(
+        [trip["start_latitude"] for trip in trips],
+        [trip["start_longitude"] for trip in trips],
+        home_criteria,
     )
-    frequency_to_location = {
-        location_id: closest_location_list.count(location_id)
-        for location_id in set(closest_location_list)
-    }
-    if 0 in frequency_to_location:
-        del frequency_to_location[0]
-
-    return frequency_to_location
+    return _count_locations(closest_location_list)
 
 
 def route_format(
@@ -1151,6 +1322,7 @@ def process_car_roundtrips(
         return_ids: bool = False,
         save: bool = True,
         precision_only: bool = False,
+        return_routes: bool = False,
 ):
     car_model = {"id": car.id, "location": car.location}
     result = []
@@ -1174,14 +1346,15 @@ def process_car_roundtrips(
     )
 
     if json.loads(os.getenv("BIRD_FLIGHT", "false")):
-        car_trips["distance"] = car_trips.apply(
-            lambda single_trip: calc_distance(
-                (single_trip.start_latitude, single_trip.start_longitude),
-                (single_trip.end_latitude, single_trip.end_longitude),
-            ),
-            axis=1,
+        car_trips["distance"] = haversine_distance(
+            car_trips.start_latitude,
+            car_trips.start_longitude,
+            car_trips.end_latitude,
+            car_trips.end_longitude,
         )
 
+    # the closest starts of the logs are the same for every definition of home
+    trip_arrays = CarTripArrays(car_trips, allowed_starts)
     for definition_of_home in np.array(list(range(1, 4))[::-1] + [0.5]) * 0.1:
         finished_roundtrips = aggregator(
             car_model,
@@ -1192,6 +1365,7 @@ def process_car_roundtrips(
             only_natural_aggregation=json.loads(os.getenv("ONLY_NATURAL", "false")),
             allowed_trip_duration=timedelta(days=float(os.getenv("TRIP_DURATION", 7))),
             pre_process=False,
+            trip_arrays=trip_arrays,
         )
 
         if len(finished_roundtrips):
@@ -1237,9 +1411,9 @@ def process_car_roundtrips(
         if save and precision_only is False:
             if is_session_maker:
                 with session_or_maker.begin() as session:
-                    commit_roundtrips(session, car, qualified_routes)
+                    commit_roundtrips(session, qualified_routes)
             else:
-                commit_roundtrips(session_or_maker, car, qualified_routes)
+                commit_roundtrips(session_or_maker, qualified_routes)
 
         last_type = qualified_routes.iloc[-1].aggregation_type
         unused_tail = car_trips[car_trips.start_time > qualified_routes.iloc[-1].end_time]
@@ -1257,38 +1431,104 @@ def process_car_roundtrips(
                 {"ids": rt["ids"], "start_time": rt["start_time"], "end_time": rt["end_time"]}
                 for rt in qualified_routes.to_dict("records")
             ]
+        if return_routes:
+            return usage_count, possible_count, usage_distance, possible_distance, ids, qualified_routes
         return usage_count, possible_count, usage_distance, possible_distance, ids
+    if return_routes:
+        return usage_count, possible_count, usage_distance, possible_distance, qualified_routes
     return usage_count, possible_count, usage_distance, possible_distance
 
 
-def commit_roundtrips(session, car, qualified_routes):
-    car_in_db = session.query(Cars).get(int(car.id))
-    rt = [
-        RoundTrips(
-            id=None,
-            start_time=route["start_time"],
-            end_time=route["end_time"],
-            start_latitude=route["start_latitude"],
-            start_longitude=route["start_longitude"],
-            end_latitude=route["end_latitude"],
-            end_longitude=route["end_longitude"],
-            car_id=int(route["car_id"]),
-            car=car_in_db,
-            distance=route["distance"],
-            driver_name=None,
-            start_location_id=route["start_location_id"],
-            trip_segments=[
-                RoundTripSegments(
-                    id=None,
-                    distance=segment["distance"],
-                    start_time=segment["start_time"],
-                    end_time=segment["end_time"],
-                )
-                for segment in route["trip_segments"]
-            ],
-            aggregation_type=route["aggregation_type"],
+def commit_roundtrips(session, qualified_routes, commit: bool = True):
+    insert_roundtrips(session, qualified_routes.to_dict("records"))
+    if commit:
+        session.commit()
+
+
+def _inserted_roundtrip_ids(
+    session: Session, rows: list[dict], last_id: int | None
+) -> list[int]:
+    """
+    The ids of the roundtrips just inserted from rows, for dialects without ordered RETURNING on an executemany.
+    Every car's roundtrips are given increasing ids in the order they were inserted, so the ids above last_id of
+    each car are matched to its rows in order. Costs one query pr. batch instead of one insert pr. roundtrip.
+    """
+    roundtrips_table = RoundTrips.__table__
+    car_ids = {row["car_id"] for row in rows}
+    query = select(roundtrips_table.c.car_id, roundtrips_table.c.id).where(
+        roundtrips_table.c.car_id.in_(car_ids)
+    )
+    if last_id is not None:
+        query = query.where(roundtrips_table.c.id > last_id)
+    ids_of_car = {car_id: [] for car_id in car_ids}
+    for car_id, roundtrip_id in session.execute(query.order_by(roundtrips_table.c.id)):
+        ids_of_car[car_id].append(roundtrip_id)
+    if sum(map(len, ids_of_car.values())) != len(rows):
+        raise RuntimeError(
+            "Roundtrips of the same cars were inserted concurrently, "
+            "their ids can not be recovered"
+        )
+    ids_of_car = {car_id: iter(ids) for car_id, ids in ids_of_car.items()}
+    return [next(ids_of_car[row["car_id"]]) for row in rows]
+
+
+def insert_roundtrips(session: Session, routes: list[route]):
+    """
+    Bulk inserts the roundtrips and their segments without building ORM objects. The roundtrips are inserted
+    ROUNDTRIP_INSERT_BATCH at a time with RETURNING, and the segments are inserted with the returned ids in
+    a single executemany. Dialects that can't return the ids of an executemany in order, like MySQL, insert
+    every batch in one executemany as well and read the ids back in a second query, see _inserted_roundtrip_ids.
+    Committing is left to the caller.
+
+    Parameters
+    ----------
+    session :   session to insert with
+    routes  :   list of roundtrips, like the output of the aggregator
+    """
+    if len(routes) == 0:
+        return
+    roundtrips_table = RoundTrips.__table__
+    insert_roundtrip = insert(roundtrips_table)
+    returns_ids = session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order
+    if returns_ids:
+        insert_roundtrip = insert_roundtrip.returning(
+            roundtrips_table.c.id, sort_by_parameter_order=True
         )
-        for route in qualified_routes.to_dict("records")
+
+    roundtrip_ids = []
+    for batch_start in range(0, len(routes), ROUNDTRIP_INSERT_BATCH):
+        rows = [
+            {
+                "start_time": route["start_time"],
+                "end_time": route["end_time"],
+                "start_latitude": route["start_latitude"],
+                "start_longitude": route["start_longitude"],
+                "end_latitude": route["end_latitude"],
+                "end_longitude": route["end_longitude"],
+                "car_id": int(route["car_id"]),
+                "distance": route["distance"],
+                "driver_name": None,
+                "start_location_id": route["start_location_id"],
+                "aggregation_type": route["aggregation_type"],
+            }
+            for route in routes[batch_start: batch_start + ROUNDTRIP_INSERT_BATCH]
+        ]
+        if returns_ids:
+            roundtrip_ids += session.execute(insert_roundtrip, rows).scalars().all()
+        else:
+            last_id = session.execute(select(func.max(roundtrips_table.c.id))).scalar()
+            session.execute(insert_roundtrip, rows)
+            roundtrip_ids += _inserted_roundtrip_ids(session, rows, last_id)
+
+    segments = [
+        {
+            "distance": segment["distance"],
+            "start_time": segment["start_time"],
+            "end_time": segment["end_time"],
+            "round_trip_id": roundtrip_id,
+        }
+        for roundtrip_id, route in zip(roundtrip_ids, routes)
+        for segment in route["trip_segments"]
     ]
-    session.add_all(rt)
-    session.commit()
+    if segments:
+        session.execute(insert(RoundTripSegments.__table__), segments)
@@ -0,0 +1,132 @@
+"""
+Content addressed cache of the single day route plans solved by the intelligent allocation. Fleet and goal simulations
+on the same location and dates solve the same days over and over, so the route plans are stored in redis under a hash
+of the routing problem. Entries expire after ROUTE_PLAN_CACHE_TTL days and, with the maxmemory-policy of the redis
+server set to allkeys-lru, the least recently used plans are evicted when memory runs low.
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+from datetime import timedelta
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from fleetmanager.logging import logging
+from fleetmanager.model.qampo.classes import (
+    AlgorithmParameters,
+    AlgorithmType,
+    Fleet,
+    RoutePlan,
+    Trip,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTE_PLAN_CACHE_TTL = timedelta(days=int(os.getenv("ROUTE_PLAN_CACHE_TTL", 7)))
+# seconds to wait for redis before the cache is considered unavailable
+ROUTE_PLAN_CACHE_TIMEOUT = float(os.getenv("ROUTE_PLAN_CACHE_TIMEOUT", 0.5))
+# seconds before an unavailable redis is tried again
+ROUTE_PLAN_CACHE_RETRY = 300
+
+# one client per process, (pid, client) so forked workers open their own connection
+_client: tuple[int, Redis] | None = None
+_unavailable_until = 0.0
+
+
+def route_plan_cache_key(
+    fleet: Fleet,
+    trips: list[Trip],
+    algorithm_type: AlgorithmType,
+    algorithm_parameters: AlgorithmParameters = None,
+) -> str:
+    """
+    Canonical key of a single day routing problem. The order of the trips does not change the key.
+
+    Parameters
+    ----------
+    fleet   :   qampo Fleet, vehicles, employee car and emission cost
+    trips   :   list of qampo Trip of the day
+    algorithm_type  :   AlgorithmType used to solve the day
+    algorithm_parameters    :   AlgorithmParameters used to solve the day, None for the defaults
+
+    Returns
+    -------
+    key :   str, redis key of the route plan
+    """
+    if algorithm_parameters is None:
+        algorithm_parameters = AlgorithmParameters(time_limit_in_seconds=60)
+    problem = {
+        "fleet": fleet.dict(),
+        "trips": sorted(
+            (trip.dict() for trip in trips),
+            key=lambda trip: (trip["start_time"], trip["id"]),
+        ),
+        "algorithm_type": algorithm_type.value,
+        "algorithm_parameters": algorithm_parameters.dict(),
+    }
+    digest = hashlib.sha256(
+        json.dumps(problem, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return f"cache:{os.getenv('CELERY_QUEUE', 'default')}:route_plan:{digest}"
+
+
+def _get_client() -> Redis | None:
+    """
+    The redis client of this process, created on first use. Returns None if CELERY_BACKEND_URL is not set or not a
+    valid redis url, or if redis did not answer within the last ROUTE_PLAN_CACHE_RETRY seconds, so a simulation does
+    not wait on redis for every day.
+    """
+    global _client
+    if _client is not None and _client[0] == os.getpid():
+        return _client[1]
+    if time.monotonic() < _unavailable_until:
+        return None
+    backend_url = os.getenv("CELERY_BACKEND_URL")
+    if not backend_url:
+        return None
+    try:
+        client = Redis.from_url(
+            backend_url,
+            socket_connect_timeout=ROUTE_PLAN_CACHE_TIMEOUT,
+            socket_timeout=ROUTE_PLAN_CACHE_TIMEOUT,
+        )
+        client.ping()
+    except (RedisError, ValueError) as e:
+        _mark_unavailable(e)
+        return None
+    _client = (os.getpid(), client)
+    return client
+
+
+def _mark_unavailable(error: Exception):
+    global _client, _unavailable_until
+    logger.debug(f"Route plan cache is unavailable: {error}")
+    _client = None
+    _unavailable_until = time.monotonic() + ROUTE_PLAN_CACHE_RETRY
+
+
+def get_cached_route_plan(key: str) -> RoutePlan | None:
+    """Returns the cached route plan, or None if it is not cached or redis is unavailable"""
+    client = _get_client()
+    if client is None:
+        return None
+    try:
+        cached = client.get(key)
+    except RedisError as e:
+        _mark_unavailable(e)
+        return None
+    return pickle.loads(cached) if cached else None
+
+
+def set_cached_route_plan(key: str, route_plan: RoutePlan):
+    """Stores the route plan with the ROUTE_PLAN_CACHE_TTL. Nothing is stored if redis is unavailable"""
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        client.set(key, pickle.dumps(route_plan), ex=ROUTE_PLAN_CACHE_TTL)
+    except RedisError as e:
+        _mark_unavailable(e)
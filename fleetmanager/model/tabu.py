@@ -24,10 +24,14 @@ from fleetmanager.model.model import (
     Simulation,
     Trips,
 )
+from fleetmanager.model.parallel import create_executor, get_worker_count
 from fleetmanager.model.tco_calculator import TCOCalculator
 from fleetmanager.model.trip_generator import extract_peak_day
 from fleetmanager.model.vehicle import Unassigned
 
+# seconds a single tabu search is allowed to run
+TABU_TIME_LIMIT = 20
+
 
 class TabuSearch:
     """
@@ -65,7 +69,7 @@ class TabuSearch:
         weight: int = 5,
         intelligent: bool = False,
         km_aar: bool = False,
-        use_timeslots: bool = False,
+        use_timeslots: bool | str = False,
         settings=None,
         current_vehicles=None,
         engine=None,
@@ -92,6 +96,7 @@ class TabuSearch:
         intelligent :   bool, should the tabu search use intelligent allocation (Qampo) in the solution simulation
         km_aar  :   bool, should the simulation constrain vehicle booking when the yearly km allowance has been reached.
                     Not available with intelligent simulation.
+        use_timeslots   :   bool or str, passed as timeslots to the simulations, "intervals" for interval based booking
         """
         self.fallback_undriven = None
         self.fallback_solutions = None
@@ -103,6 +108,8 @@ class TabuSearch:
         self.fixed_antal = fixed_antal
         self.weight = weight
         self.intelligent = intelligent
+        # solves the days of the intelligent simulations while the tabu search runs them, see qampo_executor
+        self.qampo_executor = None
         self.km_aar = km_aar
         self.fleet_optimisation = fleetoptimiser
         self.dates = dates
@@ -138,9 +145,28 @@ class TabuSearch:
         self.vehicle_properties = self.calculate_vehicle_cost()
         self.cheap_list = self.vehicle_ordered()
         self.vehicle2id, self.id2vehicle, self.vehicle2type = self.mapper()
+        self.norm_objectives = np.array(
+            [
+                self.vehicle_properties[self.id2vehicle[k]]["norm_obj"]
+                for k in range(len(self.id2vehicle))
+            ]
+        )
         self.best_objective_value = None
         self.report = None
 
+    def __getstate__(self):
+        # tabu searches sent to worker processes only need the vehicle structures, not the trips or the engine
+        state = self.__dict__.copy()
+        for key in [
+            "engine",
+            "total_trips",
+            "dummy_trips",
+            "fleet_optimisation",
+            "qampo_executor",
+        ]:
+            state[key] = None
+        return state
+
     def run(self):
         """
         Method for handling the run of the tabu search. First calls the least_viable to get the least number of
@@ -149,7 +175,11 @@ class TabuSearch:
         expense - and co2e goal. Finally, the "control" method is run, which handles the tabu search and assigns
         the result to report.
         """
-        self.least_viable()
+        self.open_qampo_executor()
+        try:
+            self.least_viable()
+        finally:
+            self.close_qampo_executor()
         (
             self.best_solution,
             self.best_solution_vehicle_types,
@@ -162,6 +192,19 @@ class TabuSearch:
         self.search()
         return True
 
+    def open_qampo_executor(self):
+        """
+        Creates the executor shared by the intelligent simulations of the search, so the pool is started once
+        instead of for every simulation. Nothing is created without intelligent allocation.
+        """
+        if self.intelligent and self.qampo_executor is None:
+            self.qampo_executor = create_executor()
+
+    def close_qampo_executor(self):
+        if self.qampo_executor is not None:
+            self.qampo_executor.shutdown(cancel_futures=True)
+            self.qampo_executor = None
+
     def run_current_setup(self):
         """
         Method responsible for running the current setup on the whole selected trip set.
@@ -403,9 +446,14 @@ class TabuSearch:
         twv = 1
         if test:
             neighbour_co2e, neighbour_cost, twv = self.real_simulation(solution)
-            solution = {self.id2vehicle[k]: count for k, count in enumerate(solution)}
-        elif type(solution) is list:
-            solution = {self.id2vehicle[k]: count for k, count in enumerate(solution)}
+        if type(solution) is list:
+            return sum(
+                [
+                    self.norm_objectives[k] * count
+                    for k, count in enumerate(solution)
+                    if count > 0
+                ]
+            )
 
         n_sum = sum(
             [
@@ -632,6 +680,7 @@ class TabuSearch:
             intelligent_simulation=self.intelligent,
             timestamps_set=True,
             timeslots=self.use_timeslots,
+            executor=self.qampo_executor,
         )
         if self.use_timeslots:
             simulation.timestamps = self.dummy_trips.timestamps
@@ -731,6 +780,7 @@ class TabuSearch:
             intelligent_simulation=intelligent,
             timestamps_set=True,
             timeslots=self.use_timeslots,
+            executor=self.qampo_executor if intelligent else None,
         )
 
         if self.use_timeslots:
@@ -860,62 +910,69 @@ class TabuSearch:
                 ts[(k, mov)] = {"tabu_time": 0, "objective_value": math.inf}
         return ts
 
-    def get_nabo(self, c_solution, allow_removal=True, min_cars=None):
+    def get_moves(self, c_solution, allow_removal=True, min_cars=None):
         """
-        Method for generating neighbours to the current solution. I.e. from the tabu structure generate the
-        specific solution from the current solution and the move. It checks if the solution satisfies the minimum
-        number of cars criteria.
+        Method for generating the moves that can be made from the current solution, see get_nabo.
 
         Parameters
         ----------
-        c_solution  :   list, the current solution from which new solutions will be build
+        c_solution  :   list, the current solution from which moves will be made
         allow_removal   :   bool, is it allowed to remove vehicles from the fixed cars
         min_cars    :   int, the minimum number of cars that should be in the solution
 
         Returns
         -------
-        generator, that yields the possible solutions.
-
+        generator, that yields the possible moves (index, +1/-1).
         """
         if min_cars is None:
             min_cars = self.minimum_cars
-        min_suffice = lambda sol: sum(sol[: self.car_index + 1]) >= min_cars
+        cars = sum(c_solution[: self.car_index + 1])
+        # only moves on the cars change the number of cars
+        min_suffice = lambda k, mov: cars + (mov if k <= self.car_index else 0) >= min_cars
         if allow_removal:
             for k, count in enumerate(c_solution):
                 if self.fixed[k] == 0:
                     continue
                 if count > 0:
-                    cop = c_solution.copy()
-                    cop[k] -= 1
-                    if min_suffice(cop):
-                        yield (k, -1), cop
+                    if min_suffice(k, -1):
+                        yield k, -1
                 elif count < self.fixed[k]:  # allow climb again
-                    cop = c_solution.copy()
-                    cop[k] += 1
-                    yield (k, 1), cop
+                    yield k, 1
         else:
             for k, count in enumerate(c_solution):
                 if count == 0:
-                    cop = c_solution.copy()
-                    cop[k] = 1
-                    yield (k, 1), cop
+                    yield k, 1
                 else:
-                    if k > self.car_index and min_suffice(c_solution) is False:
+                    if k > self.car_index and cars < min_cars:
                         continue
                     if self.fixed[k] == count:
-                        cop = c_solution.copy()
-                        cop[k] = count + 1
-                        yield (k, 1), cop
+                        yield k, 1
                     else:
-                        for a in range(2):
-                            cop = c_solution.copy()
-                            mov = -1 if a == 0 else 1
-                            cop[k] = count + mov
-                            if a:
-                                yield (k, mov), cop
-                            else:
-                                if min_suffice(cop):
-                                    yield (k, mov), cop
+                        if min_suffice(k, -1):
+                            yield k, -1
+                        yield k, 1
+
+    def get_nabo(self, c_solution, allow_removal=True, min_cars=None):
+        """
+        Method for generating neighbours to the current solution. I.e. from the tabu structure generate the
+        specific solution from the current solution and the move. It checks if the solution satisfies the minimum
+        number of cars criteria.
+
+        Parameters
+        ----------
+        c_solution  :   list, the current solution from which new solutions will be build
+        allow_removal   :   bool, is it allowed to remove vehicles from the fixed cars
+        min_cars    :   int, the minimum number of cars that should be in the solution
+
+        Returns
+        -------
+        generator, that yields the possible solutions.
+
+        """
+        for move in self.get_moves(
+            c_solution, allow_removal=allow_removal, min_cars=min_cars
+        ):
+            yield move, self.swap_move(c_solution, move)
 
     def swap_move(self, solution, move):
         """
@@ -934,7 +991,7 @@ class TabuSearch:
         cop[move[0]] += move[1]
         return cop
 
-    def tabu_search(self, min_cars=None, add_tenure=0):
+    def tabu_search(self, min_cars=None, add_tenure=0, deadline=None):
         """
         The tabu search algorithm.
 
@@ -951,6 +1008,9 @@ class TabuSearch:
         Parameters
         ----------
         min_cars    :   the minimum number of cars needed in the generated solutions.
+        add_tenure  :   int, added to the number of iterations a move stays tabu
+        deadline    :   float, time.time() at which the search is stopped, in addition to the TABU_TIME_LIMIT of the
+                        single search
 
         Returns
         -------
@@ -979,11 +1039,20 @@ class TabuSearch:
         # save the solutions so we don't have to re-run the obj method
         saved_solutions = dict()
         saved_solutions[tuple(current_solution)] = current_objvalue
+        # difference of the current solution to the start solution by index, to recognise moves back to it
+        start_solution = tuple(current_solution)
+        start_difference = {}
 
         iteration = 1
         stop_iter = 0
         start = time.time()
-        while stop_iter < 200 and time.time() - start < 20:
+        if deadline is None:
+            deadline = math.inf
+        while (
+            stop_iter < 200
+            and time.time() - start < TABU_TIME_LIMIT
+            and time.time() < deadline
+        ):
             generated = False
             moves = tabu_structure.keys()
 
@@ -991,25 +1060,40 @@ class TabuSearch:
             for move in moves:
                 tabu_structure[move]["objective_value"] = math.inf
 
-            # iterate over the possible moves to get it's associated move objective value
-            for move, candidate_solution in self.get_nabo(
+            # iterate over the possible moves to get it's associated move objective value. A move changes the count
+            # of a single vehicle, so the objective value of the neighbour is found from that of the current solution
+            solution_objvalue = self.objective_value(current_solution)
+            for move in self.get_moves(
                 current_solution, allow_removal=allow_remove, min_cars=min_cars
             ):
                 if move not in tabu_structure:
                     continue
                 generated = True
 
-                # skip getting objective value for already checked solutions
-                if tuple(candidate_solution) not in saved_solutions:
-                    candidate_objvalue = self.objective_value(candidate_solution)
+                vehicle_index, mov = move
+                if (
+                    len(start_difference) == 1
+                    and start_difference.get(vehicle_index) == -mov
+                ):
+                    # the start solution is saved without an objective value
+                    candidate_objvalue = saved_solutions[start_solution]
                 else:
-                    candidate_objvalue = saved_solutions[tuple(candidate_solution)]
+                    candidate_objvalue = (
+                        solution_objvalue + mov * self.norm_objectives[vehicle_index]
+                    )
                 tabu_structure[move]["objective_value"] = candidate_objvalue
 
             # break if there are no more moves to be made
             if generated is False:
                 break
 
+            # the moves keep their objective values until the current solution changes, so if none of them have a
+            # finite value, e.g. a move back to the start solution, the search would only spin until the time limit
+            if all(
+                [a["objective_value"] == math.inf for a in tabu_structure.values()]
+            ):
+                break
+
             # check the possible steps
             while True:
                 # if no moves are allowed because tabu_time exceeds iteration we increment and break
@@ -1029,6 +1113,7 @@ class TabuSearch:
                 # move is allowed
                 if tabu_time < iteration:
                     current_solution = self.swap_move(current_solution, best_move)
+                    self.__record_difference(start_difference, best_move)
                     current_objvalue = move_obj
                     saved_solutions[tuple(current_solution)] = current_objvalue
 
@@ -1057,6 +1142,7 @@ class TabuSearch:
                 else:
                     if move_obj < best_objvalue:
                         current_solution = self.swap_move(current_solution, best_move)
+                        self.__record_difference(start_difference, best_move)
                         current_objvalue = move_obj
                         best_solution = current_solution
                         best_objvalue = current_objvalue
@@ -1076,6 +1162,13 @@ class TabuSearch:
         }
         return saved_solutions
 
+    @staticmethod
+    def __record_difference(difference, move):
+        vehicle_index, mov = move
+        difference[vehicle_index] = difference.get(vehicle_index, 0) + mov
+        if difference[vehicle_index] == 0:
+            del difference[vehicle_index]
+
     def search(self):
         """
         Method for controlling the tabu search, which is called 4 times by default.
@@ -1092,18 +1185,54 @@ class TabuSearch:
         -------
         list, of the top 5 solutions based on the objective value.
 
+        The searches are independent, so they are run on a pool of worker processes when they can be started. All
+        searches share a deadline of TABU_TIME_LIMIT for every round of searches the workers have to run.
         """
         self.solutions = []
-        for k, min_cars in enumerate(
-            range(self.minimum_cars - 1, self.breakpoint_el_found + 1)
-        ):
+        searches = list(
+            enumerate(range(self.minimum_cars - 1, self.breakpoint_el_found + 1))
+        )
+        workers = min(len(searches), get_worker_count())
+        executor = create_executor(workers, allow_threads=False)
+        rounds = len(searches) if executor is None else math.ceil(len(searches) / workers)
+        deadline = time.time() + TABU_TIME_LIMIT * rounds
+        try:
+            if executor is None:
+                searched = [
+                    self.tabu_search(min_cars, add_tenure=k, deadline=deadline)
+                    for k, min_cars in searches
+                ]
+            else:
+                futures = [
+                    executor.submit(
+                        self.tabu_search, min_cars, add_tenure=k, deadline=deadline
+                    )
+                    for k, min_cars in searches
+                ]
+                searched = [future.result() for future in futures]
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        for saved_solutions in searched:
             sorted_solutions = sorted(
-                self.tabu_search(min_cars, add_tenure=k).items(),
+                saved_solutions.items(),
                 key=operator.itemgetter(1),
             )
             self.solutions.append(list(set([a[0][:-1] for a in sorted_solutions])))
 
     def iterate_solutions(self):
+        """
+        Runs the solutions of the search on the whole trip set. The intelligent simulations share one executor
+        that is shut down when the iteration ends.
+        """
+        self.open_qampo_executor()
+        try:
+            yield from self.__iterate_solutions()
+        finally:
+            self.close_qampo_executor()
+
+    def __iterate_solutions(self):
         len_solutions = len([a for b in self.solutions for a in b])
         self.fallback_solutions = []  # for saving solutions that exceed the goals
         vehicle_assumption = (
@@ -1,3 +1,4 @@
+import heapq
 import json
 from dataclasses import dataclass
 from datetime import date, datetime, time, timedelta
@@ -10,6 +11,7 @@ from sqlalchemy.engine.base import Engine
 
 from fleetmanager.data_access.db_engine import engine_creator
 from fleetmanager.data_access.dbschema import RoundTrips, RoundTripSegments
+from fleetmanager.data_access.seeding import seed_synthetic_roundtrips
 
 
 def generate_trips_simulation(
@@ -80,107 +82,170 @@ def __minutes_since_midnight(timestamp):
 
 
 def extract_peak_day(data):
-    # Expand the trips using the roundtripsegments to get exact distances
-    expanded_rows = []
-    for row in data.itertuples():
-        roundtripsegments = (
-            [row._asdict()]
-            if hasattr(row, "trip_segments") is False
-            or len(getattr(row, "trip_segments")) == 0
-            else row.trip_segments
-        )
-        for segment in roundtripsegments:
-            start_time = pd.to_datetime(segment["start_time"])
-            end_time = pd.to_datetime(segment["end_time"])
-            distance = segment["distance"]
-
-            # Handle the cases where segments span multiple days
-            num_days = (end_time.date() - start_time.date()).days + 1
-            daily_distance = distance / num_days
-
-            for offset in range(num_days):
-                day = start_time.date() + pd.Timedelta(days=offset)
-                expanded_rows.append({"date": day, "distance": daily_distance})
-
-    expanded_data = pd.DataFrame(expanded_rows)
-    daily_totals = expanded_data[["distance", "date"]].groupby("date").sum()
-
-    peak_day_date = daily_totals["distance"].idxmax()
-    peak_day_datetime_start = datetime.combine(peak_day_date, time(0, 0, 0))
-    peak_day_datetime_end = peak_day_datetime_start + timedelta(hours=23, minutes=59, seconds=59)
-
-    day_mask = data["start_time"].dt.date <= peak_day_date
-    day_mask &= data["end_time"].dt.date >= peak_day_date
-
-    peak_day_trips = data[day_mask]
-
-    # Extract the roundtripsegments and create fictive ones if they span multiple days
-    peak_day = []
-    for row in peak_day_trips.itertuples():
-        trip = {"distance": 0, "trip_segments": []}
-        if hasattr(row, "trip_segments"):
-            removed_segments = []
-            for segment in row.trip_segments:
-                # only use the row.trip_segments that actually take place on the peak day
-                # if the segment spans across midnight or multiple days - make a segment that covers the relative
-                # distance
-                start_time_segment = segment["start_time"]
-                end_time_segment = segment["end_time"]
-                if start_time_segment.date() != peak_day_date and end_time_segment.date() != peak_day_date:
-                    removed_segments.append(segment)
-                    continue
-
-                distance_segment = segment["distance"]
-
-                if start_time_segment.date() != peak_day_date or end_time_segment.date() != peak_day_date:
-                    fix_start = start_time_segment.date() != peak_day_date
-                    time_overdue = (peak_day_datetime_start - start_time_segment if fix_start else end_time_segment - peak_day_datetime_end).total_seconds()
-                    relative_time_spent = time_overdue / (end_time_segment - start_time_segment).total_seconds()
-                    distance_segment = distance_segment - (relative_time_spent * distance_segment)
-                    start_time_segment = peak_day_datetime_start if fix_start else start_time_segment
-                    end_time_segment = peak_day_datetime_end if not fix_start else end_time_segment
-
-                trip["distance"] += distance_segment
-                trip["trip_segments"].append(
+    """
+    Extracts the trips of the day with the most driven kilometers. The distance of every trip segment, or of the
+    trip itself if it has no segments, is spread evenly over the days it spans to find the peak day. The trips on
+    the peak day are clipped to it; segments that neither start nor end on the peak day are left out and the
+    distance of segments and trips crossing midnight is reduced by the share of time spent outside the peak day.
+
+    Parameters
+    ----------
+    data    :   pd.DataFrame of roundtrips with start_time, end_time, distance and optionally trip_segments
+
+    Returns
+    -------
+    peak_day    :   pd.DataFrame of the peak day trips with distance, trip_segments, start_time and end_time
+    """
+    start_times = _to_nanoseconds(data.start_time)
+    end_times = _to_nanoseconds(data.end_time)
+    distances = data.distance.to_numpy(dtype=float)
+    if "trip_segments" in data:
+        (
+            positions,
+            segment_starts,
+            segment_ends,
+            segment_distances,
+        ) = _explode_segments(data.trip_segments)
+    else:
+        positions = np.empty(0, dtype=np.int64)
+        segment_starts = segment_ends = np.empty(0, dtype=np.int64)
+        segment_distances = np.empty(0)
+    without_segments = np.bincount(positions, minlength=len(data)) == 0
+
+    peak_day = _peak_day(
+        np.concatenate((segment_starts, start_times[without_segments])),
+        np.concatenate((segment_ends, end_times[without_segments])),
+        np.concatenate((segment_distances, distances[without_segments])),
+    )
+
+    on_peak_day = (start_times // DAY_NANOSECONDS <= peak_day) & (
+        end_times // DAY_NANOSECONDS >= peak_day
+    )
+    trip_count = int(on_peak_day.sum())
+    start_times, end_times, distances = (
+        start_times[on_peak_day],
+        end_times[on_peak_day],
+        distances[on_peak_day],
+    )
+
+    # only the segments that start or end on the peak day are used
+    kept = on_peak_day[positions] & (
+        (segment_starts // DAY_NANOSECONDS == peak_day)
+        | (segment_ends // DAY_NANOSECONDS == peak_day)
+    )
+    positions = (np.cumsum(on_peak_day) - 1)[positions[kept]]
+    segment_starts, segment_ends, segment_distances = _clip_to_day(
+        segment_starts[kept],
+        segment_ends[kept],
+        segment_distances[kept],
+        peak_day,
+    )
+
+    # trips with segments on the peak day span from their first to their last segment
+    segment_total = np.bincount(
+        positions, weights=segment_distances, minlength=trip_count
+    )
+    from_segments = segment_total != 0
+    trip_index = np.arange(trip_count)
+    first = np.searchsorted(positions, trip_index)
+    last = np.searchsorted(positions, trip_index, side="right") - 1
+    start_times = np.where(
+        from_segments, np.append(segment_starts, 0)[first], start_times
+    )
+    end_times = np.where(from_segments, np.append(segment_ends, 0)[last], end_times)
+    distances = np.where(from_segments, segment_total, distances)
+    start_times, end_times, distances = _clip_to_day(
+        start_times, end_times, distances, peak_day
+    )
+
+    segment_starts = (segment_starts // 1000).astype("datetime64[us]").tolist()
+    segment_ends = (segment_ends // 1000).astype("datetime64[us]").tolist()
+    segment_distances = segment_distances.tolist()
+    offsets = np.append(first, len(positions))
+    return pd.DataFrame(
+        {
+            "distance": distances,
+            "trip_segments": [
+                [
                     {
-                        "start_time": start_time_segment,
-                        "end_time": end_time_segment,
-                        "distance": distance_segment
+                        "start_time": segment_starts[segment],
+                        "end_time": segment_ends[segment],
+                        "distance": segment_distances[segment],
                     }
-                )
+                    for segment in range(offsets[trip], offsets[trip + 1])
+                ]
+                for trip in trip_index
+            ],
+            "start_time": start_times.astype("datetime64[ns]"),
+            "end_time": end_times.astype("datetime64[ns]"),
+        }
+    )
 
-        trip["start_time"] = (
-            row.start_time.to_pydatetime()
-            if trip["distance"] == 0 or not hasattr(row, "trip_segments")
-            else trip["trip_segments"][0]["start_time"]
-        )
-        trip["end_time"] = (
-            row.end_time.to_pydatetime()
-            if trip["distance"] == 0 or not hasattr(row, "trip_segments")
-            else trip["trip_segments"][-1]["end_time"]
-        )
-        trip["distance"] = row.distance if trip["distance"] == 0 else trip["distance"]
 
-        total_trip_time = None
+def _explode_segments(trip_segments: pd.Series):
+    """Flattens the trip segments into the position of their roundtrip and arrays of start, end and distance"""
+    segment_counts = trip_segments.map(len).to_numpy()
+    segments = pd.DataFrame(
+        [segment for segments in trip_segments for segment in segments],
+        columns=["start_time", "end_time", "distance"],
+    )
+    return (
+        np.repeat(np.arange(len(segment_counts)), segment_counts),
+        _to_nanoseconds(segments.start_time),
+        _to_nanoseconds(segments.end_time),
+        segments.distance.to_numpy(dtype=float),
+    )
 
-        if trip["start_time"].date() != peak_day_date:
-            total_trip_time = (trip["end_time"] - trip["start_time"]).total_seconds()
-            time_overdue = (peak_day_datetime_start - trip["start_time"]).total_seconds()
-            relative_time_spent = time_overdue / total_trip_time
-            trip["start_time"] = peak_day_datetime_start
-            trip["distance"] = trip["distance"] - (relative_time_spent * trip["distance"])
 
-        if trip["end_time"].date() != peak_day_date:
-            if total_trip_time is None:
-                total_trip_time = (trip["end_time"] - trip["start_time"]).total_seconds()
-            time_overdue = (trip["end_time"] - peak_day_datetime_end).total_seconds()
-            relative_time_spent = time_overdue / total_trip_time
-            trip["end_time"] = peak_day_datetime_end
-            trip["distance"] = trip["distance"] - (relative_time_spent * trip["distance"])
+def _peak_day(
+    start_times: np.ndarray, end_times: np.ndarray, distances: np.ndarray
+) -> int:
+    """The day, in days since epoch, with the most distance when spreading the distances evenly over their days"""
+    start_days = start_times // DAY_NANOSECONDS
+    day_counts = end_times // DAY_NANOSECONDS - start_days + 1
+    spanning = day_counts > 0
+    start_days, day_counts = start_days[spanning], day_counts[spanning]
+    daily_distances = np.nan_to_num(distances[spanning] / day_counts)
+
+    # one entry for every day of every period
+    period = np.repeat(np.arange(len(day_counts)), day_counts)
+    day_offsets = np.arange(len(period)) - np.repeat(
+        np.cumsum(day_counts) - day_counts, day_counts
+    )
+    days = start_days[period] + day_offsets
+    first_day = days.min()
+    daily_totals = np.bincount(days - first_day, weights=daily_distances[period])
+    return int(first_day + np.argmax(daily_totals))
 
-        peak_day.append(trip)
 
-    return pd.DataFrame(peak_day)
+def _clip_to_day(
+    start_times: np.ndarray, end_times: np.ndarray, distances: np.ndarray, day: int
+):
+    """
+    Clips the periods to the day, in days since epoch. The distance is reduced by the share of the original
+    duration spent before and after the day.
+    """
+    day_start = day * DAY_NANOSECONDS
+    day_end = day_start + DAY_NANOSECONDS - 10**9
+    before = start_times // DAY_NANOSECONDS != day
+    after = end_times // DAY_NANOSECONDS != day
+    durations = (end_times - start_times) / 10**9
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = np.where(
+            before,
+            distances - (day_start - start_times) / 10**9 / durations * distances,
+            distances,
+        )
+        distances = np.where(
+            after,
+            distances - (end_times - day_end) / 10**9 / durations * distances,
+            distances,
+        )
+    return (
+        np.where(before, day_start, start_times),
+        np.where(after, day_end, end_times),
+        distances,
+    )
 
 
 def __simulate_avg_day(data, seed, padding):
@@ -199,9 +264,7 @@ def __simulate_avg_day(data, seed, padding):
         lambda x: __minutes_since_midnight(x.to_pydatetime())
     )
 
-    # Histogram bins: 1 bin pr 10 km and 1 bin pr. 15 min
-    distance_bins = round((round(data["distance"].max() - data["distance"].min())) / 10)
-    start_time_bins = round((start_times.max() - start_times.min()) / 15)
+    distance_bins, start_time_bins = _histogram_bins(data["distance"], start_times)
     if distance_bins == 0:
         simulated_day = []
         for k, trip in enumerate(data.itertuples()):
@@ -215,28 +278,15 @@ def __simulate_avg_day(data, seed, padding):
             )
         return simulated_day
 
-    (
-        hist,
-        x_bins,
-        y_bins,
-    ) = np.histogram2d(distances, start_times, bins=(distance_bins, start_time_bins))
-    x_bin_midpoints = (x_bins[:-1] + x_bins[1:]) / 2
-    y_bin_midpoints = (y_bins[:-1] + y_bins[1:]) / 2
-
-    cdf = np.cumsum(hist.flatten())
-    cdf = cdf / cdf[-1]
+    histogram = _trip_histogram(
+        distances, start_times, (distance_bins, start_time_bins)
+    )
 
     if seed != None:
         np.random.seed(seed)
 
     values = np.random.rand(avg_trips_pr_day)
-    value_bins = np.searchsorted(cdf, values)
-
-    x_idx, y_idx = np.unravel_index(
-        value_bins, (len(x_bin_midpoints), len(y_bin_midpoints))
-    )
-    random_from_cdf = np.column_stack((x_bin_midpoints[x_idx], y_bin_midpoints[y_idx]))
-    new_distances, new_start_times = random_from_cdf.T
+    new_distances, new_start_times = _sample_histogram(histogram, values)
 
     simulated_day = []
 
@@ -255,57 +305,240 @@ def __simulate_avg_day(data, seed, padding):
     return simulated_day
 
 
-def shiftify(roundtrips, shifts):
-    def create_aggregate(routes):
-        use_trip_segment = True if "trip_segments" in routes[0]._asdict() else False
-        aggregated_routes = {
-            "id": routes[0].id,
-            "start_time": routes[0].start_time,
-            "end_time": routes[-1].end_time,
-            "length": len(routes),
-            "car_id": routes[0].car_id,
-            "belongs_tos": [a.belongs_to for a in routes][0],
-            "distance": sum([a.distance for a in routes]),
-            "start_latitude": routes[0].start_latitude,
-            "start_longitude": routes[0].start_longitude,
-            "end_latitude": routes[0].end_latitude,
-            "end_longitude": routes[0].end_longitude,
-            "start_location_id": routes[0].start_location_id,
-            "aggregation_type": None
-            if "aggregation_type" not in routes[0]._asdict()
-            else (
-                "complete"
-                if any(
+def _histogram_bins(distances, start_minutes) -> tuple[int, int]:
+    """Histogram bins: 1 bin pr 10 km and 1 bin pr. 15 min"""
+    return (
+        round((round(np.max(distances) - np.min(distances))) / 10),
+        round((np.max(start_minutes) - np.min(start_minutes)) / 15),
+    )
+
+
+def _trip_histogram(distances, start_minutes, bins: tuple[int, int]):
+    """
+    The CDF of the 2D histogram of the distances and the start times, in minutes since midnight, of the trips
+    together with the bin edges of both dimensions.
+    """
+    (
+        hist,
+        x_bins,
+        y_bins,
+    ) = np.histogram2d(distances, start_minutes, bins=bins)
+
+    cdf = np.cumsum(hist.flatten())
+    cdf = cdf / cdf[-1]
+    return cdf, x_bins, y_bins
+
+
+def _sample_histogram(
+    histogram, values: np.ndarray, positions: np.ndarray = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Maps uniform random values to the distance and start minutes of the histogram bin they fall in. The samples
+    are the bin midpoints, unless the relative positions within the bins are passed as a (2, n) array.
+    """
+    cdf, x_bins, y_bins = histogram
+    value_bins = np.searchsorted(cdf, values)
+
+    x_idx, y_idx = np.unravel_index(value_bins, (len(x_bins) - 1, len(y_bins) - 1))
+    if positions is None:
+        x_bin_midpoints = (x_bins[:-1] + x_bins[1:]) / 2
+        y_bin_midpoints = (y_bins[:-1] + y_bins[1:]) / 2
+        return x_bin_midpoints[x_idx], y_bin_midpoints[y_idx]
+    return (
+        x_bins[x_idx] + positions[0] * (x_bins[x_idx + 1] - x_bins[x_idx]),
+        y_bins[y_idx] + positions[1] * (y_bins[y_idx + 1] - y_bins[y_idx]),
+    )
+
+
+@dataclass
+class SyntheticTrips:
+    """
+    Columnar roundtrips and trip segments made by generate_synthetic_trips. The times are datetime64[ns] arrays and
+    segment k belongs to the roundtrip at position segment_roundtrip[k].
+    """
+
+    car_id: np.ndarray
+    start_location_id: np.ndarray
+    start_time: np.ndarray
+    end_time: np.ndarray
+    distance: np.ndarray
+    segment_roundtrip: np.ndarray
+    segment_start_time: np.ndarray
+    segment_end_time: np.ndarray
+    segment_distance: np.ndarray
+
+    def __len__(self):
+        return len(self.distance)
+
+    def to_frame(self, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        The roundtrips from position start to stop as a frame with their trip_segments, with the columns of the
+        roundtrips of the aggregator. The id is the position of the roundtrip.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        first, last = np.searchsorted(self.segment_roundtrip, [start, stop])
+        offsets = (
+            np.searchsorted(self.segment_roundtrip, np.arange(start, stop + 1)) - first
+        )
+        segment_starts = (
+            self.segment_start_time[first:last].astype("datetime64[us]").tolist()
+        )
+        segment_ends = self.segment_end_time[first:last].astype("datetime64[us]").tolist()
+        segment_distances = self.segment_distance[first:last].tolist()
+        trip_count = stop - start
+        return pd.DataFrame(
+            {
+                "id": np.arange(start, stop),
+                "start_time": self.start_time[start:stop],
+                "end_time": self.end_time[start:stop],
+                "start_latitude": np.zeros(trip_count),
+                "start_longitude": np.zeros(trip_count),
+                "end_latitude": np.zeros(trip_count),
+                "end_longitude": np.zeros(trip_count),
+                "distance": self.distance[start:stop],
+                "car_id": self.car_id[start:stop],
+                "start_location_id": self.start_location_id[start:stop],
+                "aggregation_type": "synthetic",
+                "trip_segments": [
                     [
-                        pd.isna(typ.aggregation_type) is False
-                        and "complete" in typ.aggregation_type
-                        for typ in routes
+                        {
+                            "start_time": segment_starts[segment],
+                            "end_time": segment_ends[segment],
+                            "distance": segment_distances[segment],
+                        }
+                        for segment in range(offsets[trip], offsets[trip + 1])
                     ]
-                )
-                else routes[0].aggregation_type
-            ),
-            "address": getattr(routes[0], "address", None),
-            "trip_segments": [
-                segment for trip in routes for segment in trip.trip_segments
-            ]
-            if use_trip_segment
-            else [],
-            "plate": getattr(routes[0], "plate", None),
-            "make": getattr(routes[0], "make", None),
-            "model": getattr(routes[0], "model", None),
-            "department": getattr(routes[0], "department", None),
-        }
-        return aggregated_routes
+                    for trip in range(trip_count)
+                ],
+            }
+        )
+
+
+def generate_synthetic_trips(
+    data: pd.DataFrame,
+    cars: dict[int, list[int]],
+    days: int,
+    start_date: date = None,
+    trips_per_day: int = None,
+    seed: int = None,
+    padding: float = 1.2,
+    segment_minutes: float = 15,
+    engine: Engine = None,
+) -> SyntheticTrips:
+    """
+    Generates roundtrips for every day and location by sampling the distance and start
+    time from the 2D histogram of the sample trips, like the simulated average day, but
+    uniformly within the sampled bins. Each trip is assigned to a car of its location
+    that is free at its start time, or to the car that is free the earliest if all cars
+    are busy. The trips are split in segments of about segment_minutes.
+
+    Parameters
+    ----------
+    data    :   pd.DataFrame of the sample trips with start_time, end_time and distance
+    cars    :   the car ids of every location to generate trips for
+    days    :   number of days to generate
+    start_date  :   first day to generate, defaults to the day after the last sample trip
+    trips_per_day   :   trips pr. location pr. day, defaults to the average of the sample days times the padding
+    seed    :   seed of the random generator, the same seed gives the same trips
+    padding :   increases the default amount of trips pr. day by a percentage
+    segment_minutes :   approximate duration of the trip segments
+    engine  :   if passed, the trips are bulk loaded into the database through seeding.seed_synthetic_roundtrips
+
+    Returns
+    -------
+    trips   :   SyntheticTrips ordered by day, location and start time
+    """
+    if len(cars) == 0 or any(len(car_ids) == 0 for car_ids in cars.values()):
+        raise ValueError("Every location needs at least one car to generate trips for")
+    start_times = _to_nanoseconds(data.start_time)
+    end_times = _to_nanoseconds(data.end_time)
+    sample_distances = data.distance.to_numpy(dtype=float)
+    start_minutes = start_times % DAY_NANOSECONDS // 10**9 / 60
+    if start_date is None:
+        start_date = (
+            pd.Timestamp(start_times.max() // DAY_NANOSECONDS * DAY_NANOSECONDS)
+            + pd.Timedelta(days=1)
+        ).date()
+    if trips_per_day is None:
+        trips_per_day = round(
+            len(data) / len(np.unique(start_times // DAY_NANOSECONDS)) * padding
+        )
+    # the duration of the trips follows the average speed of the sample trips
+    nanoseconds_pr_km = (end_times - start_times).sum() / sample_distances.sum()
+
+    histogram = _trip_histogram(
+        sample_distances,
+        start_minutes,
+        np.maximum(_histogram_bins(sample_distances, start_minutes), 1),
+    )
+    rng = np.random.default_rng(seed)
+    location_count = len(cars)
+    trip_count = days * location_count * trips_per_day
+    distances, start_minutes = _sample_histogram(
+        histogram, rng.random(trip_count), rng.random((2, trip_count))
+    )
+
+    day = np.repeat(np.arange(days), location_count * trips_per_day)
+    location = np.tile(np.repeat(np.arange(location_count), trips_per_day), days)
+    start_times = (
+        pd.Timestamp(start_date).value
+        + day * DAY_NANOSECONDS
+        + (start_minutes * 60).astype(np.int64) * 10**9
+    )
+    order = np.lexsort((start_times, location, day))
+    distances, start_times, location = (
+        distances[order],
+        start_times[order],
+        location[order],
+    )
+    durations = (distances * nanoseconds_pr_km // 10**9).astype(np.int64) * 10**9
+
+    car_ids = np.concatenate([np.asarray(car_ids) for car_ids in cars.values()])
+    car_counts = np.array([len(car_ids) for car_ids in cars.values()])
+    car_offsets = np.cumsum(car_counts) - car_counts
+    car_id = car_ids[
+        car_offsets[location]
+        + _assign_cars(location, start_times, start_times + durations, car_counts)
+    ]
+
+    segment_counts = np.maximum(
+        np.rint(durations / (segment_minutes * 60 * 10**9)).astype(np.int64), 1
+    )
+    segment_roundtrip = np.repeat(np.arange(trip_count), segment_counts)
+    segment_index = np.arange(len(segment_roundtrip)) - np.repeat(
+        np.cumsum(segment_counts) - segment_counts, segment_counts
+    )
+    segment_durations = durations[segment_roundtrip]
+    segment_start = start_times[segment_roundtrip]
+    segment_splits = segment_counts[segment_roundtrip]
+
+    trips = SyntheticTrips(
+        car_id=car_id,
+        start_location_id=np.array(list(cars))[location],
+        start_time=start_times.astype("datetime64[ns]"),
+        end_time=(start_times + durations).astype("datetime64[ns]"),
+        distance=distances,
+        segment_roundtrip=segment_roundtrip,
+        segment_start_time=(
+            segment_start + segment_durations * segment_index // segment_splits
+        ).astype("datetime64[ns]"),
+        segment_end_time=(
+            segment_start + segment_durations * (segment_index + 1) // segment_splits
+        ).astype("datetime64[ns]"),
+        segment_distance=distances[segment_roundtrip] / segment_splits,
+    )
+    if engine is not None:
+        seed_synthetic_roundtrips(engine, trips)
+    return trips
 
-    def within_breaktime(break_period, end_time):
-        if break_period is None:
-            return False
-        start_break, end_break = break_period
-        if start_break < end_break:
-            return start_break <= end_time <= end_break
-        else:
-            return end_time >= start_break or end_time <= end_break
 
+def shiftify(roundtrips, shifts):
+    """
+    Aggregates the roundtrips of each car to one trip per shift. A trip belongs to the shift it overlaps the most,
+    and consecutive trips of the same shift are aggregated until the shift changes, the day changes (unless it's
+    the overnight shift), the aggregate exceeds the longest shift or a trip ends within half an hour of the shift
+    break. Trips longer than a day and trips without a car are kept as they are.
+    """
     midnight = time(hour=0)
 
     shifts = [
@@ -322,15 +555,15 @@ def shiftify(roundtrips, shifts):
 
     half_an_our = timedelta(seconds=60 * 30)
 
-    breaks = {
-        str(k): a["break"]
+    breaks = [
+        None
         if pd.isna(a["break"])
         else (
             (datetime.combine(date(1, 1, 1), a["break"]) - half_an_our).time(),
             (datetime.combine(date(1, 1, 1), a["break"]) + half_an_our).time(),
         )
-        for k, a in enumerate(shifts)
-    }
+        for a in shifts
+    ]
     max_shift = max(
         [
             datetime.combine(date(1, 1, 1), a["shift_end"])
@@ -338,104 +571,361 @@ def shiftify(roundtrips, shifts):
             for a in shifts
         ]
         + [timedelta(hours=24) / len(shifts)]
+    ) // timedelta(microseconds=1) * 1000
+
+    overnight_shift = ([k for k, a in enumerate(shifts) if a["overnight"]] + [None])[0]
+
+    start_times = _to_nanoseconds(roundtrips.start_time)
+    end_times = _to_nanoseconds(roundtrips.end_time)
+    belongs_to = shift_overlap_seconds(
+        roundtrips.start_time, roundtrips.end_time, shifts
+    ).argmax(axis=1)
+    within_break = _within_breaktime(end_times, belongs_to, breaks)
+
+    # trip positions of each car sorted by start time, trips without a car are collected under -1
+    car_codes, cars = pd.factorize(roundtrips.car_id)
+    by_start = np.argsort(start_times, kind="stable")
+    by_car = by_start[np.argsort(car_codes[by_start], kind="stable")]
+    car_bounds = np.concatenate(
+        ([0], np.cumsum(np.bincount(car_codes + 1, minlength=len(cars) + 1)))
     )
 
-    overnight_shift = [str(k) for k, a in enumerate(shifts) if a["overnight"]] + [None]
-    overnight_shift = overnight_shift[0]
-    multi_days = timedelta(days=1)
-    new_trips = pd.DataFrame()
-    # for each unique car
+    positions = []
+    groups = []
+    emitted = []
+    index = []
     for car in roundtrips.car_id.unique():
-        # sort by trip start time and copy
-        c_trips = (
-            roundtrips[roundtrips.car_id == car].sort_values(["start_time"]).copy()
-        )
         if car is None:
-            c_trips = (
-                roundtrips[roundtrips.car_id.isna()].sort_values(["start_time"]).copy()
-            )
-        # if the car has no associated trips do nothing
-        if len(c_trips) == 0:
+            car_code = -1
+        elif pd.isna(car):
             continue
-        for k, shift in enumerate(shifts):
-            c_trips[str(k)] = c_trips.apply(
-                alternate, ssh=shift["shift_start"], seh=shift["shift_end"], axis=1
-            )
-        c_trips["belongs_to"] = c_trips.iloc[:, -len(shifts) :].idxmax(axis=1)
-        c_trips["duration"] = c_trips.end_time - c_trips.start_time
-
-        prev = None
-        prev_date = None
-        agg_trip = []
-        c_rt = []
-        for trip in c_trips.itertuples():
-            if car is None or trip.duration > timedelta(hours=24):
-                agg_trip.append(create_aggregate([trip]))
-                continue
-
-            if prev is None:
-                prev = trip.belongs_to
-                prev_date = trip.start_time
-
-            was_a_break = False
-
-            allowed_break = breaks[trip.belongs_to]
-            # todo what to do with the none car_id?
-            if (
-                (prev != trip.belongs_to)
-                or (
-                    prev_date.date() != trip.start_time.date()
-                    and trip.belongs_to != overnight_shift
-                )
-                or (
-                    len(c_rt) > 0 and trip.start_time - c_rt[-1].start_time >= max_shift
-                )
-                or (trip.end_time - trip.start_time >= multi_days)
-                or (within_breaktime(allowed_break, trip.end_time.time()))
-            ):
-                if within_breaktime(allowed_break, trip.end_time.time()):
-                    was_a_break = True
-
-                    if (
-                        prev == trip.belongs_to
-                    ):  # the previous was the same so they belong
-                        if (
-                            len(c_rt) > 0
-                            and trip.start_time - c_rt[-1].start_time >= max_shift
-                        ) or (
-                            prev_date.date() != trip.start_time.date()
-                            and trip.belongs_to != overnight_shift
-                        ):
-                            agg_trip.append(create_aggregate(c_rt))
-                            agg_trip.append(create_aggregate([trip]))
-                        else:
-                            c_rt.append(trip)
-                            agg_trip.append(create_aggregate(c_rt))
-
-                    else:  # separate shifts
-                        agg_trip.append(create_aggregate(c_rt))
-                        agg_trip.append(create_aggregate([trip]))
+        else:
+            car_code = cars.get_loc(car)
+        c_trips = by_car[car_bounds[car_code + 1]: car_bounds[car_code + 2]]
+        c_groups, c_emitted = _shift_groups(
+            start_times[c_trips],
+            end_times[c_trips],
+            belongs_to[c_trips],
+            within_break[c_trips],
+            overnight_shift,
+            max_shift,
+            keep_separate=car is None,
+        )
+        offset = len(emitted)
+        positions.append(c_trips)
+        groups.append(c_groups + offset)
+        emitted += [group + offset for group in c_emitted]
+        index.append(np.arange(len(c_emitted)))
+
+    if len(emitted) == 0:
+        return pd.DataFrame()
+    return _aggregate_shift_groups(
+        roundtrips,
+        np.concatenate(positions),
+        np.concatenate(groups),
+        np.asarray(emitted),
+        belongs_to,
+        np.concatenate(index),
+    )
 
-                else:
-                    agg_trip.append(create_aggregate(c_rt))
 
-                prev = None
-                prev_date = None
-                c_rt = []
+DAY_NANOSECONDS = 24 * 60 * 60 * 10**9
 
-            if was_a_break is False:
-                c_rt.append(trip)
-                prev = trip.belongs_to
-                prev_date = trip.start_time
 
-        if c_rt:
-            agg_trip.append(create_aggregate(c_rt))
+def _to_nanoseconds(timestamps: pd.Series) -> np.ndarray:
+    return pd.to_datetime(timestamps).to_numpy("datetime64[ns]").astype(np.int64)
 
-        new_trips = pd.concat(
-            [new_trips, pd.DataFrame(agg_trip)]
-        )  # new_trips.append(agg_trip, ignore_index=True)
 
-    return new_trips
+def _assign_cars(
+    location: np.ndarray,
+    start_times: np.ndarray,
+    end_times: np.ndarray,
+    car_counts: np.ndarray,
+) -> np.ndarray:
+    """
+    The position of the car within its location of every trip. The trips must be ordered by start time within each
+    location. A heap of the times the cars of each location are free again gives the car that has been free the
+    longest, or the car that is free the earliest if all are busy.
+    """
+    # (free at, position) of the cars, all free from the start and taken in the order of the location
+    free_at = [[(-1, car) for car in range(count)] for count in car_counts.tolist()]
+    assigned = np.empty(len(location), dtype=np.int64)
+    for trip, (trip_location, start, end) in enumerate(
+        zip(location.tolist(), start_times.tolist(), end_times.tolist())
+    ):
+        cars = free_at[trip_location]
+        car_free_at, car = cars[0]
+        heapq.heapreplace(cars, (max(car_free_at, end), car))
+        assigned[trip] = car
+    return assigned
+
+
+def _time_nanoseconds(time_of_day: time) -> int:
+    seconds = (time_of_day.hour * 60 + time_of_day.minute) * 60 + time_of_day.second
+    return (seconds * 10**6 + time_of_day.microsecond) * 1000
+
+
+def _within_breaktime(
+    end_times: np.ndarray, belongs_to: np.ndarray, breaks: list
+) -> np.ndarray:
+    """Whether each trip ends within the break period of the shift it belongs to"""
+    end_of_day = end_times % DAY_NANOSECONDS
+    within = np.zeros(len(end_times), dtype=bool)
+    for k, break_period in enumerate(breaks):
+        if break_period is None:
+            continue
+        start_break, end_break = map(_time_nanoseconds, break_period)
+        if start_break < end_break:
+            in_break = (start_break <= end_of_day) & (end_of_day <= end_break)
+        else:
+            in_break = (end_of_day >= start_break) | (end_of_day <= end_break)
+        within |= (belongs_to == k) & in_break
+    return within
+
+
+def _shift_groups(
+    start_times: np.ndarray,
+    end_times: np.ndarray,
+    belongs_to: np.ndarray,
+    within_break: np.ndarray,
+    overnight_shift: int | None,
+    max_shift: int,
+    keep_separate: bool = False,
+) -> tuple[np.ndarray, list[int]]:
+    """
+    Walks the trips of a car in order and assigns each to an aggregate.
+
+    Returns
+    -------
+    groups  :   aggregate number of each trip
+    emitted :   aggregate numbers in the order they are completed
+    """
+    durations = end_times - start_times
+    start_days = start_times // DAY_NANOSECONDS
+    groups = np.empty(len(start_times), dtype=np.int64)
+    emitted = []
+    next_group = 0
+    current = None
+    current_start = None
+    prev = None
+    prev_day = None
+
+    def single(trip):
+        nonlocal next_group
+        groups[trip] = next_group
+        emitted.append(next_group)
+        next_group += 1
+
+    def append(trip):
+        nonlocal current, current_start, next_group
+        if current is None:
+            current = next_group
+            next_group += 1
+        groups[trip] = current
+        current_start = start_times[trip]
+
+    for trip in range(len(start_times)):
+        if keep_separate or durations[trip] > DAY_NANOSECONDS:
+            single(trip)
+            continue
+
+        if prev is None:
+            prev = belongs_to[trip]
+            prev_day = start_days[trip]
+
+        was_a_break = False
+        new_day = prev_day != start_days[trip] and belongs_to[trip] != overnight_shift
+        too_long = current is not None and start_times[trip] - current_start >= max_shift
+        if (
+            prev != belongs_to[trip]
+            or new_day
+            or too_long
+            or durations[trip] >= DAY_NANOSECONDS
+            or within_break[trip]
+        ):
+            if within_break[trip]:
+                was_a_break = True
+                # the previous was the same so they belong
+                if prev == belongs_to[trip] and not (too_long or new_day):
+                    append(trip)
+                    emitted.append(current)
+                else:
+                    if current is not None:
+                        emitted.append(current)
+                    single(trip)
+            elif current is not None:
+                emitted.append(current)
+
+            prev = None
+            prev_day = None
+            current = None
+
+        if was_a_break is False:
+            append(trip)
+            prev = belongs_to[trip]
+            prev_day = start_days[trip]
+
+    if current is not None:
+        emitted.append(current)
+    return groups, emitted
+
+
+def _aggregate_shift_groups(
+    roundtrips: pd.DataFrame,
+    positions: np.ndarray,
+    groups: np.ndarray,
+    emitted: np.ndarray,
+    belongs_to: np.ndarray,
+    index: np.ndarray,
+) -> pd.DataFrame:
+    """
+    Reduces the trips of each aggregate to one trip. positions are the rows of the trips in the order they were
+    walked, groups their aggregate and emitted the order of the aggregates in the output.
+    """
+    group_count = len(emitted)
+    first = np.empty(group_count, dtype=np.int64)
+    first[groups[::-1]] = positions[::-1]
+    last = np.empty(group_count, dtype=np.int64)
+    last[groups] = positions
+    first, last = first[emitted], last[emitted]
+
+    def first_values(column):
+        if column not in roundtrips:
+            return None
+        return roundtrips[column].to_numpy()[first]
+
+    distance = roundtrips.distance.to_numpy()
+    summed_distance = np.bincount(
+        groups, weights=distance[positions], minlength=group_count
+    )[emitted]
+    if distance.dtype.kind in "iu":
+        summed_distance = summed_distance.astype(distance.dtype)
+
+    if "aggregation_type" in roundtrips:
+        aggregation_type = roundtrips.aggregation_type.to_numpy()
+        is_complete = np.array(
+            [
+                pd.isna(typ) is False and "complete" in typ
+                for typ in aggregation_type
+            ],
+            dtype=bool,
+        )
+        any_complete = (
+            np.bincount(groups, weights=is_complete[positions], minlength=group_count)[emitted] > 0
+        )
+        aggregation_type = np.where(any_complete, "complete", aggregation_type[first])
+    else:
+        aggregation_type = None
+
+    if "trip_segments" in roundtrips:
+        segments_of_trip = roundtrips.trip_segments.to_numpy()
+        members = positions[np.argsort(groups, kind="stable")]
+        group_members = np.split(
+            members, np.cumsum(np.bincount(groups, minlength=group_count))[:-1]
+        )
+        trip_segments = [
+            [segment for trip in group_members[group] for segment in segments_of_trip[trip]]
+            for group in emitted
+        ]
+    else:
+        trip_segments = [[] for _ in range(group_count)]
+
+    return pd.DataFrame(
+        {
+            "id": first_values("id"),
+            "start_time": first_values("start_time"),
+            "end_time": roundtrips.end_time.to_numpy()[last],
+            "length": np.bincount(groups, minlength=group_count)[emitted],
+            "car_id": first_values("car_id"),
+            "belongs_tos": belongs_to[first].astype(str),
+            "distance": summed_distance,
+            "start_latitude": first_values("start_latitude"),
+            "start_longitude": first_values("start_longitude"),
+            "end_latitude": first_values("end_latitude"),
+            "end_longitude": first_values("end_longitude"),
+            "start_location_id": first_values("start_location_id"),
+            "aggregation_type": aggregation_type,
+            "address": first_values("address"),
+            "trip_segments": trip_segments,
+            "plate": first_values("plate"),
+            "make": first_values("make"),
+            "model": first_values("model"),
+            "department": first_values("department"),
+        },
+        index=index,
+    )
+
+
+def shift_overlap_seconds(start_times, end_times, shifts: list[dict]) -> np.ndarray:
+    """
+    Vectorised alternate. Returns the seconds each trip spends in each shift as an array of shape
+    (trips, shifts), handling trips and shifts that run over midnight the same way alternate does.
+    """
+    starts = _to_nanoseconds(pd.Series(start_times))
+    ends = _to_nanoseconds(pd.Series(end_times))
+    start_of_day = starts % DAY_NANOSECONDS
+    end_of_day = ends % DAY_NANOSECONDS
+    duration = ends - starts
+    over_midnight = start_of_day > end_of_day
+
+    overlaps = np.zeros((len(starts), len(shifts)))
+    for k, shift in enumerate(shifts):
+        ss = _time_nanoseconds(shift["shift_start"])
+        se = _time_nanoseconds(shift["shift_end"])
+        s, e = start_of_day, end_of_day
+        if ss > se:
+            # the shift runs over midnight
+            route_over_midnight = np.select(
+                [
+                    (s <= ss) & (e >= se),
+                    (s <= ss) & (e <= se),
+                    (s >= ss) & (e <= se),
+                    (s >= ss) & (e >= se),
+                ],
+                [
+                    DAY_NANOSECONDS + se - ss,
+                    DAY_NANOSECONDS + e - ss,
+                    duration,
+                    duration - e + se,
+                ],
+            )
+            alt_es = DAY_NANOSECONDS + se
+            tran_s = np.where(e < ss, s + DAY_NANOSECONDS, s)
+            tran_e = np.where(e < ss, e + DAY_NANOSECONDS, e)
+            route_within_day = np.select(
+                [
+                    (tran_s <= ss) & (tran_e <= alt_es),
+                    (tran_s <= ss) & (tran_e >= alt_es),
+                    (tran_s >= ss) & (tran_e >= alt_es),
+                    (tran_s >= ss) & (tran_e <= alt_es),
+                ],
+                [tran_e - ss, alt_es - ss, alt_es - tran_s, tran_e - tran_s],
+            )
+        else:
+            tran_e = DAY_NANOSECONDS + e
+            alt_ss = np.where(se < s, ss + DAY_NANOSECONDS, ss)
+            alt_es = np.where(se < s, se + DAY_NANOSECONDS, se)
+            route_over_midnight = np.select(
+                [
+                    (s >= alt_ss) & (tran_e >= alt_es),
+                    (s >= alt_ss) & (tran_e <= alt_es),
+                    (s <= alt_ss) & (tran_e <= alt_es),
+                    (s <= alt_ss) & (tran_e >= alt_es),
+                ],
+                [alt_es - s, tran_e - s, tran_e - alt_ss, alt_es - alt_ss],
+            )
+            route_within_day = np.select(
+                [
+                    (s >= ss) & (e <= se),
+                    (s >= ss) & (e >= se),
+                    (s <= ss) & (e >= se),
+                    (s <= ss) & (e <= se),
+                ],
+                [e - s, se - s, se - ss, e - ss],
+            )
+        overlap = np.where(over_midnight, route_over_midnight, route_within_day)
+        overlaps[:, k] = np.maximum(overlap, 0) / 10**9
+    return overlaps
 
 
 def alternate(row, ssh=time(hour=7), seh=time(hour=15)):
@@ -550,21 +1040,47 @@ def alternate(row, ssh=time(hour=7), seh=time(hour=15)):
 
 
 def get_kilometer_per_hour(roundtrip_frame, engine):
-    batch_size = 2000
-
-    round_trip_ids = roundtrip_frame.id.values.tolist()
-    batches = [round_trip_ids[i:i + batch_size] for i in range(0, len(round_trip_ids), batch_size)]
-    aggregated_frame = pd.DataFrame()
+    """
+    Adds the km/h of effective driving to the roundtrips, i.e. the distance over the summed duration of the
+    segments. Roundtrips loaded with their trip_segments, like from Trips.load_trips, are aggregated in memory,
+    other frames read the segment aggregate of their ids from the database. Roundtrips without segments fall back
+    to the distance over the roundtrip duration.
+    """
+    if "trip_segments" in roundtrip_frame:
+        aggregated_frame = aggregate_segments(roundtrip_frame)
+    else:
+        batch_size = 2000
+        round_trip_ids = roundtrip_frame.id.values.tolist()
+        frames = [
+            pd.read_sql(create_query(round_trip_ids[i:i + batch_size], engine).statement, engine)
+            for i in range(0, len(round_trip_ids), batch_size)
+        ]
+        aggregated_frame = (
+            pd.concat(frames, ignore_index=True)
+            if frames
+            else pd.DataFrame(columns=["round_trip_id", "hours_effective_driving", "distance"])
+        )
+    aggregated_frame = calculate_km_per_hour(aggregated_frame)
 
-    for batch in batches:
-        query = create_query(batch, engine)
-        frame = pd.read_sql(query.statement, engine)
-        frame = calculate_km_per_hour(frame)
-        aggregated_frame = pd.concat([aggregated_frame, frame], ignore_index=True)
+    return merge_results(roundtrip_frame, aggregated_frame)
 
-    roundtrip_frame = merge_results(roundtrip_frame, aggregated_frame)
 
-    return roundtrip_frame
+def aggregate_segments(roundtrip_frame):
+    """Sums the effective driving hours and the distance of the trip segments of each roundtrip"""
+    segment_counts = roundtrip_frame.trip_segments.map(len).to_numpy()
+    segments = pd.DataFrame(
+        [segment for segments in roundtrip_frame.trip_segments for segment in segments],
+        columns=["start_time", "end_time", "distance"],
+    )
+    segments["round_trip_id"] = np.repeat(roundtrip_frame.id.to_numpy(), segment_counts)
+    segments["hours_effective_driving"] = (
+        pd.to_datetime(segments.end_time) - pd.to_datetime(segments.start_time)
+    ).dt.total_seconds() / 3600
+    return (
+        segments.groupby("round_trip_id", sort=False)[["hours_effective_driving", "distance"]]
+        .sum(min_count=1)
+        .reset_index()
+    )
 
 
 def create_query(batch, engine):
@@ -592,27 +1108,22 @@ def create_query(batch, engine):
 
 
 def calculate_km_per_hour(frame):
-    frame["km/h"] = frame.apply(
-        lambda row: 0 if row["hours_effective_driving"] == 0 else row["distance"] / row["hours_effective_driving"],
-        axis=1
-    )
+    hours = frame["hours_effective_driving"].astype(float)
+    frame["km/h"] = (frame["distance"].astype(float) / hours).where(hours != 0, 0)
     return frame
 
 
 def merge_results(roundtrip_frame, aggregated_frame):
     roundtrip_frame = roundtrip_frame.merge(
-        aggregated_frame, left_on="id", right_on="round_trip_id", how="left"
-    )
-
-    roundtrip_frame["km/h"] = roundtrip_frame.apply(
-        lambda row: row["km/h"] if pd.notna(row["km/h"]) else row.distance_x / ((row["end_time"] - row["start_time"]).total_seconds() / 3600),
-        axis=1
-    )
-
-    roundtrip_frame.drop(
-        ["min_1", "max_1", "distance_y", "hours_effective_driving", "round_trip_id"],
-        axis=1, inplace=True
+        aggregated_frame[["round_trip_id", "km/h"]],
+        left_on="id",
+        right_on="round_trip_id",
+        how="left",
+    ).drop(columns="round_trip_id")
+
+    roundtrip_frame["km/h"] = roundtrip_frame["km/h"].fillna(
+        roundtrip_frame.distance
+        / ((roundtrip_frame.end_time - roundtrip_frame.start_time).dt.total_seconds() / 3600)
     )
-    roundtrip_frame.rename({"distance_x": "distance"}, axis=1, inplace=True)
 
     return roundtrip_frame
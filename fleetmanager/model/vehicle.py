@@ -1,4 +1,6 @@
+import copyreg
 import datetime
+from bisect import bisect_right
 
 import numpy as np
 import pandas as pd
@@ -18,6 +20,54 @@ vehicle_mapping = {
 }
 
 
+class BookedIntervals:
+    """
+    Interval based alternative to the per-minute timeslot array of a vehicle.
+
+    Keeps the booked timeslots of a single vehicle as sorted, disjoint and closed intervals
+    [start_slot, end_slot] in two parallel lists. Memory scales with the number of bookings instead of the length of
+    the simulated period and availability is answered with a binary search in O(log n).
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.tripids = []
+
+    def is_available(self, start_slot, end_slot):
+        """
+        Returns true if no booked interval overlaps [start_slot, end_slot]. Since the intervals are disjoint, the ends
+        are sorted as well, so only the last interval starting at or before end_slot needs to be checked.
+        """
+        k = bisect_right(self.starts, end_slot)
+        return k == 0 or self.ends[k - 1] < start_slot
+
+    def book(self, start_slot, end_slot, tripid=None):
+        """
+        Books [start_slot, end_slot] for the trip. Bookings that bypass the availability check, i.e. the recorded trips
+        of the current fleet, may overlap existing intervals, in which case the overlapping intervals are merged and
+        the merged interval belongs to the latest trip.
+        """
+        lo = bisect_right(self.ends, start_slot - 1)
+        hi = bisect_right(self.starts, end_slot)
+        if lo < hi:
+            start_slot = min(start_slot, self.starts[lo])
+            end_slot = max(end_slot, self.ends[hi - 1])
+        self.starts[lo:hi] = [start_slot]
+        self.ends[lo:hi] = [end_slot]
+        self.tripids[lo:hi] = [tripid]
+
+    def tripid_at(self, slot):
+        """Returns the id of the trip booked in the slot, or None if the slot is free"""
+        k = bisect_right(self.starts, slot)
+        if k == 0 or self.ends[k - 1] < slot:
+            return None
+        return self.tripids[k - 1]
+
+    def __len__(self):
+        return len(self.starts)
+
+
 class VehicleModel:
     """General vehicle model. Not directly instantiated but specific vehicle models inherit from it"""
 
@@ -39,17 +89,21 @@ class VehicleModel:
         self.end_time = datetime.datetime(year=1900, month=1, day=1)
         self.timedelta = datetime.timedelta(minutes=self.sub_time)
 
-    def set_timestamps(self, new_timestamps):
+    def set_timestamps(self, new_timestamps, intervals=False):
         """Initailize timeslot of vehicle to match timestamps.
 
         parameters
         ----------
         new_timestamp : array of timestamps
+        intervals : bool, keep the bookings as BookedIntervals instead of an array with a slot pr. timestamp
         """
         self.timestamps = new_timestamps
 
         # initialise timeslots here
-        self.timeslots = np.zeros((len(self.timestamps),), dtype=int)
+        if intervals:
+            self.timeslots = BookedIntervals()
+        else:
+            self.timeslots = np.zeros((len(self.timestamps),), dtype=int)
         self.days = (
             (
                 self.timestamps[-1].to_timestamp() - self.timestamps[0].to_timestamp()
@@ -93,7 +147,9 @@ class VehicleModel:
 
             # lookup in timeslots list
             try:
-                if any(self.timeslots[start_slot : (end_slot + 1)] > 0):
+                if isinstance(self.timeslots, BookedIntervals):
+                    available = self.timeslots.is_available(start_slot, end_slot)
+                elif any(self.timeslots[start_slot : (end_slot + 1)] > 0):
                     available = False
                 else:
                     available = True
@@ -105,7 +161,7 @@ class VehicleModel:
             # collect and book
             if accept and available:
                 # vehicle accept trip and vehicle available
-                self.timeslots[start_slot : (end_slot + 1)] = trip.tripid
+                self.book_slots(start_slot, end_slot, trip.tripid)
                 return True, accept, available
             else:
                 # vehicle not available or cannot accept trip
@@ -136,9 +192,27 @@ class VehicleModel:
         if use_slot:
             start_slot = int(trip.start_slot)
             end_slot = int(trip.end_slot)
-            self.timeslots[start_slot : (end_slot + 1)] = trip.tripid
+            self.book_slots(start_slot, end_slot, trip.tripid)
         return True, True, True
 
+    def book_slots(self, start_slot, end_slot, tripid):
+        """
+        Mark the timeslots from start_slot to end_slot, both included, as booked by the trip. The timeslot array holds
+        the trip id offset by one, since 0 marks a free slot and the trip ids of the simulations start at 0.
+        """
+        if isinstance(self.timeslots, BookedIntervals):
+            self.timeslots.book(start_slot, end_slot, tripid)
+        else:
+            self.timeslots[start_slot : (end_slot + 1)] = tripid + 1
+
+    def booked_tripid(self, slot):
+        """Returns the id of the trip booked in the timeslot, or None if it is free"""
+        if isinstance(self.timeslots, BookedIntervals):
+            return self.timeslots.tripid_at(slot)
+        if self.timeslots[slot] == 0:
+            return None
+        return self.timeslots[slot] - 1
+
     def accept_trip(self, trip):
         """function that returns true if the given type of trip is possible for the vehicle given length, duration,
         milage_left should be overwritten for each type of vehicle
@@ -511,16 +585,45 @@ class Unassigned(VehicleModel):
         return True
 
 
+class GeneratedVehicleType(type):
+    """Metaclass of the vehicle classes created by VehicleClassGenerator, used to pickle them"""
+
+
 def VehicleClassGenerator(name, vehicle_type=Car):
     """Class used to create vehicle types from a dynamic list of vehicle models"""
 
     def __init__(self):
         vehicle_type.__init__(self, name[: -len("Class")])
 
-    new_vehicle_class = type(name, (vehicle_type,), {"__init__": __init__})
+    new_vehicle_class = GeneratedVehicleType(name, (vehicle_type,), {"__init__": __init__})
     return new_vehicle_class
 
 
+def restore_vehicle_class(name, vehicle_type, attributes):
+    """Recreates a generated vehicle class with the attributes that were pushed to it by the VehicleFactory"""
+    vehicle_class = VehicleClassGenerator(name, vehicle_type)
+    for key, value in attributes.items():
+        setattr(vehicle_class, key, value)
+    return vehicle_class
+
+
+def _reduce_vehicle_class(vehicle_class):
+    # the generated classes can not be looked up by name, so fleets sent to worker processes carry their definition
+    attributes = {
+        key: value
+        for key, value in vars(vehicle_class).items()
+        if not key.startswith("__")
+    }
+    return restore_vehicle_class, (
+        vehicle_class.__name__,
+        vehicle_class.__bases__[0],
+        attributes,
+    )
+
+
+copyreg.pickle(GeneratedVehicleType, _reduce_vehicle_class)
+
+
 class VehicleFactory:
     """Class for containing the vehicle types that are used in the simulation"""
 
@@ -633,6 +736,11 @@ class FleetInventory:
     ----------
     models: available models type model.VehicleFactoryd
     name: string, name of the fleet, typically 'simulation' or 'current'
+
+    attributes
+    ----------
+    vehicle_index: dict, str(vehicle.id) -> first vehicle in the fleet with the id. Used to replay the recorded trips
+        of the current fleet.
     """
 
     def __init__(self, models, name="fleetinventory", settings=None):
@@ -681,6 +789,7 @@ class FleetInventory:
 
         # clear list of vehicles
         self.vehicles = []
+        self.vehicle_index = {}
         sorting = []
         qampo_gr = []
         vcprkm = []
@@ -750,6 +859,8 @@ class FleetInventory:
                 setattr(v, "days", days)
                 setattr(v, "typeid", typeid)
                 self.vehicles.append(v)
+                if getattr(v, "id", None) is not None:
+                    self.vehicle_index.setdefault(str(v.id), v)
 
                 if n + 1 == getattr(self, vehicle_name) and self.name != "current":
                     self.sort_index[vehicle_name] = (start_index, start_index + n + 1)
@@ -786,8 +897,8 @@ class FleetInventory:
             print(f"{str(t):>20}", end="")
 
             for v in self:
-                tripid = v.timeslots[i]
-                if tripid == 0:
+                tripid = v.booked_tripid(i)
+                if tripid is None:
                     tripid = "."
                 print(f"{tripid:>6}", end="")
             print("")
@@ -795,13 +906,13 @@ class FleetInventory:
     def get_total(self):
         return len(self.vehicles)
 
-    def set_timestamps(self, timestamps):
+    def set_timestamps(self, timestamps, intervals=False):
         """set timestamps for all vehicles"""
         self.timestamps = timestamps
 
         # loop over all vehicles and set the timestamps
         for v in self.__iter__():
-            v.set_timestamps(self.timestamps)
+            v.set_timestamps(self.timestamps, intervals=intervals)
 
     def __iter__(self):
         # iterator that first traverses bikes, ebikes, ecars and then cars
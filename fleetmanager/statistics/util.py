@@ -35,7 +35,7 @@ from fleetmanager.data_access import (
 )
 from fleetmanager.logging import logging
 from fleetmanager.model.tco_calculator import TCOCalculator
-from fleetmanager.model.trip_generator import alternate
+from fleetmanager.model.trip_generator import alternate, shift_overlap_seconds
 
 logger = logging.getLogger(__name__)
 
@@ -677,19 +677,9 @@ def daily_driving(
 
     if len(shifts) > 0:
         s = time.time()
-        rt["shift_id"] = rt.apply(
-            lambda row: np.argmax(
-                list(
-                    map(
-                        lambda shift: alternate(
-                            row, ssh=shift["shift_start"], seh=shift["shift_end"]
-                        ),
-                        shifts,
-                    )
-                )
-            ),
-            axis=1,
-        )
+        rt["shift_id"] = shift_overlap_seconds(
+            rt.start_time, rt.end_time, shifts
+        ).argmax(axis=1)
 
     else:
         rt["shift_id"] = 0
@@ -1,4 +1,15 @@
-from fleetmanager.model.roundtripaggregator import aggregator
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from fleetmanager.data_access import Cars, RoundTrips
+from fleetmanager.extractors.util import CarModel, aggregate_roundtrips
+from fleetmanager.model.roundtripaggregator import aggregating_score as score
+from fleetmanager.model.roundtripaggregator import (
+    aggregator,
+    insert_roundtrips,
+    process_car_roundtrips,
+)
 from fleetmanager.tests.fixtures.extractor_data import car, car_trips, start_locations
 
 
@@ -17,3 +28,84 @@ def test_extractor_aggregation():
     assert any(
         ["complete" in roundtrip.get("aggregation_type") for roundtrip in roundtrips]
     )
+
+
+def test_aggregate_roundtrips_pipeline(db_session):
+    """
+    Testing that the aggregation pipeline saves the same roundtrips as aggregating the cars one by one.
+    """
+    session_maker = sessionmaker(bind=db_session.get_bind())
+    cars = [
+        CarModel(car_id, start_locations[0]["id"])
+        for (car_id,) in db_session.query(Cars.id).limit(3)
+    ]
+    expected = [
+        process_car_roundtrips(
+            car, car_trips.copy(), start_locations, aggregator, score, None,
+            is_session_maker=False, save=False,
+        )
+        for car in cars
+    ]
+    saved = []
+
+    def saved_segments(car_id):
+        roundtrips = db_session.query(RoundTrips).filter(RoundTrips.car_id == car_id)
+        return sum(len(roundtrip.trip_segments) for roundtrip in roundtrips)
+
+    segments_before = {car.id: saved_segments(car.id) for car in cars}
+    failing_car = CarModel(-1, start_locations[0]["id"])
+    totals = aggregate_roundtrips(
+        [(car, car_trips.copy()) for car in cars]
+        + [(failing_car, car_trips.drop(columns="start_time"))],
+        start_locations,
+        session_maker,
+        workers=2,
+        write_batch_size=2,
+        on_saved=lambda car, ids: saved.append(car.id),
+    )
+
+    assert totals == tuple(map(sum, zip(*expected))), "Pipeline totals differ"
+    assert sorted(saved) == sorted(
+        car.id for car in cars
+    ), "Only the cars that were aggregated should be reported as saved"
+    db_session.expire_all()
+    for saved_car, (usage_count, *_) in zip(cars, expected):
+        assert (
+            saved_segments(saved_car.id) - segments_before[saved_car.id] == usage_count
+        ), f"Roundtrips of car {saved_car.id} were not saved"
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_insert_roundtrips(db_session, monkeypatch, returning):
+    """
+    Testing that the bulk insert links the segments to their roundtrips, with and without RETURNING.
+    """
+    monkeypatch.setattr(
+        db_session.get_bind().dialect,
+        "insert_executemany_returning_sort_by_parameter_order",
+        returning,
+    )
+    (car_id,) = db_session.query(Cars.id).first()
+    routes = aggregator(
+        car={"id": car_id, "location": start_locations[0]["id"]},
+        car_trips=car_trips,
+        allowed_starts=start_locations,
+    )
+    routes = [
+        {**route, "trip_segments": route["trip_segments"][:segments]}
+        for segments in range(1, 4)
+        for route in routes
+    ]
+    last_id = db_session.query(func.max(RoundTrips.id)).scalar() or 0
+
+    insert_roundtrips(db_session, routes)
+    db_session.commit()
+
+    saved = db_session.query(RoundTrips).filter(RoundTrips.id > last_id).order_by(RoundTrips.id).all()
+    assert [
+        (roundtrip.start_time, roundtrip.distance, len(roundtrip.trip_segments))
+        for roundtrip in saved
+    ] == [
+        (route["start_time"], route["distance"], len(route["trip_segments"]))
+        for route in routes
+    ], "Saved roundtrips or segments differ from the input"
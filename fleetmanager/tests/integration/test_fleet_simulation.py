@@ -1,4 +1,5 @@
 from fleetmanager.fleet_simulation.util import fleet_simulator
+from fleetmanager.model.model import Model
 from fleetmanager.api.fleet_simulation.schemas import FleetSimulationOptions
 from fleetmanager.tests.fixtures.fleet_simulation_requests import simulation_request_naive, simulation_request_intelligent
 
@@ -69,3 +70,31 @@ def test_fleet_simulator_intelligent():
         == 0
     ), "Unallocated trips was above 0"
     assert 1 == 1, f"results {results}"
+
+
+def test_interval_booking_matches_timeslots():
+    """
+    Tests that booking on intervals allocates the trips exactly as booking on the per-minute timeslots
+    """
+    allocations = []
+    for use_timeslots in [True, "intervals"]:
+        m = Model(
+            location=simulation_request_naive["location_id"],
+            dates=[
+                simulation_request_naive["start_date"],
+                simulation_request_naive["end_date"],
+            ],
+        )
+        indices = m.fleet_manager.vehicle_factory.all_vehicles
+        for vehicle_id in simulation_request_naive["current_vehicles"]:
+            converted_id = str(indices[indices.id == vehicle_id].index.values[0])
+            setattr(m.fleet_manager.current_fleet, converted_id, 1)
+            setattr(m.fleet_manager.simulation_fleet, converted_id, 1)
+        m.run_simulation(False, use_timeslots=use_timeslots)
+        allocations.append(
+            [
+                list(m.trips.trips[column].apply(lambda v: v.name))
+                for column in ["current", "simulation"]
+            ]
+        )
+    assert allocations[0] == allocations[1], "Interval booking did not match timeslots"
@@ -1,10 +1,20 @@
+import math
+import random
 from datetime import datetime, timedelta
 
+import pandas as pd
+
 from fleetmanager.model.roundtripaggregator import (
+    CarTripArrays,
+    StartLocationIndex,
+    calc_distance,
+    haversine_distance,
+    locations_frequency,
     split_roundtrip,
     returns_to_home,
     sanitise_for_overlaps,
     get_overlap_mask,
+    stays_within_vicinity,
 )
 from fleetmanager.tests.fixtures.extractor_data import (
     roundtrip,
@@ -52,3 +62,98 @@ def test_sanitation():
     assert len(mask) == 2, f"Mask of cleaned was not expected length 2, but {len(mask)}"
     assert all(mask), f"Cleaned was not properly sanitised"
     assert len(cleaned) == 3, f"Sanitised did not remove the overlapping log"
+
+
+def test_start_location_index():
+    random.seed(42)
+    starts = [
+        {
+            "id": start_id % 20 + 1,
+            "latitude": 55 + random.random(),
+            "longitude": 12 + random.random(),
+        }
+        for start_id in range(50)
+    ]
+    latitudes = [55 + random.random() for _ in range(200)] + [float("nan")]
+    longitudes = [12 + random.random() for _ in range(200)] + [12.5]
+    ids, distances = StartLocationIndex(starts).closest(latitudes, longitudes)
+    for latitude, longitude, start_id, distance in zip(
+        latitudes[:-1], longitudes[:-1], ids, distances
+    ):
+        expected_id, expected_distance = min(
+            (
+                (
+                    start["id"],
+                    calc_distance(
+                        (start["latitude"], start["longitude"]), (latitude, longitude)
+                    ),
+                )
+                for start in starts
+            ),
+            key=lambda x: x[1],
+        )
+        assert start_id == expected_id, f"Wrong closest start for {latitude}, {longitude}"
+        assert math.isclose(distance, expected_distance, rel_tol=1e-9)
+    assert ids[-1] == 0 and math.isnan(
+        distances[-1]
+    ), "Missing coordinates should not have a start"
+
+
+def test_haversine_distance():
+    copenhagen, aarhus = (55.6761, 12.5683), (56.1629, 10.2039)
+    distance = calc_distance(copenhagen, aarhus)
+    assert 155 < distance < 160, f"Copenhagen to Aarhus is not {distance} km"
+    distances = haversine_distance(
+        copenhagen[0],
+        copenhagen[1],
+        [copenhagen[0], aarhus[0], float("nan")],
+        [copenhagen[1], aarhus[1], 10.2],
+    )
+    assert distances[0] == 0 and math.isclose(distances[1], distance)
+    assert math.isnan(distances[2]), "Missing coordinates should give nan"
+
+
+def test_car_trip_arrays_match_frame_functions():
+    random.seed(1)
+    starts = [
+        {"id": start_id, "latitude": 55 + 0.01 * start_id, "longitude": 12.5}
+        for start_id in range(1, 6)
+    ]
+    start_time = datetime(2023, 1, 1)
+    logs = []
+    for log_id in range(300):
+        start_time += timedelta(minutes=random.randint(10, 600))
+        logs.append(
+            {
+                "id": log_id,
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=random.randint(5, 90)),
+                "start_latitude": 55 + random.uniform(0, 0.06),
+                "start_longitude": 12.5 + random.uniform(-0.002, 0.002),
+                "end_latitude": 55 + random.uniform(0, 0.06),
+                "end_longitude": 12.5,
+                "distance": random.uniform(0, 20),
+            }
+        )
+    car_trips = pd.DataFrame(logs)
+    trip_arrays = CarTripArrays(car_trips, starts)
+
+    for log in logs[::25]:
+        duration = timedelta(hours=10)
+        home = (log["start_latitude"], log["start_longitude"])
+        assert trip_arrays.stays_within_vicinity(
+            home, log["start_time"], duration, radius=2
+        ) == stays_within_vicinity(
+            home, car_trips, log["start_time"], duration, radius=2
+        ), "Vicinity ratios differ from the frame version"
+        window = trip_arrays.window(log["start_time"], duration)
+        assert trip_arrays.locations_frequency(window, 0.5) == locations_frequency(
+            car_trips[window].to_dict("records"), starts, 0.5
+        ), "Location frequencies differ from the frame version"
+
+    ids = [log["id"] for log in logs[100:150]]
+    subset = trip_arrays.subset(trip_arrays.trips_with_ids(ids))
+    expected = CarTripArrays(car_trips[car_trips.id.isin(ids)], starts)
+    assert subset.positions == expected.positions
+    assert subset.closest_start_homes == expected.closest_start_homes
+    assert list(subset.start_times) == list(expected.start_times)
@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from fleetmanager.model.genetic import FleetHandler, genetic_handler
+
+
+def _fleet_handler():
+    fleet_handler = SimpleNamespace(
+        lows=[0, 0, 0],
+        ups=[5, 5, 3],
+        trim_scenario=False,
+        attributed_fleet=[
+            {"normalized_cost": 0.2, "normalized_co2e": 0.5, "type": 4},
+            {"normalized_cost": 0.6, "normalized_co2e": 0.1, "type": 3},
+            {"normalized_cost": 0.05, "normalized_co2e": 0.0, "type": 1},
+        ],
+        cost_weight=0.5,
+        co2e_weight=0.5,
+        min_vehicle_counts=3,
+        bike_estimate=1,
+    )
+    fleet_handler.get_batch_evaluator = lambda: FleetHandler.get_batch_evaluator(fleet_handler)
+    return fleet_handler
+
+
+def test_genetic_search_is_reproducible():
+    first = genetic_handler(_fleet_handler())
+    second = genetic_handler(_fleet_handler())
+    assert [list(s) for s in first] == [
+        list(s) for s in second
+    ], "The genetic search gave different solutions"
+    assert list(first[0]) == [3, 0, 0], f"Unexpected best solution {first[0]}"
+
+
+def test_batch_fitness_matches_fitness():
+    fleet_handler = _fleet_handler()
+    evaluate_population = FleetHandler.get_batch_evaluator(fleet_handler)
+    solutions = [[0, 0, 0], [3, 0, 1], [1, 4, 0], [0, 0, 3], [-1, 2, 2], [5, 5, 3]]
+    fitness_values = evaluate_population(np.array(solutions))
+    for solution, fitness_value in zip(solutions, fitness_values):
+        assert np.isclose(
+            fitness_value, FleetHandler.fitness(fleet_handler, solution)[0]
+        ), f"Batched fitness of {solution} differs"
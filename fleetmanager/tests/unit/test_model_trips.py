@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from fleetmanager.data_access import RoundTrips, RoundTripSegments
+from fleetmanager.model import model
+from fleetmanager.model.model import Simulation, Trips, TripStore
+from fleetmanager.model.parallel import create_executor
+
+
+def test_timestamps_to_timeslots():
+    trips = Trips.__new__(Trips)
+    trips.timestamps = pd.period_range(
+        "2023-01-01", "2023-01-02", freq=pd.Timedelta(minutes=1)
+    )
+    timestamps = pd.Series(
+        pd.to_datetime(
+            [
+                "2023-01-01 00:00:00",
+                "2023-01-01 00:00:59",
+                "2023-01-01 10:30:30",
+                "2023-01-02 00:00:00",
+                "2022-12-31 23:59:59",
+                "2023-01-02 00:01:00",
+            ]
+        )
+    )
+    slots = trips._timestamps_to_timeslots(timestamps)
+    assert np.array_equal(
+        slots, [0, 0, 630, 1440, np.nan, np.nan], equal_nan=True
+    ), f"Timestamps were mapped to the wrong timeslots {slots}"
+
+
+def test_load_trips(db_session):
+    trips = Trips.__new__(Trips)
+    trips.engine = db_session.get_bind()
+    loaded = trips.load_trips()
+
+    roundtrips = db_session.query(RoundTrips).all()
+    assert sorted(loaded.id) == sorted(
+        roundtrip.id for roundtrip in roundtrips
+    ), "Every roundtrip should be loaded once"
+    assert loaded.start_time.is_monotonic_increasing
+    segments = {}
+    for segment in db_session.query(RoundTripSegments).order_by(RoundTripSegments.id):
+        segments.setdefault(segment.round_trip_id, []).append(
+            {
+                "start_time": segment.start_time,
+                "end_time": segment.end_time,
+                "distance": segment.distance,
+            }
+        )
+    for roundtrip in loaded.itertuples():
+        assert roundtrip.trip_segments == segments.get(
+            roundtrip.id, []
+        ), f"Wrong segments on roundtrip {roundtrip.id}"
+
+
+def test_trip_store_views():
+    trips = pd.DataFrame(
+        {
+            "start_time": pd.to_datetime(["2023-01-01 08:00", "2023-01-01 09:30"]),
+            "end_time": pd.to_datetime(["2023-01-01 09:00", "2023-01-01 10:00"]),
+            "distance": [12.5, 3.0],
+            "km/h": [12.5, 6.0],
+            "tripid": [1, 2],
+            "car_id": ["3", None],
+        }
+    )
+    store = TripStore(trips)
+    views = list(store)
+    assert len(views) == 2, f"Expected 2 trip views, got {len(views)}"
+    assert views[0].distance == 12.5 and views[1]["km/h"] == 6.0
+    assert views[1].start_time - views[0].end_time == pd.Timedelta(minutes=30)
+    assert not hasattr(views[0], "trip_segments"), "Trips without segments exposed segments"
+    # the peak day trips of the driving test carry neither trip ids nor timeslots
+    peak_day = TripStore(trips.drop(columns=["tripid", "km/h"]))
+    assert [view.tripid for view in peak_day] == [None, None]
+    assert np.isnan(peak_day.views[0].kmh), "Missing km/h should be nan"
+
+
+def _optimise_days(monkeypatch, executor, cache=None, solved_days=None):
+    trips_pr_day = []
+    for day in range(6):
+        start = pd.Timestamp("2023-01-02 08:00") + pd.Timedelta(days=day)
+        trips = [
+            {
+                "tripid": 10 * day + k,
+                "start_time": start + pd.Timedelta(hours=k),
+                "end_time": start + pd.Timedelta(hours=k, minutes=30),
+                "distance": 10.0,
+                "multiday": False,
+            }
+            for k in range(2)
+        ]
+        if day in [0, 3]:
+            # a trip lasting until the day after tomorrow
+            trips[0]["multiday"] = True
+            trips[0]["original_start_time"] = trips[0]["start_time"]
+            trips[0]["original_end_time"] = start + pd.Timedelta(days=2)
+        trips_pr_day.append(trips)
+
+    skipped = {}
+
+    def optimize_single_day(fleet, trips, algorithm_type):
+        if solved_days is not None:
+            solved_days.append(trips[0].id // 10)
+        return SimpleNamespace(
+            assignments=[
+                SimpleNamespace(
+                    vehicle=SimpleNamespace(id=trip.id % 3),
+                    route=SimpleNamespace(trips=[trip]),
+                )
+                for trip in trips
+            ]
+        )
+
+    simulation = Simulation.__new__(Simulation)
+    generate_qampo_data = simulation.generate_qampo_data
+
+    def spy(fleet_inventory, trips, skip_vehicles=None):
+        skipped[trips[0]["tripid"] // 10] = skip_vehicles
+        return generate_qampo_data(fleet_inventory, trips, skip_vehicles)
+
+    simulation.generate_qampo_data = spy
+    monkeypatch.setattr(
+        model.qampo_simulation, "optimize_single_day", optimize_single_day
+    )
+    simulation.executor = executor
+    if cache is not None:
+        monkeypatch.setattr(model, "get_cached_route_plan", cache.get)
+        monkeypatch.setattr(model, "set_cached_route_plan", cache.__setitem__)
+    response = simulation.optimise_days([], trips_pr_day)
+    assert len(response) == len(trips_pr_day)
+    return skipped
+
+
+def test_optimise_days_waits_for_multiday_trips(monkeypatch):
+    serial = _optimise_days(monkeypatch, None)
+    assert serial == {0: [], 1: [0], 2: [0], 3: [], 4: [0], 5: [0]}, serial
+    concurrent = _optimise_days(monkeypatch, ThreadPoolExecutor(max_workers=3))
+    assert concurrent == serial, "Concurrently solved days left out other vehicles"
+
+
+def test_optimise_days_reuses_cached_route_plans(monkeypatch):
+    cache, solved_days = {}, []
+    first = _optimise_days(monkeypatch, None, cache, solved_days)
+    assert len(cache) == 6 and len(solved_days) == 6, "Every day should be solved once"
+    repeated = _optimise_days(
+        monkeypatch, ThreadPoolExecutor(max_workers=3), cache, solved_days
+    )
+    assert len(solved_days) == 6, "Cached days were solved again"
+    assert repeated == first, "Cached days left out other vehicles"
+
+
+def test_no_executor_in_workers():
+    executor = create_executor(2, kind="thread")
+    assert executor is not None, "Expected an executor with 2 workers"
+    with executor:
+        nested = executor.submit(create_executor, 2, kind="thread").result()
+    assert nested is None, "Workers should run nested simulation work serially"
+
+
+def test_unavailable_route_plan_cache_is_not_retried(monkeypatch):
+    from redis.exceptions import ConnectionError
+
+    from fleetmanager.model import route_plan_cache
+
+    class DownRedis:
+        connections = 0
+
+        @classmethod
+        def from_url(cls, url, **kwargs):
+            cls.connections += 1
+            return cls()
+
+        def ping(self):
+            raise ConnectionError("Connection refused")
+
+    monkeypatch.setenv("CELERY_BACKEND_URL", "redis://localhost:1")
+    monkeypatch.setattr(route_plan_cache, "Redis", DownRedis)
+    monkeypatch.setattr(route_plan_cache, "_client", None)
+    monkeypatch.setattr(route_plan_cache, "_unavailable_until", 0.0)
+    for day in range(3):
+        assert route_plan_cache.get_cached_route_plan(f"day{day}") is None
+        route_plan_cache.set_cached_route_plan(f"day{day}", None)
+    assert DownRedis.connections == 1, "An unavailable redis should be tried once"
+
+
+def test_malformed_route_plan_cache_url_is_a_miss(monkeypatch):
+    from fleetmanager.model import route_plan_cache
+
+    monkeypatch.setenv("CELERY_BACKEND_URL", "not-a-redis-url")
+    monkeypatch.setattr(route_plan_cache, "_client", None)
+    monkeypatch.setattr(route_plan_cache, "_unavailable_until", 0.0)
+    assert route_plan_cache.get_cached_route_plan("day") is None
+    route_plan_cache.set_cached_route_plan("day", None)
@@ -0,0 +1,123 @@
+import datetime
+import math
+import random
+from itertools import combinations
+
+from fleetmanager.model.qampo.classes import (
+    AlgorithmParameters,
+    AlgorithmType,
+    BaseVehicle,
+    Fleet,
+    Trip,
+    Vehicle,
+)
+from fleetmanager.model.qampo.cost_calculator import (
+    calculate_weighted_cost_of_route_plan,
+)
+from fleetmanager.model.qampo.helper_functions import (
+    find_overlapping_trip_groups,
+    vehicle_ids_from_route_plan,
+)
+from fleetmanager.model.qampo.qampo_simulation import optimize_single_day
+
+
+def overlaps(first_trip, second_trip):
+    return max(first_trip.start_time, second_trip.start_time) < min(
+        first_trip.end_time, second_trip.end_time
+    )
+
+
+def test_overlapping_trip_groups_match_pairwise_overlaps():
+    random.seed(42)
+    day = datetime.datetime(2023, 1, 2)
+    trips = []
+    for trip_id in range(150):
+        start = random.randint(0, 1380)
+        trips.append(
+            Trip(
+                id=trip_id,
+                start_time=day + datetime.timedelta(minutes=start),
+                # whole hours give trips that start when others end
+                end_time=day
+                + datetime.timedelta(minutes=start + random.choice([0, 15, 60, 120])),
+                length_in_kilometers=10,
+            )
+        )
+
+    groups = find_overlapping_trip_groups(trips)
+    grouped_pairs = set()
+    for group in groups:
+        for first_trip, second_trip in combinations(group, 2):
+            assert overlaps(
+                first_trip, second_trip
+            ), f"Trips {first_trip.id} and {second_trip.id} do not overlap"
+            grouped_pairs.add(frozenset((first_trip.id, second_trip.id)))
+
+    overlapping_pairs = {
+        frozenset((first_trip.id, second_trip.id))
+        for first_trip, second_trip in combinations(trips, 2)
+        if overlaps(first_trip, second_trip)
+    }
+    assert (
+        grouped_pairs == overlapping_pairs
+    ), "The groups do not cover exactly the overlapping trips"
+    assert len(groups) < len(
+        overlapping_pairs
+    ), "Expected fewer groups than overlapping pairs"
+
+
+def test_warm_started_routing_matches_cold_start():
+    random.seed(7)
+    day = datetime.datetime(2023, 1, 2)
+    trips = []
+    for trip_id in range(25):
+        start = random.randint(360, 1080)
+        trips.append(
+            Trip(
+                id=trip_id,
+                start_time=day + datetime.timedelta(minutes=start),
+                end_time=day
+                + datetime.timedelta(minutes=start + random.randint(10, 180)),
+                length_in_kilometers=random.uniform(2, 80),
+            )
+        )
+    fleet = Fleet(
+        vehicles=[
+            Vehicle(
+                id=vehicle_id,
+                range_in_kilometers=range_in_kilometers,
+                maximum_driving_in_minutes=960,
+                variable_cost_per_kilometer=cost,
+                co2_emission_gram_per_kilometer=co2,
+            )
+            for vehicle_id, (range_in_kilometers, cost, co2) in enumerate(
+                [(150, 0.5, 0), (300, 1.5, 120), (1000, 2.0, 180)]
+            )
+        ],
+        employee_car=BaseVehicle(
+            variable_cost_per_kilometer=4, co2_emission_gram_per_kilometer=150
+        ),
+        emission_cost_per_ton_co2=1500,
+    )
+
+    greedy_plan = optimize_single_day(fleet, trips, AlgorithmType.GREEDY)
+    vehicle_ids = vehicle_ids_from_route_plan(greedy_plan)
+    assert set(vehicle_ids) == set(trips), "Every trip should be mapped to a vehicle"
+
+    for algorithm_type in (AlgorithmType.EXACT_MIP, AlgorithmType.EXACT_CP):
+        cold = optimize_single_day(fleet, trips, algorithm_type)
+        warm = optimize_single_day(
+            fleet,
+            trips,
+            algorithm_type,
+            AlgorithmParameters(time_limit_in_seconds=60, warm_start=True),
+        )
+        assert math.isclose(
+            calculate_weighted_cost_of_route_plan(cold, 1500),
+            calculate_weighted_cost_of_route_plan(warm, 1500),
+        ), f"Warm start changed the optimal objective of {algorithm_type.value}"
+        assert calculate_weighted_cost_of_route_plan(
+            warm, 1500
+        ) <= calculate_weighted_cost_of_route_plan(
+            greedy_plan, 1500
+        ), "The exact solution should not be worse than the greedy one"
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+
+from fleetmanager.model.tabu import TabuSearch
+
+
+def _tabu_search(fixed, norm_objectives, car_index):
+    tabu_search = TabuSearch.__new__(TabuSearch)
+    tabu_search.fixed = fixed
+    tabu_search.car_index = car_index
+    tabu_search.minimum_cars = 1
+    tabu_search.id2vehicle = {k: str(k) for k in range(len(fixed))}
+    tabu_search.vehicle_properties = {
+        str(k): {"norm_obj": objective} for k, objective in enumerate(norm_objectives)
+    }
+    tabu_search.norm_objectives = np.array(norm_objectives)
+    return tabu_search
+
+
+def test_tabu_search_objective_values_are_incremental():
+    tabu_search = _tabu_search(
+        [2, 0, 1, 0, 3, 0], [1.25, 0.5, 2.0, 0.75, 0.25, 0.0], car_index=3
+    )
+    for min_cars in [1, 2, 3]:
+        saved_solutions = tabu_search.tabu_search(min_cars)
+        assert len(saved_solutions) > 0, f"No solutions with {min_cars} cars"
+        for solution, objective in saved_solutions.items():
+            if objective == math.inf:
+                assert list(solution) == tabu_search.fixed, "Only the start solution is saved without objective"
+                continue
+            assert objective == tabu_search.objective_value(
+                list(solution)
+            ), f"Objective value of {solution} was not updated correctly by the moves"
+            assert sum(solution[:4]) >= min_cars
+
+
+def test_get_nabo_applies_moves():
+    tabu_search = _tabu_search([1, 2, 0, 0], [1.0, 2.0, 3.0, 0.0], car_index=1)
+    for allow_removal in [True, False]:
+        moves = list(tabu_search.get_moves([1, 1, 0, 0], allow_removal=allow_removal))
+        neighbours = list(tabu_search.get_nabo([1, 1, 0, 0], allow_removal=allow_removal))
+        assert moves == [move for move, _ in neighbours]
+        for (k, mov), neighbour in neighbours:
+            assert neighbour[k] == [1, 1, 0, 0][k] + mov
@@ -0,0 +1,217 @@
+import random
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from fleetmanager.data_access import RoundTrips, RoundTripSegments
+from fleetmanager.data_access.seeding import cars_by_location
+from fleetmanager.model.trip_generator import (
+    alternate,
+    extract_peak_day,
+    generate_synthetic_trips,
+    get_kilometer_per_hour,
+    shift_overlap_seconds,
+    shiftify,
+)
+
+shifts = [
+    {"shift_start": time(8), "shift_end": time(18), "break": None},
+    {"shift_start": time(18), "shift_end": time(0), "break": None},
+    {"shift_start": time(0), "shift_end": time(8), "break": time(4)},
+]
+
+
+def test_shift_overlap_seconds_matches_alternate():
+    random.seed(3)
+    trips = []
+    for _ in range(500):
+        start_time = datetime(2023, 3, 1) + timedelta(minutes=random.randint(0, 4 * 1440))
+        trips.append(
+            {
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=random.randint(0, 2000)),
+            }
+        )
+    trips = pd.DataFrame(trips)
+    overnight_shifts = shifts + [
+        {"shift_start": time(22), "shift_end": time(6), "break": None}
+    ]
+
+    overlaps = shift_overlap_seconds(trips.start_time, trips.end_time, overnight_shifts)
+
+    expected = [
+        [alternate(trip, ssh=shift["shift_start"], seh=shift["shift_end"]) for shift in overnight_shifts]
+        for trip in trips.itertuples()
+    ]
+    assert np.array_equal(overlaps, expected), "Overlaps differ from alternate"
+
+
+def test_shiftify():
+    day = datetime(2023, 3, 1)
+    trips = pd.DataFrame(
+        [
+            {
+                "id": trip_id,
+                "start_time": day + start,
+                "end_time": day + end,
+                "car_id": 1,
+                "distance": 10,
+                "start_latitude": 55.7,
+                "start_longitude": 12.5,
+                "end_latitude": 55.7,
+                "end_longitude": 12.5,
+                "start_location_id": 1,
+            }
+            for trip_id, (start, end) in enumerate(
+                [
+                    (timedelta(hours=9), timedelta(hours=10)),
+                    (timedelta(hours=11), timedelta(hours=12)),
+                    (timedelta(hours=19), timedelta(hours=20)),
+                    (timedelta(hours=26), timedelta(hours=27)),
+                    (timedelta(hours=27, minutes=30), timedelta(hours=28, minutes=10)),
+                    (timedelta(hours=29), timedelta(hours=30)),
+                    (timedelta(days=1, hours=9), timedelta(days=1, hours=10)),
+                ]
+            )
+        ]
+    )
+
+    shift_trips = shiftify(trips, shifts)
+
+    assert shift_trips.id.tolist() == [0, 2, 3, 5, 6], "Wrong trips were aggregated"
+    assert shift_trips.length.tolist() == [2, 1, 2, 1, 1]
+    assert shift_trips.belongs_tos.tolist() == ["0", "1", "2", "2", "0"]
+    assert shift_trips.distance.tolist() == [20, 10, 20, 10, 10]
+
+
+def test_get_kilometer_per_hour_from_segments():
+    day = datetime(2023, 3, 1)
+    trips = pd.DataFrame(
+        [
+            {
+                "id": 1,
+                "start_time": day,
+                "end_time": day + timedelta(hours=4),
+                "distance": 30,
+                "trip_segments": [
+                    {"start_time": day, "end_time": day + timedelta(minutes=30), "distance": 10},
+                    {"start_time": day + timedelta(hours=3), "end_time": day + timedelta(hours=4), "distance": 20},
+                ],
+            },
+            {
+                "id": 2,
+                "start_time": day,
+                "end_time": day + timedelta(hours=2),
+                "distance": 30,
+                "trip_segments": [],
+            },
+            {
+                "id": 3,
+                "start_time": day,
+                "end_time": day + timedelta(hours=2),
+                "distance": 0,
+                "trip_segments": [{"start_time": day, "end_time": day, "distance": 0}],
+            },
+        ]
+    )
+
+    trips = get_kilometer_per_hour(trips, engine=None)
+
+    assert trips["km/h"].tolist() == [20, 15, 0], "Effective driving km/h is wrong"
+
+
+def test_extract_peak_day():
+    day = datetime(2023, 3, 1)
+    trips = pd.DataFrame(
+        [
+            {
+                "start_time": day + timedelta(hours=8),
+                "end_time": day + timedelta(hours=9),
+                "distance": 40,
+                "trip_segments": [],
+            },
+            {
+                # the segment across midnight counts half on each day
+                "start_time": day + timedelta(hours=22),
+                "end_time": day + timedelta(days=1, hours=4),
+                "distance": 150,
+                "trip_segments": [
+                    {"start_time": day + timedelta(hours=22), "end_time": day + timedelta(hours=23), "distance": 50},
+                    {
+                        "start_time": day + timedelta(hours=23),
+                        "end_time": day + timedelta(days=1, hours=3),
+                        "distance": 40,
+                    },
+                    {
+                        "start_time": day + timedelta(days=1, hours=3),
+                        "end_time": day + timedelta(days=1, hours=4),
+                        "distance": 60,
+                    },
+                ],
+            },
+            {
+                "start_time": day + timedelta(days=1, hours=10),
+                "end_time": day + timedelta(days=1, hours=11),
+                "distance": 40,
+                "trip_segments": [],
+            },
+        ]
+    )
+
+    peak_day = extract_peak_day(trips)
+
+    peak_start = day + timedelta(days=1)
+    assert peak_day.start_time.tolist() == [peak_start, peak_start + timedelta(hours=10)]
+    assert peak_day.end_time.tolist() == [peak_start + timedelta(hours=4), peak_start + timedelta(hours=11)]
+    assert peak_day.distance.tolist() == [90, 40], "Distance before midnight was not clipped"
+    assert peak_day.trip_segments[0] == [
+        {"start_time": peak_start, "end_time": peak_start + timedelta(hours=3), "distance": 30},
+        {"start_time": peak_start + timedelta(hours=3), "end_time": peak_start + timedelta(hours=4), "distance": 60},
+    ]
+    assert peak_day.trip_segments[1] == []
+
+
+def test_generate_synthetic_trips(db_session):
+    engine = db_session.get_bind()
+    data = pd.read_sql(
+        select(RoundTrips.start_time, RoundTrips.end_time, RoundTrips.distance), engine
+    )
+    cars = cars_by_location(engine)
+
+    trips = generate_synthetic_trips(data, cars, days=3, trips_per_day=10, seed=4)
+    assert len(trips) == 3 * len(cars) * 10
+    assert np.array_equal(
+        trips.start_time,
+        generate_synthetic_trips(data, cars, days=3, trips_per_day=10, seed=4).start_time,
+    ), "The same seed should generate the same trips"
+    frame = trips.to_frame()
+    assert all(
+        car_id in cars[location]
+        for car_id, location in zip(frame.car_id, frame.start_location_id)
+    ), "Trips were assigned to cars of another location"
+    free_at = {1: pd.Timestamp.min, 2: pd.Timestamp.min}
+    busy = generate_synthetic_trips(data, {1: [1, 2]}, days=3, trips_per_day=8, seed=4)
+    for trip in busy.to_frame().itertuples():
+        assert (
+            free_at[trip.car_id] <= trip.start_time
+            or min(free_at.values()) > trip.start_time
+        ), "A trip was given to a busy car while another car was free"
+        free_at[trip.car_id] = max(free_at[trip.car_id], trip.end_time)
+    assert np.allclose(
+        [sum(segment["distance"] for segment in segments) for segments in frame.trip_segments],
+        frame.distance,
+    ), "The segments do not add up to the roundtrip distance"
+    assert all(
+        segments[0]["start_time"] == start_time and segments[-1]["end_time"] == end_time
+        for segments, start_time, end_time in zip(frame.trip_segments, frame.start_time, frame.end_time)
+    ), "The segments do not span the roundtrip"
+
+    roundtrip_count = db_session.scalar(select(func.count(RoundTrips.id)))
+    segment_count = db_session.scalar(select(func.count(RoundTripSegments.id)))
+    generate_synthetic_trips(data, cars, days=3, trips_per_day=10, seed=4, engine=engine)
+    assert db_session.scalar(select(func.count(RoundTrips.id))) == roundtrip_count + len(trips)
+    assert db_session.scalar(select(func.count(RoundTripSegments.id))) == segment_count + len(
+        trips.segment_distance
+    )
@@ -0,0 +1,56 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from fleetmanager.model.vehicle import BookedIntervals, VehicleModel
+
+
+def test_booked_intervals_matches_timeslots():
+    random.seed(42)
+    timeslots = np.zeros((2000,), dtype=int)
+    intervals = BookedIntervals()
+    for tripid in range(1, 500):
+        start_slot = random.randint(0, 1950)
+        end_slot = start_slot + random.randint(0, 45)
+        available = not any(timeslots[start_slot : (end_slot + 1)] > 0)
+        assert (
+            intervals.is_available(start_slot, end_slot) == available
+        ), f"Availability of [{start_slot}, {end_slot}] did not match the timeslot array"
+        if available:
+            timeslots[start_slot : (end_slot + 1)] = tripid
+            intervals.book(start_slot, end_slot)
+
+
+def test_booked_intervals_merges_overlapping_bookings():
+    intervals = BookedIntervals()
+    intervals.book(10, 20)
+    intervals.book(30, 40)
+    intervals.book(50, 60)
+    # bypassed bookings of the current fleet may overlap
+    intervals.book(15, 35)
+    assert intervals.starts == [10, 50], f"Unexpected starts {intervals.starts}"
+    assert intervals.ends == [40, 60], f"Unexpected ends {intervals.ends}"
+    assert intervals.is_available(41, 49)
+    assert not intervals.is_available(36, 45)
+
+
+def test_trip_zero_books_in_both_modes():
+    timestamps = pd.period_range("2023-01-01", "2023-01-02", freq=pd.Timedelta(minutes=1))
+    trips = [
+        SimpleNamespace(tripid=tripid, start_slot=start_slot, end_slot=end_slot)
+        for tripid, (start_slot, end_slot) in enumerate([(10, 20), (15, 25), (21, 30)])
+    ]
+    for intervals in [False, True]:
+        vehicle = VehicleModel(name="test")
+        vehicle.set_timestamps(timestamps, intervals=intervals)
+        booked = [vehicle.book_trip(trip)[0] for trip in trips]
+        assert booked == [True, False, True], f"Trip 0 was not booked, intervals={intervals}"
+        assert [vehicle.booked_tripid(slot) for slot in [9, 10, 20, 21, 31]] == [
+            None,
+            0,
+            0,
+            2,
+            None,
+        ], f"Wrong trips in the timeslots, intervals={intervals}"
@@ -0,0 +1,37 @@
+import pickle
+
+from fleetmanager.model.vehicle import ElectricCar, VehicleFactory
+
+
+def test_generated_vehicles_can_be_pickled():
+    vehicle_factory = VehicleFactory(
+        load_self=False,
+        unique_vehicles=[
+            {
+                "id": "0",
+                "make": "VW",
+                "model": "e-Golf",
+                "wltp_fossil": None,
+                "wltp_el": 0.15,
+                "range": 230,
+                "type": "elbil",
+                "type_id": 3,
+                "fuel": "el",
+                "fuel_id": 3,
+                "omkostning_aar": 25000,
+                "sleep": 7,
+                "co2_pr_km": 0,
+                "km_aar": 20000,
+                "capacity_decrease": 20,
+            }
+        ],
+    )
+    vehicle = vehicle_factory.get_new_vehicle("0", "VW e-Golf", 1)
+    vehicle.current_km = 12.5
+    restored_factory, restored_vehicle = pickle.loads(
+        pickle.dumps((vehicle_factory, vehicle))
+    )
+    assert isinstance(restored_vehicle, ElectricCar), "The vehicle type was lost"
+    assert type(restored_vehicle) is restored_factory.vmapper["0"], "The vehicle class was not shared"
+    assert restored_vehicle.range == 230 and restored_vehicle.current_km == 12.5
+    assert restored_vehicle.name == vehicle.name